@@ -1,61 +1,52 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template_string, session, redirect, url_for
+from flask import Flask, request, jsonify, send_from_directory, send_file, render_template_string, session, redirect, url_for, abort
 import os
 import json
 import gzip
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from werkzeug.utils import safe_join, secure_filename
 from flask_socketio import SocketIO, emit
+from src.common import (analysis_queue, catch_stats, db, event_bus, image_store, log_store, migrations, queries,
+                        uploads, visual_results)
+from src.common.annotated_images import FileCache, render as render_annotated
+from src.common.derivatives import DerivativeStore
+from src.common.device_registry import DeviceRegistry, TTLCache
+from src.common.pagination import decode_cursor, page_result
+from src.common.result_cache import file_sha256
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
 
 # 配置
 app.config['UPLOAD_FOLDER'] = '/data/images/'
+# 上传临时文件目录，须与 UPLOAD_FOLDER 在同一文件系统（上传完成后原子改名）
+app.config['UPLOAD_TMP_FOLDER'] = '/data/images/.incoming/'
+app.config['UPLOAD_MAX_BYTES'] = 50 * 1024 * 1024  # 单张图片上限 50MB
+# 请求体上限：图片上限加上 multipart 表单的边界和字段开销。/upload/image 的表单由 Werkzeug 先解析到临时文件，
+# 超过该值的请求在解析前直接返回 413，不会先把整个请求体缓存下来
+app.config['MAX_CONTENT_LENGTH'] = app.config['UPLOAD_MAX_BYTES'] + 1024 * 1024
+app.config['UPLOAD_SESSION_MAX_AGE'] = 86400  # 可续传上传超过该时间没有新数据则删除（秒）
 app.config['LOGS_FOLDER'] = '/data/logs/'
+app.config['ANNOTATED_FOLDER'] = '/data/annotated/'  # 识别结果标注图缓存
+app.config['ANNOTATED_CACHE_MAX_BYTES'] = 512 * 1024 * 1024  # 标注图缓存上限 512MB
+app.config['DERIVATIVES_FOLDER'] = '/data/derivatives/'  # 缩略图和预览图
+app.config['DERIVATIVE_WORKERS'] = 2  # 上传后生成缩略图的后台线程数
 app.config['STATIC_FOLDER'] = 'static'
 app.config['DB_PATH'] = './iot.db'
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1小时
+# /push_sensor_data 是否同时入库；MQTT服务通过本地事件总线推送，关闭后该接口只做推送
+app.config['PUSH_SENSOR_DATA_PERSIST'] = True
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['UPLOAD_TMP_FOLDER'], exist_ok=True)
 os.makedirs(app.config['LOGS_FOLDER'], exist_ok=True)
 os.makedirs(app.config['STATIC_FOLDER'], exist_ok=True)
 
-# 创建数据库表
-conn = sqlite3.connect(app.config['DB_PATH'])
-cursor = conn.cursor()
-
-# 创建用户表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT NOT NULL UNIQUE,
-    password TEXT NOT NULL,
-    role TEXT NOT NULL DEFAULT 'device',
-    device_id TEXT,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-)
-''')
+# 创建/升级数据库表结构
+migrations.migrate(app.config['DB_PATH'])
 
-# 创建设备表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS devices (
-    device_id TEXT PRIMARY KEY,
-    name TEXT NOT NULL,
-    status TEXT DEFAULT 'active',
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-)
-''')
-
-# 创建图片表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS images (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    device_id TEXT NOT NULL,
-    image_path TEXT NOT NULL,
-    original_filename TEXT NOT NULL,
-    receive_time TEXT DEFAULT CURRENT_TIMESTAMP
-)
-''')
+conn = db.connect(app.config['DB_PATH'])
+cursor = conn.cursor()
 
 # 插入管理员账号
 cursor.execute("SELECT * FROM users WHERE username='admin'")
@@ -65,6 +56,9 @@ if not cursor.fetchone():
 conn.commit()
 conn.close()
 
+# 导入旧版按天写入的日志文件（已导入的文件会跳过）
+log_store.import_files(app.config['DB_PATH'], app.config['LOGS_FOLDER'])
+
 # 初始化SocketIO
 socketio = SocketIO(app)
 
@@ -108,7 +102,7 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
         # 检查用户是否存在
@@ -281,95 +275,82 @@ def logout():
     session.pop('device_id', None)
     return redirect(url_for('login'))
 
-# 用于存储设备注册时间，防止频繁注册
-registration_times = {}
-
-# 用于缓存已注册的设备ID，减少数据库查询
-registered_devices = set()
-
-# 设备ID格式正则表达式（允许字母、数字、下划线和连字符，长度3-20）
-import re
-DEVICE_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{3,20}$')
+# 设备注册服务（带已注册/无效设备ID缓存，减少数据库查询）
+device_registry = DeviceRegistry(app.config['DB_PATH'])
 
 def auto_register_device(device_id):
     """自动注册设备的通用函数"""
-    import time
-    
-    # 1. 设备ID格式验证
-    if not DEVICE_ID_PATTERN.match(device_id):
-        print(f"❌ [自动注册] 设备ID格式无效: {device_id}")
-        return False
-    
-    # 2. 检查缓存，减少数据库查询
-    if device_id in registered_devices:
-        print(f"ℹ️  [自动注册] 设备已在缓存中: {device_id}")
-        return True
-    
-    # 3. 限制注册频率（同一设备ID，60秒内只能注册一次）
-    current_time = time.time()
-    if device_id in registration_times:
-        if current_time - registration_times[device_id] < 60:
-            print(f"❌ [自动注册] 注册频率过高，请稍后再试: {device_id}")
-            return False
-    registration_times[device_id] = current_time
+    return device_registry.ensure_registered(device_id)
+
+def store_upload(device_id, original_filename, write):
+    """
+    占用上传图片的存储键（<设备ID>/<年>/<月>/<日>/<文件名>，见 image_store.py）并调用 write(路径) 写入，
+    返回 (存储键, 路径, 字节数, SHA-256)。存储键用 O_EXCL 原子占用，同名文件已存在时加随机后缀，
+    不覆盖已保存的图片，同一 URL 的内容不会变化（浏览器可长期缓存）；写入失败时删除占用的文件和空目录
+    """
+    filename = secure_filename(f"{device_id}_{original_filename}")
+    key, filepath = image_store.reserve(app.config['UPLOAD_FOLDER'],
+                                        image_store.shard_key(device_id, filename, datetime.now()))
+    try:
+        size, sha256 = write(filepath)
+    except BaseException:
+        image_store.release(app.config['UPLOAD_FOLDER'], filepath)
+        raise
+    return key, filepath, size, sha256
+
+# 缩略图和预览图：上传后在后台线程池生成，旧图片第一次请求时生成（见 derivatives.py）
+derivative_store = DerivativeStore(app.config['DERIVATIVES_FOLDER'])
+derivative_pool = ThreadPoolExecutor(max_workers=app.config['DERIVATIVE_WORKERS'], thread_name_prefix='derivatives')
+
+def save_uploaded_image(device_id, filename, filepath, original_filename, size, sha256):
+    """图片文件已就位：写入数据库并加入分析队列，推送到前端，返回响应"""
+    # 将图片信息保存到数据库，并在同一事务中加入分析队列（由 analysis_dispatcher 提交视觉服务）
+    with db.transaction(app.config['DB_PATH']) as conn:
+        cursor = conn.execute("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time, "
+                              "size, sha256) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (device_id, filepath, filename, original_filename, datetime.now().isoformat(),
+                               size, sha256))
+        image_id = cursor.lastrowid
+        analysis_queue.enqueue(conn, image_id, filepath)
+    derivative_pool.submit(derivative_store.generate_all, filepath, filename)
     
-    conn = None
-    cursor = None
+    # 推送图片上传信息到前端
+    image_data = {
+        'device_id': device_id,
+        'filename': filename,
+        'path': filepath,
+        'timestamp': datetime.now().isoformat(),
+        'size': size,
+        'original_filename': original_filename
+    }
+    push_data_to_frontend('new_image', image_data)
     
-    try:
-        conn = sqlite3.connect(app.config['DB_PATH'])
-        cursor = conn.cursor()
-        
-        # 4. 检查设备是否已存在于用户表
-        cursor.execute("SELECT * FROM users WHERE username=?", (device_id,))
-        user_exists = cursor.fetchone() is not None
-        
-        if not user_exists:
-            # 注册设备用户
-            cursor.execute("INSERT INTO users (username, password, role, device_id) VALUES (?, ?, ?, ?)", 
-                          (device_id, '123456', 'device', device_id))
-            print(f"🔧 [自动注册] 成功注册设备用户: {device_id}")
-        
-        # 5. 检查设备是否已存在于设备表
-        cursor.execute("SELECT * FROM devices WHERE device_id=?", (device_id,))
-        device_exists = cursor.fetchone() is not None
-        
-        if not device_exists:
-            # 创建设备记录
-            cursor.execute("INSERT INTO devices (device_id, name) VALUES (?, ?)", 
-                          (device_id, f'设备{device_id}'))
-            print(f"🔧 [自动注册] 成功创建设备记录: {device_id}")
-        
-        # 6. 提交事务
-        conn.commit()
-        
-        # 7. 更新缓存
-        registered_devices.add(device_id)
-        
-        print(f"✅ [自动注册] 设备注册成功: {device_id}")
-        return True
-    except sqlite3.IntegrityError as e:
-        print(f"❌ [自动注册] 设备注册冲突: {device_id}, 错误: {e}")
-        if conn:
-            conn.rollback()
-        # 即使发生冲突，也将设备ID添加到缓存（因为设备可能已经存在）
-        registered_devices.add(device_id)
-        return True
-    except Exception as e:
-        print(f"❌ [自动注册] 设备注册失败: {device_id}, 错误: {type(e).__name__}: {e}")
-        if conn:
-            conn.rollback()
-        return False
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    return jsonify({
+        'code': 200,
+        'msg': 'Upload success',
+        'image_id': image_id,
+        'path': filepath,
+        'filename': filename,
+        'size': size,
+        'sha256': sha256
+    })
+
+def upload_error(e):
+    return jsonify({'code': e.status, 'msg': str(e)}), e.status
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """请求体超过 MAX_CONTENT_LENGTH"""
+    return jsonify({'code': 413, 'msg': f"文件超过大小上限 {app.config['UPLOAD_MAX_BYTES']} 字节"}), 413
 
 # 设备用户注册（根据设备ID自动创建） - 保留原有接口，兼容旧设备
 @app.route('/upload/image', methods=['POST'])
 def upload_image():
-    """接收设备上传的图片"""
+    """
+    接收设备上传的图片（multipart 表单）。表单由 Werkzeug 解析（文件部分先写入临时文件）后再复制到图片目录，
+    不是真正的流式上传，请求体大小由 MAX_CONTENT_LENGTH 在解析前限制；
+    新设备应使用 /upload/image/stream 或可续传上传接口，数据直接流式写入
+    """
     if 'image' not in request.files:
         return jsonify({'code': 400, 'msg': 'No image part'}), 400
     
@@ -382,36 +363,95 @@ def upload_image():
         auto_register_device(device_id)
     
     if file:
-        # 生成安全文件名
-        filename = secure_filename(f"{device_id}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # 将图片信息保存到数据库
-        conn = sqlite3.connect(app.config['DB_PATH'])
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO images (device_id, image_path, original_filename, receive_time) VALUES (?, ?, ?, ?)",
-                      (device_id, filepath, original_filename, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-        
-        # 推送图片上传信息到前端
-        image_data = {
-            'device_id': device_id,
-            'filename': filename,
-            'path': filepath,
-            'timestamp': datetime.now().isoformat(),
-            'size': os.path.getsize(filepath),
-            'original_filename': original_filename
-        }
-        push_data_to_frontend('new_image', image_data)
-        
-        return jsonify({
-        'code': 200, 
-        'msg': 'Upload success', 
-        'path': filepath,
-        'filename': filename
-    })
+        # 分块写入临时文件并计算哈希，完成后原子改名
+        try:
+            filename, filepath, size, sha256 = store_upload(
+                device_id, original_filename,
+                lambda path: uploads.receive(file.stream, path, app.config['UPLOAD_TMP_FOLDER'],
+                                             app.config['UPLOAD_MAX_BYTES']))
+        except uploads.UploadError as e:
+            return upload_error(e)
+        return save_uploaded_image(device_id, filename, filepath, original_filename, size, sha256)
+
+@app.route('/upload/image/stream', methods=['POST'])
+def upload_image_stream():
+    """
+    流式上传：请求体为图片原始字节（Content-Type: application/octet-stream），
+    device_id 和 filename 通过查询参数传递。不经过表单解析，内存占用与图片大小无关
+    """
+    device_id = request.args.get('device_id', 'unknown')
+    original_filename = request.args.get('filename')
+    if not original_filename:
+        return jsonify({'code': 400, 'msg': 'filename is required'}), 400
+    if request.content_length and request.content_length > app.config['UPLOAD_MAX_BYTES']:
+        return jsonify({'code': 413, 'msg': f"文件超过大小上限 {app.config['UPLOAD_MAX_BYTES']} 字节"}), 413
+    
+    if device_id != 'unknown':
+        auto_register_device(device_id)
+    
+    try:
+        filename, filepath, size, sha256 = store_upload(
+            device_id, original_filename,
+            lambda path: uploads.receive(request.stream, path, app.config['UPLOAD_TMP_FOLDER'],
+                                         app.config['UPLOAD_MAX_BYTES']))
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return save_uploaded_image(device_id, filename, filepath, original_filename, size, sha256)
+
+# 可续传的分块上传
+upload_sessions = uploads.UploadSessions(app.config['UPLOAD_TMP_FOLDER'], app.config['UPLOAD_MAX_BYTES'],
+                                         max_age=app.config['UPLOAD_SESSION_MAX_AGE'])
+
+@app.route('/upload/image/sessions', methods=['POST'])
+def create_upload_session():
+    """创建可续传上传：{"device_id", "filename", "size", "sha256"(可选)}，返回 upload_id"""
+    data = request.get_json() or {}
+    device_id = data.get('device_id', 'unknown')
+    original_filename = data.get('filename')
+    if not original_filename:
+        return jsonify({'code': 400, 'msg': 'filename is required'}), 400
+    try:
+        upload_id = upload_sessions.create(data.get('size'), data.get('sha256'), device_id=device_id,
+                                           filename=original_filename)
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return jsonify({'code': 200, 'msg': 'success', 'data': {'upload_id': upload_id, 'offset': 0}})
+
+@app.route('/upload/image/sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """查询已收到的字节数，断线重连后从该偏移继续上传"""
+    try:
+        offset, meta = upload_sessions.status(upload_id)
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return jsonify({'code': 200, 'msg': 'success', 'data': {'upload_id': upload_id, 'offset': offset,
+                                                            'size': meta['size']}})
+
+@app.route('/upload/image/sessions/<upload_id>', methods=['PUT'])
+def append_upload_session(upload_id):
+    """
+    上传一块数据：请求头 Upload-Offset 为该块在文件中的起始偏移，请求体为原始字节。
+    收到全部数据后校验 SHA-256 并保存图片，返回与 /upload/image 相同的结果
+    """
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'code': 400, 'msg': 'Upload-Offset header is required'}), 400
+    try:
+        offset, meta = upload_sessions.append(upload_id, offset, request.stream)
+        if offset < meta['size']:
+            return jsonify({'code': 200, 'msg': 'Chunk received', 'data': {'upload_id': upload_id,
+                                                                             'offset': offset,
+                                                                             'size': meta['size']}})
+        device_id = meta['info']['device_id']
+        original_filename = meta['info']['filename']
+        if device_id != 'unknown':
+            auto_register_device(device_id)
+        filename, filepath, size, sha256 = store_upload(device_id, original_filename,
+                                                        lambda path: upload_sessions.finish(upload_id, path))
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return save_uploaded_image(device_id, filename, filepath, original_filename, size, sha256)
 
 @app.route('/')
 @login_required
@@ -433,44 +473,32 @@ def get_user_info():
 @app.route('/api/devices')
 @login_required
 def get_devices():
-    conn = sqlite3.connect(app.config['DB_PATH'])
+    conn = db.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     
+    # 每个设备只取最新一张图片（见 queries.py）
     # 根据用户角色获取设备信息
     if session['role'] == 'admin':
         # 管理员获取所有设备信息
-        cursor.execute("SELECT * FROM devices")
+        cursor.execute(queries.DEVICES_WITH_LATEST_IMAGE)
     else:
         # 普通用户只能获取自己的设备信息
-        cursor.execute("SELECT * FROM devices WHERE device_id = ?", (session['device_id'],))
-    
-    devices = cursor.fetchall()
+        cursor.execute(queries.DEVICES_WITH_LATEST_IMAGE + queries.DEVICE_FILTER, (session['device_id'],))
     
     device_list = []
-    # 获取所有图片信息
-    cursor.execute("SELECT id, device_id, image_path, original_filename, receive_time FROM images ORDER BY receive_time DESC")
-    all_images = cursor.fetchall()
-    
-    # 按设备ID分组图片
-    images_by_device = {}
-    for image in all_images:
-        image_id, device_id, image_path, original_filename, receive_time = image
-        if device_id not in images_by_device:
-            images_by_device[device_id] = []
-        images_by_device[device_id].append({
-            'id': image_id,
-            'image_path': image_path,
-            'original_filename': original_filename,
-            'receive_time': receive_time
-        })
-    
-    for device in devices:
-        device_id, name, status, created_at = device
+    for row in cursor.fetchall():
+        device_id, name, status, created_at, image_id, image_path, original_filename, receive_time = row
         location = "未知位置"  # 设备表中没有location字段，设置默认值
         
-        # 获取该设备的最新图片（只取第一张，即最新的）
-        device_images = images_by_device.get(device_id, [])
-        latest_image = device_images[0] if device_images else None
+        # 该设备的最新图片
+        latest_image = None
+        if image_id is not None:
+            latest_image = {
+                'id': image_id,
+                'image_path': image_path,
+                'original_filename': original_filename,
+                'receive_time': receive_time
+            }
         
         # 为每个设备创建一个条目，无论是否有图片
         device_list.append({
@@ -494,16 +522,15 @@ def get_devices():
 @app.route('/api/sensor_data')
 @login_required
 def get_sensor_data():
-    conn = sqlite3.connect(app.config['DB_PATH'])
+    conn = db.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     
     if session['role'] == 'admin':
         # 管理员可以查看所有设备数据
-        cursor.execute("SELECT * FROM sensor_data ORDER BY created_at DESC LIMIT 100")
+        cursor.execute(queries.SENSOR_DATA_LATEST)
     else:
         # 设备用户只能查看自己的设备数据
-        cursor.execute("SELECT * FROM sensor_data WHERE device_id=? ORDER BY created_at DESC LIMIT 100", 
-                      (session['device_id'],))
+        cursor.execute(queries.SENSOR_DATA_LATEST_DEVICE, (session['device_id'],))
     
     rows = cursor.fetchall()
     conn.close()
@@ -521,92 +548,74 @@ def get_sensor_data():
 
 # 视觉识别相关功能
 
-# 创建视觉识别结果表
-conn = sqlite3.connect(app.config['DB_PATH'])
-cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS visual_recognition_results (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    image_id INTEGER NOT NULL,
-    status TEXT NOT NULL,
-    total_count INTEGER,
-    analyze_time INTEGER,
-    species_count TEXT,
-    gender_count TEXT,
-    objects TEXT,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-)
-''')
-conn.commit()
-conn.close()
-
 # 视觉识别回调接口
 @app.route('/api/callback', methods=['POST'])
 def visual_callback():
     """接收视觉服务的识别结果"""
     try:
         data = request.get_json()
-        image_id = data.get('image_id')
-        status = data.get('status')
-        result = data.get('result', {})
-        
-        # 存储识别结果到数据库
-        conn = sqlite3.connect(app.config['DB_PATH'])
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        INSERT INTO visual_recognition_results 
-        (image_id, status, total_count, analyze_time, species_count, gender_count, objects)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            image_id,
-            status,
-            result.get('total_count'),
-            result.get('analyze_time'),
-            json.dumps(result.get('species_count', {})),
-            json.dumps(result.get('gender_count', {})),
-            json.dumps(result.get('objects', []))
-        ))
         
-        conn.commit()
-        conn.close()
+        # 存储识别结果到数据库，并更新分析任务状态（失败的任务按退避时间重新排队）
+        with db.transaction(app.config['DB_PATH']) as conn:
+            stored = visual_results.store(conn, [data])
         
-        # 推送结果到前端
-        push_data_to_frontend('visual_result', data)
+        # 推送结果到前端（重复的回调不再推送）
+        if stored:
+            push_data_to_frontend('visual_result', data)
         
         return jsonify({'code': 200, 'msg': 'Callback received successfully'})
     except Exception as e:
         print(f"Callback error: {str(e)}")
         return jsonify({'code': 500, 'msg': f'Callback error: {str(e)}'})
 
+@app.route('/api/callback/batch', methods=['POST'])
+def visual_callback_batch():
+    """视觉服务积压时批量回调：一个事务写入全部结果，合并为一次 visual_results 推送"""
+    try:
+        data = request.get_json() or {}
+        results = data.get('results')
+        if not isinstance(results, list):
+            return jsonify({'code': 400, 'msg': 'results 必须是列表'}), 400
+        
+        with db.transaction(app.config['DB_PATH']) as conn:
+            stored = visual_results.store(conn, results)
+        
+        if stored:
+            push_data_to_frontend('visual_results', {'count': len(stored), 'results': stored})
+        
+        return jsonify({'code': 200, 'msg': 'Callback received successfully',
+                        'data': {'received': len(results), 'stored': len(stored)}})
+    except Exception as e:
+        print(f"Batch callback error: {str(e)}")
+        return jsonify({'code': 500, 'msg': f'Batch callback error: {str(e)}'})
+
 # 触发视觉分析API
 @app.route('/api/trigger_analysis', methods=['POST'])
 @login_required
 def trigger_analysis():
-    """触发视觉服务进行分析"""
+    """把图片加入分析队列（手动触发优先处理），不再在请求中同步调用视觉服务"""
     try:
-        import requests
-        
         data = request.get_json()
         image_id = data.get('image_id')
-        image_path = data.get('image_path')
-        
-        if not image_id or not image_path:
-            return jsonify({'code': 400, 'msg': 'Missing image_id or image_path'}), 400
         
-        # 调用视觉服务
-        visual_service_url = 'http://localhost:8000/api/analyze'
-        callback_url = 'http://localhost:5000/api/callback'
-        
-        payload = {
-            'image_id': image_id,
-            'image_path': image_path,
-            'callback_url': callback_url
-        }
+        if not image_id:
+            return jsonify({'code': 400, 'msg': 'Missing image_id'}), 400
         
-        response = requests.post(visual_service_url, json=payload)
+        with db.transaction(app.config['DB_PATH']) as conn:
+            # 图片路径以数据库记录为准，不使用客户端传入的路径
+            image = conn.execute("SELECT image_path, device_id FROM images WHERE id = ?", (image_id,)).fetchone()
+            if not image:
+                return jsonify({'code': 404, 'msg': '图片不存在'}), 404
+            
+            image_path, device_id = image
+            
+            # 检查权限：普通用户只能分析自己设备的图片
+            if session['role'] != 'admin' and session['device_id'] != device_id:
+                return jsonify({'code': 403, 'msg': '无权限分析该图片'}), 403
+            
+            task_id = analysis_queue.enqueue(conn, image_id, image_path, analysis_queue.PRIORITY_MANUAL)
         
-        return jsonify({'code': 200, 'msg': 'Analysis triggered successfully', 'visual_response': response.json()})
+        return jsonify({'code': 200, 'msg': 'Analysis queued', 'task_id': task_id})
     except Exception as e:
         return jsonify({'code': 500, 'msg': f'Failed to trigger analysis: {str(e)}'})
 
@@ -616,12 +625,10 @@ def trigger_analysis():
 def get_visual_results(image_id):
     """获取指定图片的视觉识别结果"""
     try:
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
-        cursor.execute('''
-        SELECT * FROM visual_recognition_results WHERE image_id = ? ORDER BY created_at DESC LIMIT 1
-        ''', (image_id,))
+        cursor.execute(queries.VISUAL_RESULT_LATEST, (image_id,))
         
         result = cursor.fetchone()
         conn.close()
@@ -646,6 +653,88 @@ def get_visual_results(image_id):
     except Exception as e:
         return jsonify({'code': 500, 'msg': f'Failed to get visual results: {str(e)}'})
 
+# 捕获数量统计API
+@app.route('/api/stats/catches', methods=['GET'])
+@login_required
+def get_catch_stats():
+    """
+    按时间粒度和维度汇总捕获数量，只读 catch_rollup_hourly 汇总表
+    参数: start / end（YYYY-MM-DD 或 YYYY-MM-DD HH:00，包含），interval（hour / day，默认 day），
+         group_by（device、species、gender 逗号分隔，默认 species），device_id（仅管理员）
+    """
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        interval = request.args.get('interval', 'day')
+        group_by = [name for name in request.args.get('group_by', 'species').split(',') if name]
+        
+        if interval not in catch_stats.INTERVALS:
+            return jsonify({'code': 400, 'msg': 'interval must be hour or day'}), 400
+        if any(name not in catch_stats.GROUP_COLUMNS for name in group_by):
+            return jsonify({'code': 400, 'msg': 'group_by must be a list of device, species, gender'}), 400
+        for value in (start, end):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d %H:00' if len(value) > 10 else '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({'code': 400, 'msg': 'Invalid time, expected YYYY-MM-DD or YYYY-MM-DD HH:00'}), 400
+        
+        # 普通用户只能查看自己的设备
+        if session['role'] == 'admin':
+            device_id = request.args.get('device_id') or None
+        else:
+            device_id = session['device_id'] or ''
+        
+        with db.connection(app.config['DB_PATH']) as conn:
+            rows = catch_stats.query(conn, start=start, end=end, interval=interval, group_by=group_by,
+                                     device_id=device_id)
+        
+        return jsonify({'code': 200, 'msg': 'success', 'data': rows})
+    except Exception as e:
+        return jsonify({'code': 500, 'msg': f'Failed to get catch stats: {str(e)}'})
+
+# 标注图按需绘制，缓存键为 <图片ID>-<识别结果ID>.jpg，重新识别后自动使用新结果
+annotated_cache = FileCache(app.config['ANNOTATED_FOLDER'], app.config['ANNOTATED_CACHE_MAX_BYTES'])
+
+@app.route('/api/visual_results/<int:image_id>/annotated', methods=['GET'])
+@login_required
+def get_annotated_image(image_id):
+    """获取画好检测框的图片（根据最新一次识别结果现场绘制并缓存）"""
+    conn = db.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute("SELECT image_path, device_id FROM images WHERE id = ?", (image_id,))
+    image = cursor.fetchone()
+    if not image:
+        conn.close()
+        return jsonify({'code': 404, 'msg': '图片不存在'}), 404
+    
+    image_path, device_id = image
+    
+    # 检查权限：普通用户只能查看自己设备的图片
+    if session['role'] != 'admin' and session['device_id'] != device_id:
+        conn.close()
+        return jsonify({'code': 403, 'msg': '无权限查看该图片'}), 403
+    
+    cursor.execute(queries.ANNOTATION_SOURCE, (image_id,))
+    result = cursor.fetchone()
+    conn.close()
+    if not result:
+        return jsonify({'code': 404, 'msg': 'No visual recognition results found'}), 404
+    
+    result_id, objects = result
+    cache_key = f"{image_id}-{result_id}.jpg"
+    path = annotated_cache.path_for(cache_key)
+    if path is None:
+        if not os.path.exists(image_path):
+            return jsonify({'code': 404, 'msg': '图片文件不存在'}), 404
+        try:
+            data = render_annotated(image_path, json.loads(objects) if objects else [])
+        except Exception as e:
+            return jsonify({'code': 500, 'msg': f'绘制标注图失败: {str(e)}'}), 500
+        path = annotated_cache.put(cache_key, data)
+    
+    return send_file(path, mimetype='image/jpeg')
+
 @app.route('/<path:filename>')
 def serve_static(filename):
     """静态文件服务"""
@@ -660,7 +749,7 @@ def get_latest_sensor_data():
             # 对于API请求，返回JSON格式的未授权响应
             return jsonify({'code': 401, 'msg': '未登录'})
             
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         c = conn.cursor()
         c.execute('''SELECT * FROM sensor_data ORDER BY created_at DESC LIMIT 10''')
         rows = c.fetchall()
@@ -693,31 +782,17 @@ def push_sensor_data():
         # 推送传感器数据到前端
         push_data_to_frontend('sensor_data', sensor_data)
         
+        # 仅推送模式：数据已由MQTT服务入库，这里不再重复写入
+        if not app.config['PUSH_SENSOR_DATA_PERSIST']:
+            return jsonify({
+                'code': 200,
+                'msg': 'Data pushed successfully'
+            })
+        
         # 将数据保存到数据库
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
-        # 确保sensor_data表存在
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sensor_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            temperature_inside REAL,
-            temperature_outside REAL,
-            humidity REAL,
-            duoj1 INTEGER,
-            duoj2 INTEGER,
-            duoj3 INTEGER,
-            duoj4 INTEGER,
-            feng1 INTEGER,
-            feng2 INTEGER,
-            jia INTEGER,
-            raw_data TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
         # 准备插入数据
         device_id = sensor_data.get('device_id', 'unknown')
         timestamp = sensor_data.get('timestamp', datetime.now().isoformat())
@@ -760,7 +835,7 @@ def push_sensor_data():
 def delete_image(image_id):
     conn = None
     try:
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
         # 获取图片信息，包括关联的设备ID
@@ -780,6 +855,10 @@ def delete_image(image_id):
         # 删除图片文件
         if os.path.exists(image_path):
             os.remove(image_path)
+        image_key = image_store.key_for(app.config['UPLOAD_FOLDER'], image_path)
+        image_owner_cache.pop(image_key)
+        derivative_store.remove(image_key)
+        annotated_cache.remove_prefix(f"{image_id}-")
         
         # 从数据库中删除图片记录
         cursor.execute("DELETE FROM images WHERE id = ?", (image_id,))
@@ -796,6 +875,9 @@ def delete_image(image_id):
         
         conn.commit()
         
+        # 清除各进程中该设备的注册缓存
+        invalidate_device_cache(device_id)
+        
         return jsonify({'code': 200, 'msg': '图片和关联设备已成功删除'})
     except Exception as e:
         if conn:
@@ -810,7 +892,7 @@ def delete_image(image_id):
 @login_required
 def view_image(image_id):
     try:
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
         # 获取图片信息
@@ -846,38 +928,162 @@ def view_image(image_id):
                 'filename': original_filename,  # 添加filename字段，与original_filename一致
                 'receive_time': receive_time,
                 'device_id': device_id,
-                'image_url': f"/data/images/{os.path.basename(image_path)}",
+                'image_url': f"/data/images/{image_store.key_for(app.config['UPLOAD_FOLDER'], image_path)}",
                 'size': file_size  # 添加文件大小字段
             }
         })
     except Exception as e:
         return jsonify({'code': 500, 'msg': f'获取图片失败: {str(e)}'})
 
+# 图片存储键 -> (所属设备ID, 内容SHA-256) 缓存，图库页面批量加载缩略图时不必逐张查库
+image_owner_cache = TTLCache(max_size=50000, ttl=600)
+
+# 已保存的图片内容不会改变（同名上传使用新的存储键），浏览器缓存一年，不再重新验证
+IMAGE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+def image_etag(filename, source_path):
+    """图片的强 ETag（内容 SHA-256）；旧记录没有哈希时计算一次并保存"""
+    sha256 = file_sha256(source_path)
+    with db.transaction(app.config['DB_PATH']) as conn:
+        conn.execute("UPDATE images SET sha256 = ? WHERE filename = ? AND sha256 IS NULL", (sha256, filename))
+    return sha256
+
+def not_modified(etag):
+    """浏览器已缓存相同内容时直接返回 304，不读取文件"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+    return response
+
 # 静态文件服务 - 图片访问
-@app.route('/data/images/<filename>')
+@app.route('/data/images/<path:filename>')
 @login_required
 def serve_image(filename):
-    """提供图片文件的静态访问，带访问控制"""
-    # 检查权限：获取图片所属设备ID
-    conn = sqlite3.connect(app.config['DB_PATH'])
-    cursor = conn.cursor()
-    
-    # 根据文件名查找对应的设备ID
-    cursor.execute("SELECT device_id FROM images WHERE image_path LIKE ?", (f"%{filename}",))
-    result = cursor.fetchone()
-    conn.close()
-    
-    if not result:
-        # 图片不存在或无权访问
-        abort(404)
-    
-    device_id = result[0]
+    """
+    提供图片文件的静态访问，带访问控制；filename 为存储键，直接定位到分目录中的文件。
+    ?size=thumb|medium 返回缩略图/预览图（不存在时现场生成），默认 full 为原图。
+    ETag 为内容哈希，If-None-Match 命中时只做权限检查并返回 304；支持 Range 分段下载
+    """
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in derivative_store.sizes:
+        abort(400)
+    # 检查权限：获取图片所属设备ID和内容哈希（先查缓存）
+    owner = image_owner_cache.get(filename)
+    if owner is None:
+        conn = db.connect(app.config['DB_PATH'])
+        cursor = conn.cursor()
+        
+        # 根据文件名查找对应的设备ID（filename 列有索引）
+        cursor.execute(queries.IMAGE_OWNER, (filename,))
+        result = cursor.fetchone()
+        conn.close()
+        
+        if not result:
+            # 图片不存在或无权访问
+            abort(404)
+        
+        owner = tuple(result)
+        image_owner_cache.set(filename, owner)
+    device_id, sha256 = owner
     
     # 权限检查：管理员可以访问所有图片，普通用户只能访问自己设备的图片
     if session['role'] != 'admin' and session['device_id'] != device_id:
         abort(403)
     
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    source_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if sha256 is None:
+        if source_path is None or not os.path.isfile(source_path):
+            abort(404)
+        sha256 = image_etag(filename, source_path)
+        image_owner_cache.set(filename, (device_id, sha256))
+    
+    etag = sha256 if size == 'full' else f"{sha256}-{size}"
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    
+    if size != 'full':
+        if source_path is None or not os.path.isfile(source_path):
+            abort(404)
+        try:
+            response = send_file(derivative_store.ensure(source_path, filename, size),
+                                 mimetype=derivative_store.mimetype, etag=etag)
+            response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+            return response
+        except Exception as e:
+            # 无法生成（如缺少 Pillow、图片损坏）时退回原图，不长期缓存
+            print(f"生成{size}图失败: {filename}, 错误: {e}")
+            response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, etag=sha256)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+    
+    # send_file 处理 If-Range / Range 请求，返回 206 分段内容
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, etag=etag)
+    response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+    return response
+
+def format_image_list(images):
+    """把图片查询结果转换为接口返回格式"""
+    image_list = []
+    for img in images:
+        image_id, image_path, original_filename, receive_time, device_id, device_name = img[:6]
+        filename = image_store.key_for(app.config['UPLOAD_FOLDER'], image_path)
+        
+        image_list.append({
+            'id': image_id,
+            'filename': filename,
+            'original_filename': original_filename,
+            'receive_time': receive_time,
+            'device_id': device_id,
+            'device_name': device_name
+        })
+    return image_list
+
+def get_images_by_cursor(after, per_page):
+    """图片列表游标分页：按 (receive_time, id) 倒序，从游标位置之后读取 per_page 条"""
+    try:
+        cursor_key = decode_cursor(after, 2) if after else None
+    except ValueError:
+        return jsonify({'code': 400, 'msg': 'Invalid cursor'}), 400
+    
+    params = []
+    
+    # 普通用户只能查看自己设备的图片
+    is_device_user = session['role'] != 'admin'
+    if is_device_user:
+        params.append(session['device_id'])
+    if cursor_key:
+        params.extend(cursor_key)
+    
+    conn = db.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    
+    # 多取一条用于判断是否还有下一页
+    cursor.execute(queries.images_after(device=is_device_user, after=bool(cursor_key)), params + [per_page + 1])
+    rows, next_cursor = page_result(cursor.fetchall(), per_page, key=lambda row: (row[3], row[0]))
+    
+    pagination = {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+    
+    # 可选的近似总数：管理员按自增ID跨度估算，设备用户走 device_id 索引计数
+    if request.args.get('include_total') == '1':
+        if session['role'] == 'admin':
+            cursor.execute(queries.IMAGES_ID_SPAN)
+        else:
+            cursor.execute(queries.IMAGES_COUNT_DEVICE, (session['device_id'],))
+        pagination['approximate_total'] = cursor.fetchone()[0]
+    conn.close()
+    
+    return jsonify({
+        'code': 200,
+        'msg': 'success',
+        'data': {
+            'images': format_image_list(rows),
+            'pagination': pagination
+        }
+    })
 
 @app.route('/api/images', methods=['GET'])
 @login_required
@@ -894,63 +1100,40 @@ def get_images():
         elif per_page > 100:
             per_page = 100
         
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        # 游标分页：请求带 after 参数时使用（第一页传空字符串），不再依赖 OFFSET
+        if 'after' in request.args:
+            return get_images_by_cursor(request.args.get('after'), per_page)
+        
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
         # 根据用户角色构建查询
         if session['role'] == 'admin':
             # 管理员可以查看所有图片
             # 获取总数
-            cursor.execute("SELECT COUNT(*) FROM images")
+            cursor.execute(queries.IMAGES_COUNT)
             total = cursor.fetchone()[0]
             
             # 获取分页数据
             offset = (page - 1) * per_page
-            cursor.execute("""
-                SELECT i.id, i.image_path, i.original_filename, i.receive_time, 
-                       i.device_id, d.name as device_name
-                FROM images i
-                LEFT JOIN devices d ON i.device_id = d.device_id
-                ORDER BY i.receive_time DESC
-                LIMIT ? OFFSET ?
-            """, (per_page, offset))
+            cursor.execute(queries.IMAGES_PAGE, (per_page, offset))
         else:
             # 普通用户只能查看自己设备的图片
             device_id = session['device_id']
             
             # 获取总数
-            cursor.execute("SELECT COUNT(*) FROM images WHERE device_id = ?", (device_id,))
+            cursor.execute(queries.IMAGES_COUNT_DEVICE, (device_id,))
             total = cursor.fetchone()[0]
             
             # 获取分页数据
             offset = (page - 1) * per_page
-            cursor.execute("""
-                SELECT i.id, i.image_path, i.original_filename, i.receive_time, 
-                       i.device_id, d.name as device_name
-                FROM images i
-                LEFT JOIN devices d ON i.device_id = d.device_id
-                WHERE i.device_id = ?
-                ORDER BY i.receive_time DESC
-                LIMIT ? OFFSET ?
-            """, (device_id, per_page, offset))
+            cursor.execute(queries.IMAGES_PAGE_DEVICE, (device_id, per_page, offset))
         
         images = cursor.fetchall()
         conn.close()
         
         # 格式化响应数据
-        image_list = []
-        for img in images:
-            image_id, image_path, original_filename, receive_time, device_id, device_name = img
-            filename = os.path.basename(image_path) if image_path else ''
-            
-            image_list.append({
-                'id': image_id,
-                'filename': filename,
-                'original_filename': original_filename,
-                'receive_time': receive_time,
-                'device_id': device_id,
-                'device_name': device_name
-            })
+        image_list = format_image_list(images)
         
         # 计算分页信息
         total_pages = (total + per_page - 1) // per_page
@@ -1002,23 +1185,13 @@ def receive_logs():
         if not isinstance(logs, list):
             logs = [logs]
         
-        # 创建设备日志目录
-        device_log_dir = os.path.join(app.config['LOGS_FOLDER'], device_id)
-        os.makedirs(device_log_dir, exist_ok=True)
+        # 确保日志包含时间戳
+        for log in logs:
+            if 'timestamp' not in log:
+                log['timestamp'] = datetime.now().isoformat()
         
-        # 生成日志文件名（按日期）
-        log_filename = f"{datetime.now().strftime('%Y-%m-%d')}.log"
-        log_filepath = os.path.join(device_log_dir, log_filename)
-        
-        # 写入日志到文件
-        with open(log_filepath, 'a', encoding='utf-8') as f:
-            for log in logs:
-                # 确保日志包含时间戳
-                if 'timestamp' not in log:
-                    log['timestamp'] = datetime.now().isoformat()
-                
-                # 写入日志行
-                f.write(json.dumps(log, ensure_ascii=False) + '\n')
+        # 写入日志库（一个事务）
+        log_store.append(app.config['DB_PATH'], device_id, logs)
         
         # 返回成功响应
         return jsonify({
@@ -1044,99 +1217,90 @@ def get_device_logs():
         per_page = int(request.args.get('per_page', 20))
         device_id = request.args.get('device_id')
         date = request.args.get('date')
+        start = request.args.get('start')
+        end = request.args.get('end')
+        level = request.args.get('level')
+        keyword = request.args.get('keyword')
         
         if page < 1:
             page = 1
         if per_page < 1 or per_page > 100:
             per_page = 20
         
-        # 根据用户角色过滤设备ID
-        allowed_device_ids = []
-        conn = sqlite3.connect(app.config['DB_PATH'])
-        cursor = conn.cursor()
-        
-        if session['role'] == 'admin':
-            # 管理员可以查看所有设备
-            if device_id:
-                # 如果指定了设备ID，检查是否存在
-                cursor.execute("SELECT device_id FROM devices WHERE device_id = ?", (device_id,))
-                if cursor.fetchone():
-                    allowed_device_ids = [device_id]
-                else:
-                    return jsonify({
-                        'code': 404,
-                        'msg': 'Device not found'
-                    })
-            else:
-                # 获取所有设备ID
-                cursor.execute("SELECT device_id FROM devices")
-                allowed_device_ids = [row[0] for row in cursor.fetchall()]
-        else:
-            # 普通用户只能查看自己的设备
-            allowed_device_ids = [session['device_id']]
-        
-        conn.close()
-        
-        # 读取日志文件
-        all_logs = []
+        for value in (date, start, end):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({'code': 400, 'msg': 'Invalid date, expected YYYY-MM-DD'}), 400
         
-        for dev_id in allowed_device_ids:
-            device_log_dir = os.path.join(app.config['LOGS_FOLDER'], dev_id)
-            
-            if not os.path.exists(device_log_dir):
-                continue
+        with db.connection(app.config['DB_PATH']) as conn:
+            cursor = conn.cursor()
             
-            # 获取日志文件列表
-            log_files = []
-            for filename in os.listdir(device_log_dir):
-                if filename.endswith('.log'):
-                    if not date or filename == f"{date}.log":
-                        log_files.append(os.path.join(device_log_dir, filename))
-            
-            # 按文件名排序（最新的日期在前面）
-            log_files.sort(reverse=True)
+            # 根据用户角色过滤设备ID
+            if session['role'] == 'admin':
+                # 管理员可以查看所有设备
+                if device_id:
+                    # 如果指定了设备ID，检查是否存在
+                    cursor.execute("SELECT device_id FROM devices WHERE device_id = ?", (device_id,))
+                    if not cursor.fetchone():
+                        return jsonify({
+                            'code': 404,
+                            'msg': 'Device not found'
+                        })
+                filters = log_store.build_filters(conn, device_id=device_id, all_devices=not device_id, date=date,
+                                                  start=start, end=end, level=level, keyword=keyword)
+            else:
+                # 普通用户只能查看自己的设备
+                filters = log_store.build_filters(conn, device_id=session['device_id'], date=date,
+                                                  start=start, end=end, level=level, keyword=keyword)
             
-            # 读取每个日志文件
-            for log_file in log_files:
+            # 游标分页：从上一页最后一条日志 (时间戳, id) 之后继续读取
+            if 'after' in request.args:
+                after = request.args.get('after')
                 try:
-                    with open(log_file, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            line = line.strip()
-                            if line:
-                                try:
-                                    log_entry = json.loads(line)
-                                    log_entry['device_id'] = dev_id
-                                    log_entry['date'] = os.path.basename(log_file).replace('.log', '')
-                                    all_logs.append(log_entry)
-                                except json.JSONDecodeError:
-                                    # 跳过无效的JSON行
-                                    continue
-                except Exception as e:
-                    app.logger.error(f"Error reading log file {log_file}: {str(e)}")
-        
-        # 按时间戳排序（最新的日志在前面）
-        all_logs.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        # 分页
-        total = len(all_logs)
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_logs = all_logs[start:end]
-        
-        # 计算总页数
-        total_pages = (total + per_page - 1) // per_page
+                    cursor_key = decode_cursor(after, 2) if after else None
+                except ValueError:
+                    return jsonify({'code': 400, 'msg': 'Invalid cursor'}), 400
+                
+                entries = log_store.query_after(conn, filters, per_page, cursor_key)
+                rows, next_cursor = page_result(entries, per_page, key=lambda item: item[0])
+                
+                pagination = {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
+                if request.args.get('include_total') == '1':
+                    pagination['approximate_total'] = log_store.count(conn, filters)
+                
+                return jsonify({
+                    'code': 200,
+                    'msg': 'success',
+                    'data': {
+                        'logs': [log_entry for key, log_entry in rows],
+                        'pagination': pagination
+                    }
+                })
+            
+            # 页码分页（旧接口）：保持原有返回格式，始终返回总数；新客户端应使用 after 游标分页，总数按需获取
+            paginated_logs, has_more, total = log_store.query_page(conn, filters, per_page, (page - 1) * per_page,
+                                                                   include_total=True)
+        
+        pagination = {
+            'current_page': page,
+            'per_page': per_page,
+            'total': total,
+            'total_pages': (total + per_page - 1) // per_page,
+            'has_more': has_more
+        }
         
         return jsonify({
             'code': 200,
             'msg': 'success',
             'data': {
                 'logs': paginated_logs,
-                'pagination': {
-                    'current_page': page,
-                    'per_page': per_page,
-                    'total': total,
-                    'total_pages': total_pages
-                }
+                'pagination': pagination
             }
         })
     except Exception as e:
@@ -1149,10 +1313,50 @@ def get_device_logs():
 # 添加MQTT客户端用于发布命令
 import paho.mqtt.client as mqtt
 
-# 初始化MQTT客户端用于发布命令
+# 初始化MQTT客户端用于发布命令，同时订阅本地事件总线上的前端推送事件
 mqtt_client = mqtt.Client()
+frontend_relay = event_bus.FrontendRelay(push_data_to_frontend)
+
+def on_mqtt_connect(client, userdata, flags, rc):
+    # 每次（重新）连接后都需要重新订阅
+    client.subscribe(event_bus.FRONTEND_TOPIC, qos=0)
+    client.subscribe(event_bus.REGISTRY_INVALIDATE_TOPIC, qos=1)
+
+mqtt_client.on_connect = on_mqtt_connect
+mqtt_client.message_callback_add(event_bus.FRONTEND_TOPIC, frontend_relay.on_message)
+mqtt_client.message_callback_add(event_bus.REGISTRY_INVALIDATE_TOPIC,
+                                 event_bus.registry_invalidation_handler(device_registry))
 mqtt_client.connect("localhost", 1883, 60)
 mqtt_client.loop_start()
+socketio.start_background_task(frontend_relay.run, socketio.sleep)
+
+def invalidate_device_cache(device_id):
+    """清除本进程的设备注册缓存，并通知其他进程"""
+    device_registry.invalidate(device_id)
+    try:
+        event_bus.publish_registry_invalidation(mqtt_client, device_id)
+    except Exception as e:
+        print(f"❌ 发送注册缓存失效通知失败: {e}")
+
+# 运行统计信息（管理员）
+@app.route('/api/metrics')
+@login_required
+def get_metrics():
+    """获取各组件运行统计"""
+    if session['role'] != 'admin':
+        return jsonify({'code': 403, 'msg': '无权限'}), 403
+    return jsonify({
+        'code': 200,
+        'msg': 'success',
+        'data': {
+            'device_registry': device_registry.stats(),
+            'frontend_relay': frontend_relay.stats(),
+            'db_pool': db.get_pool(app.config['DB_PATH']).stats(),
+            'annotated_cache': annotated_cache.stats(),
+            'derivatives': derivative_store.stats(),
+            'analysis_tasks': analysis_queue.stats(app.config['DB_PATH'])
+        }
+    })
 
 # 发送MQTT命令API
 @app.route('/api/send_command', methods=['POST'])
@@ -1171,7 +1375,7 @@ def send_command():
             return jsonify({'code': 400, 'msg': 'Device ID and command data are required'}), 400
         
         # 检查设备是否存在
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM devices WHERE device_id = ?", (device_id,))
         device = cursor.fetchone()
@@ -1206,7 +1410,7 @@ def delete_device(device_id):
         if session['role'] != 'admin':
             return jsonify({'code': 403, 'msg': '无权限删除设备'}), 403
         
-        conn = sqlite3.connect(app.config['DB_PATH'])
+        conn = db.connect(app.config['DB_PATH'])
         cursor = conn.cursor()
         
         # 检查设备是否存在
@@ -1217,10 +1421,10 @@ def delete_device(device_id):
         
         try:
             # 删除设备相关的所有图片记录
-            cursor.execute("DELETE FROM images WHERE device_id = ?", (device_id,))
+            cursor.execute(queries.DELETE_DEVICE_IMAGES, (device_id,))
             
             # 删除设备相关的用户记录
-            cursor.execute("DELETE FROM users WHERE device_id = ?", (device_id,))
+            cursor.execute(queries.DELETE_DEVICE_USERS, (device_id,))
             
             # 删除设备记录
             cursor.execute("DELETE FROM devices WHERE device_id = ?", (device_id,))
@@ -1229,6 +1433,10 @@ def delete_device(device_id):
             conn.commit()
             conn.close()
             
+            # 清除各进程中该设备的注册缓存和图片归属缓存
+            invalidate_device_cache(device_id)
+            image_owner_cache.clear()
+            
             return jsonify({
                 'code': 200,
                 'msg': '设备删除成功'
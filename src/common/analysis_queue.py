@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片分析任务队列（持久化在 iot.db 的 analysis_tasks 表，表结构见 migrations.py）
+- upload_image 保存图片时在同一事务中入队，浏览器是否打开都不影响分析
+- analysis_dispatcher 服务取出任务提交给视觉服务，状态 queued -> running
+- 视觉服务回调 /api/callback 后 running -> done；失败时按退避时间重新排队，超过次数后 failed
+- 同一图片同时只有一个未完成的任务（唯一索引去重），手动触发的任务优先级更高
+"""
+
+import time
+
+from src.common import db
+
+# 优先级：数字越大越先处理
+PRIORITY_UPLOAD = 0
+PRIORITY_MANUAL = 10
+
+# 默认最多尝试次数和重试退避（秒）
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 600
+
+# 热点查询（test_query_plans.py 检查执行计划）
+# 去重：该图片未完成的任务
+ACTIVE_TASK_SQL = "SELECT id, priority FROM analysis_tasks WHERE image_id = ? AND status IN ('queued', 'running')"
+# 取任务：按优先级、先进先出
+CLAIM_SQL = ("SELECT id, image_id, image_path FROM analysis_tasks WHERE status = 'queued' AND available_at <= ? "
+             "ORDER BY priority DESC, id LIMIT ?")
+# 回调成功
+COMPLETE_SQL = ("UPDATE analysis_tasks SET status = 'done', last_error = NULL, updated_at = CURRENT_TIMESTAMP "
+                "WHERE image_id = ? AND status = 'running'")
+
+
+def retry_delay(attempts, base=RETRY_BASE_DELAY, maximum=RETRY_MAX_DELAY):
+    """第 attempts 次失败后的等待时间（指数退避）"""
+    return min(maximum, base * (2 ** max(0, attempts - 1)))
+
+
+def enqueue(conn, image_id, image_path, priority=PRIORITY_UPLOAD):
+    """
+    在调用方的事务中入队；该图片已有未完成的任务时只提高其优先级。
+    返回任务ID
+    """
+    row = conn.execute(ACTIVE_TASK_SQL, (image_id,)).fetchone()
+    if row:
+        if priority > row[1]:
+            conn.execute("UPDATE analysis_tasks SET priority = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (priority, row[0]))
+        return row[0]
+    cursor = conn.execute("INSERT INTO analysis_tasks (image_id, image_path, priority, available_at) VALUES (?, ?, ?, ?)",
+                          (image_id, image_path, priority, time.time()))
+    return cursor.lastrowid
+
+
+def claim(db_path, limit, max_running=None):
+    """
+    取出至多 limit 个可执行的任务并标记为 running，返回 [(任务ID, 图片ID, 图片路径)]。
+    max_running 限制同时在视觉服务中的任务数。多个进程同时调用时由写锁保证同一任务只被取出一次
+    """
+    with db.connection(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if max_running is not None:
+                running = conn.execute("SELECT COUNT(*) FROM analysis_tasks WHERE status = 'running'").fetchone()[0]
+                limit = min(limit, max_running - running)
+            tasks = []
+            if limit > 0:
+                now = time.time()
+                tasks = conn.execute(CLAIM_SQL, (now, limit)).fetchall()
+                conn.executemany("UPDATE analysis_tasks SET status = 'running', attempts = attempts + 1, "
+                                 "started_at = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                                 [(now, task[0]) for task in tasks])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return tasks
+
+
+def release(db_path, task_ids):
+    """取出后尚未提交的任务放回队列，不计入尝试次数"""
+    if not task_ids:
+        return
+    with db.transaction(db_path) as conn:
+        conn.executemany("UPDATE analysis_tasks SET status = 'queued', attempts = attempts - 1, "
+                         "updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+                         [(task_id,) for task_id in task_ids])
+
+
+def _fail(conn, where, params, error, max_attempts):
+    """running 任务失败：未超过次数时按退避重新排队，否则标记 failed；返回处理的任务数"""
+    rows = conn.execute(f"SELECT id, attempts FROM analysis_tasks WHERE status = 'running' AND {where}",
+                        params).fetchall()
+    now = time.time()
+    for task_id, attempts in rows:
+        if attempts >= max_attempts:
+            conn.execute("UPDATE analysis_tasks SET status = 'failed', last_error = ?, "
+                         "updated_at = CURRENT_TIMESTAMP WHERE id = ?", (error, task_id))
+        else:
+            conn.execute("UPDATE analysis_tasks SET status = 'queued', last_error = ?, available_at = ?, "
+                         "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (error, now + retry_delay(attempts), task_id))
+    return len(rows)
+
+
+def retry_later(db_path, task_id, error, max_attempts=MAX_ATTEMPTS):
+    """提交视觉服务失败（服务不可用、队列已满等）"""
+    with db.transaction(db_path) as conn:
+        _fail(conn, "id = ?", (task_id,), error, max_attempts)
+
+
+def complete(conn, image_id, success, error=None, max_attempts=MAX_ATTEMPTS):
+    """在调用方的事务中记录视觉服务回调结果；返回处理的任务数（0 表示没有对应的 running 任务）"""
+    if success:
+        return conn.execute(COMPLETE_SQL, (image_id,)).rowcount
+    return _fail(conn, "image_id = ?", (image_id,), error or 'analysis failed', max_attempts)
+
+
+def requeue_stale(db_path, timeout, max_attempts=MAX_ATTEMPTS):
+    """running 超过 timeout 秒仍未收到回调（如视觉服务重启丢失了任务）的任务重新排队"""
+    with db.transaction(db_path) as conn:
+        return _fail(conn, "started_at < ?", (time.time() - timeout,), 'callback timeout', max_attempts)
+
+
+def stats(db_path):
+    """各状态任务数"""
+    with db.connection(db_path) as conn:
+        rows = conn.execute("SELECT status, COUNT(*) FROM analysis_tasks GROUP BY status").fetchall()
+    counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+    counts.update(dict(rows))
+    return counts
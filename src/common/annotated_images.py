@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果标注图
+视觉服务只返回检测框数据，不再为每次推理保存画好框的图片；
+需要查看时由 render() 根据 visual_recognition_results 中保存的 objects 现场绘制，
+结果写入 FileCache（按总大小上限淘汰最久未访问的文件）。
+"""
+
+import io
+import os
+import threading
+import uuid
+
+# 检测框颜色：雌性红色、雄性蓝色、其他绿色
+BOX_COLORS = {'雌性': (230, 57, 70), '雄性': (29, 111, 232)}
+DEFAULT_BOX_COLOR = (46, 170, 80)
+
+
+def render(image_path, objects, quality=85):
+    """在原图上绘制检测框和标签，返回 JPEG 字节"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    with Image.open(image_path) as source:
+        image = source.convert('RGB')
+    draw = ImageDraw.Draw(image)
+    # 线宽和字号随图片尺寸缩放，4K 图片上也能看清
+    line_width = max(2, min(image.size) // 300)
+    try:
+        font = ImageFont.load_default(size=max(12, min(image.size) // 50))
+    except TypeError:
+        # Pillow < 10.1 的默认字体不支持字号
+        font = ImageFont.load_default()
+
+    for obj in objects:
+        x, y, w, h = obj.get('bbox', [0, 0, 0, 0])
+        color = BOX_COLORS.get(obj.get('gender'), DEFAULT_BOX_COLOR)
+        draw.rectangle([x, y, x + w, y + h], outline=color, width=line_width)
+        # 默认字体没有中文字形，标签使用模型原始类别名
+        label = f"{obj.get('class', '')} {obj.get('confidence', 0):.2f}"
+        left, top, right, bottom = draw.textbbox((x, y), label, font=font)
+        label_top = max(0, y - (bottom - top) - 4)
+        draw.rectangle([x, label_top, x + (right - left) + 6, label_top + (bottom - top) + 4], fill=color)
+        draw.text((x + 3, label_top + 2 - (top - y)), label, fill=(255, 255, 255), font=font)
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+class FileCache:
+    """
+    磁盘文件缓存，总大小超过 max_bytes 时删除最久未访问的文件，直到降到 90% 以下。
+    多个 Web 进程共用同一目录：写入先写临时文件再原子改名，淘汰时重新扫描目录。
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = self._scan_size()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _scan_size(self):
+        total = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def path_for(self, key):
+        """缓存命中时返回文件路径（并更新访问时间），否则返回 None"""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key, data):
+        """写入缓存，返回文件路径"""
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for mtime, size, path in files)
+        target = self.max_bytes * 0.9
+        for mtime, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def remove_prefix(self, prefix):
+        """删除 key 以 prefix 开头的缓存文件（如删除图片时），返回释放的字节数"""
+        return self.remove_prefixes((prefix,))
+
+    def remove_prefixes(self, prefixes):
+        """删除 key 以 prefixes 中任一前缀开头的缓存文件，只扫描一次目录（过期清理按批删除），返回释放的字节数"""
+        freed = 0
+        prefixes = tuple(prefixes)
+        if not prefixes:
+            return 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(prefixes):
+                    try:
+                        size = entry.stat().st_size
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    freed += size
+                    with self._lock:
+                        self._size -= size
+        return freed
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size_bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+        }
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回调发件箱
+视觉服务的识别结果先写入 SQLite 发件箱再投递，主服务重启或暂时不可用时结果不会丢失：
+- 单个投递线程使用连接复用的 HTTP 会话，带超时；失败后按指数退避重试，超过 max_age 仍未送达的结果丢弃
+- 积压多条结果时合并为一次请求发送到批量回调地址（<callback_url>/batch），
+  对方不支持批量接口（404/405）时自动改为逐条发送
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+from src.common import db
+
+
+def batch_url_for(callback_url):
+    return callback_url.rstrip('/') + '/batch'
+
+
+class CallbackOutbox:
+    """持久化的回调投递队列"""
+
+    def __init__(self, db_path, batch_size=50, timeout=(3, 10), max_backoff=300, max_age=7 * 86400,
+                 poll_interval=5, session=None, latency_window=1000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        if session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._no_batch_urls = set()
+        with db.transaction(db_path) as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS callback_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                callback_url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL
+            )''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_callback_outbox_next ON callback_outbox (next_attempt_at)")
+
+        # 统计信息
+        self.added = 0
+        self.delivered = 0
+        self.failures = 0
+        self.expired = 0
+        self.batch_requests = 0
+        self._latencies = deque(maxlen=latency_window)
+
+    def add(self, callback_url, payload):
+        """结果写入发件箱并唤醒投递线程"""
+        now = time.time()
+        with db.transaction(self.db_path) as conn:
+            conn.execute("INSERT INTO callback_outbox (callback_url, payload, next_attempt_at, created_at) "
+                         "VALUES (?, ?, ?, ?)", (callback_url, json.dumps(payload, ensure_ascii=False), now, now))
+        with self._lock:
+            self.added += 1
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='callback-outbox', daemon=True)
+        self._thread.start()
+        print(f"🔄 回调投递线程已启动，积压 {self.backlog()} 条")
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                # 一轮投递满 batch_size 条说明还有积压，继续投递
+                while not self._stopping and self.deliver_due() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"❌ 回调投递出错: {type(e).__name__}: {e}")
+
+    def _post(self, url, body):
+        """发送一次请求；返回 (是否成功, 错误信息, HTTP状态码)"""
+        try:
+            response = self.session.post(url, json=body, timeout=self.timeout)
+        except Exception as e:
+            return False, f"{type(e).__name__}: {e}", None
+        if response.status_code != 200:
+            return False, f"HTTP {response.status_code}", response.status_code
+        try:
+            code = response.json().get('code', 200)
+        except ValueError:
+            code = 200
+        if code != 200:
+            return False, f"code {code}: {response.text[:200]}", response.status_code
+        return True, None, response.status_code
+
+    def deliver_due(self):
+        """投递一轮到期的结果，返回本轮取出的条数"""
+        with db.transaction(self.db_path) as conn:
+            expired = conn.execute("DELETE FROM callback_outbox WHERE created_at < ?",
+                                   (time.time() - self.max_age,)).rowcount
+            rows = conn.execute("SELECT id, callback_url, payload, attempts, created_at FROM callback_outbox "
+                                "WHERE next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?",
+                                (time.time(), self.batch_size)).fetchall()
+        if expired:
+            with self._lock:
+                self.expired += expired
+            print(f"⚠️  {expired} 条回调超过 {self.max_age} 秒仍未送达，已丢弃")
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[1], []).append(row)
+        for callback_url, group in groups.items():
+            self._deliver_group(callback_url, group)
+        return len(rows)
+
+    def _deliver_group(self, callback_url, group):
+        if len(group) > 1 and callback_url not in self._no_batch_urls:
+            ok, error, status = self._post(batch_url_for(callback_url),
+                                           {'results': [json.loads(row[2]) for row in group]})
+            if ok:
+                with self._lock:
+                    self.batch_requests += 1
+                self._delivered(group)
+                return
+            if status not in (404, 405):
+                self._failed(group, error)
+                return
+            print(f"ℹ️  {callback_url} 不支持批量回调，改为逐条发送")
+            self._no_batch_urls.add(callback_url)
+
+        for i, row in enumerate(group):
+            ok, error, status = self._post(callback_url, json.loads(row[2]))
+            if not ok:
+                # 对方不可用时剩余结果也一起推迟，不逐条重试
+                self._failed(group[i:], error)
+                return
+            self._delivered([row])
+
+    def _delivered(self, rows):
+        now = time.time()
+        with db.transaction(self.db_path) as conn:
+            conn.executemany("DELETE FROM callback_outbox WHERE id = ?", [(row[0],) for row in rows])
+        with self._lock:
+            self.delivered += len(rows)
+            for row in rows:
+                self._latencies.append((now - row[4]) * 1000)
+
+    def _failed(self, rows, error):
+        now = time.time()
+        with db.transaction(self.db_path) as conn:
+            conn.executemany("UPDATE callback_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? "
+                             "WHERE id = ?",
+                             [(error, now + min(self.max_backoff, 2 ** row[3]), row[0]) for row in rows])
+        with self._lock:
+            self.failures += 1
+        print(f"⚠️  回调投递失败（{len(rows)} 条）: {error}")
+
+    def backlog(self):
+        with db.connection(self.db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM callback_outbox").fetchone()[0]
+
+    def stats(self):
+        with db.connection(self.db_path) as conn:
+            backlog, oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM callback_outbox").fetchone()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'backlog': backlog,
+                'oldest_age_s': round(time.time() - oldest, 1) if oldest else 0,
+                'added': self.added,
+                'delivered': self.delivered,
+                'failures': self.failures,
+                'expired': self.expired,
+                'batch_requests': self.batch_requests,
+                'latency_ms': {
+                    'avg': round(sum(latencies) / len(latencies), 2) if latencies else 0,
+                    'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else 0,
+                },
+            }
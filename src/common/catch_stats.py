@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+捕获数量统计
+catch_rollup_hourly 按 (小时, 设备, 种类, 性别) 汇总捕获数量（表结构见 migrations.py），
+识别结果入库时在同一事务中增量更新，/api/stats/catches 只读汇总表，不再扫描识别结果。
+每张图片只计入其最新一条成功的识别结果（与 /api/visual_results 一致），重新识别时按差值更新。
+
+用法: python3 src/common/catch_stats.py rebuild [数据库路径] [起始小时]   # 从 detection_counts 重建汇总表
+重建只覆盖起始小时（默认为保留的最早一张图片所在小时）及之后的汇总行，
+更早的图片已被数据保留清理删除，对应的汇总行是长期统计数据，原样保留。
+"""
+
+import os
+import sys
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common import db
+
+# 可用的分组维度 -> 汇总表列名
+GROUP_COLUMNS = {'device': 'device_id', 'species': 'species', 'gender': 'gender'}
+
+# 时间粒度 -> 从 hour 列（'YYYY-MM-DD HH:00'）截取的长度
+INTERVALS = {'hour': 16, 'day': 10}
+
+# 图片 receive_time（ISO 格式）转换为小时桶
+HOUR_SQL = "substr({0}, 1, 10) || ' ' || substr({0}, 12, 2) || ':00'"
+
+# 每张图片最新一条成功识别结果的ID
+LATEST_RESULT_SQL = ("SELECT id FROM visual_recognition_results WHERE image_id = ? AND status = 'success' "
+                     "ORDER BY created_at DESC, id DESC LIMIT 1")
+
+# 图片当前计入统计的数量
+IMAGE_COUNTS_SQL = f"SELECT species, gender, count FROM detection_counts WHERE result_id = ({LATEST_RESULT_SQL})"
+
+
+def hour_bucket(receive_time):
+    """'2025-06-01T13:45:10.123' -> '2025-06-01 13:00'"""
+    return f"{receive_time[:10]} {receive_time[11:13]}:00"
+
+
+def image_counts(conn, image_id):
+    """图片当前计入统计的 {(种类, 性别): 数量}"""
+    rows = conn.execute(IMAGE_COUNTS_SQL, (image_id,)).fetchall()
+    return {(species, gender): count for species, gender, count in rows}
+
+
+def apply_change(conn, image_id, before, after):
+    """在调用方的事务中把图片计数从 before 更新为 after（image_counts 的返回值）"""
+    if before == after:
+        return
+    image = conn.execute("SELECT device_id, receive_time FROM images WHERE id = ?", (image_id,)).fetchone()
+    if not image or not image[1]:
+        # 图片已删除，不计入统计
+        return
+    device_id, receive_time = image
+    hour = hour_bucket(receive_time)
+    changes = []
+    for key in set(before) | set(after):
+        delta = after.get(key, 0) - before.get(key, 0)
+        if delta:
+            changes.append((hour, device_id, key[0], key[1], delta))
+    conn.executemany('''INSERT INTO catch_rollup_hourly (hour, device_id, species, gender, count) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (hour, device_id, species, gender) DO UPDATE SET count = count + excluded.count''',
+                     changes)
+    conn.execute("DELETE FROM catch_rollup_hourly WHERE hour = ? AND device_id = ? AND count <= 0", (hour, device_id))
+
+
+def query(conn, start=None, end=None, interval='day', group_by=('species',), device_id=None):
+    """
+    按时间粒度和分组维度汇总捕获数量。start / end 为 'YYYY-MM-DD' 或 'YYYY-MM-DD HH:00'（均包含），
+    device_id 不为 None 时只统计该设备。返回 [{'time': ..., <维度>: ..., 'count': ...}]，按时间排序
+    """
+    columns = [GROUP_COLUMNS[name] for name in group_by]
+    time_sql = f"substr(hour, 1, {INTERVALS[interval]})"
+    where = []
+    params = []
+    if device_id is not None:
+        where.append("device_id = ?")
+        params.append(device_id)
+    if start:
+        where.append("hour >= ?")
+        params.append(start)
+    if end:
+        # 只给日期时包含当天所有小时
+        where.append("hour <= ?")
+        params.append(end if len(end) > 10 else end + ' 23:00')
+    select = ", ".join([f"{time_sql} AS time"] + columns)
+    sql = f"SELECT {select}, SUM(count) FROM catch_rollup_hourly"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " GROUP BY " + ", ".join(["time"] + columns) + " ORDER BY " + ", ".join(["time"] + columns)
+    names = ['time'] + list(group_by) + ['count']
+    return [dict(zip(names, row)) for row in conn.execute(sql, params)]
+
+
+# 保留的最早一张图片所在小时（receive_time 有索引）
+OLDEST_IMAGE_HOUR_SQL = f"SELECT {HOUR_SQL.format('MIN(receive_time)')} FROM images WHERE receive_time IS NOT NULL"
+
+
+def rebuild(db_path=db.DB_PATH, since=None):
+    """
+    按 detection_counts 重建 since（'YYYY-MM-DD HH:00'）及之后的汇总行（一个事务完成，期间新的回调会等待）；
+    since 为 None 时从保留的最早一张图片所在小时开始，更早的汇总行不动。返回重建的汇总行数
+    """
+    with db.transaction(db_path) as conn:
+        if since is None:
+            since = conn.execute(OLDEST_IMAGE_HOUR_SQL).fetchone()[0]
+            if since is None:
+                # 没有图片可供重建
+                return 0
+        conn.execute("DELETE FROM catch_rollup_hourly WHERE hour >= ?", (since,))
+        conn.execute(f'''
+        INSERT INTO catch_rollup_hourly (hour, device_id, species, gender, count)
+        SELECT {HOUR_SQL.format('i.receive_time')}, i.device_id, c.species, c.gender, SUM(c.count)
+        FROM images i
+        JOIN detection_counts c ON c.result_id = (
+            SELECT id FROM visual_recognition_results WHERE image_id = i.id AND status = 'success'
+            ORDER BY created_at DESC, id DESC LIMIT 1
+        )
+        WHERE i.receive_time IS NOT NULL AND {HOUR_SQL.format('i.receive_time')} >= ?
+        GROUP BY 1, 2, 3, 4
+        ''', (since,))
+        return conn.execute("SELECT COUNT(*) FROM catch_rollup_hourly WHERE hour >= ?", (since,)).fetchone()[0]
+
+
+if __name__ == "__main__":
+    from src.common import migrations
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) > 2 else db.DB_PATH
+    since = sys.argv[3] if len(sys.argv) > 3 else None
+    migrations.migrate(path)
+    print(f"✅ 捕获统计汇总表已重建，共 {rebuild(path, since)} 行")
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享SQLite数据访问层
+app.py、mqtt_server.py、mqtt_receiver.py 共用同一套连接池：
+- 连接按需从池中借出，close() 时归还而不是真正关闭，避免每次请求/消息都重新打开数据库
+- 每个借出的连接同一时刻只属于一个线程/协程，用完即还
+- 连接统一开启 WAL 日志模式并设置 synchronous/cache_size/mmap_size 等参数
+- 每个连接保留自己的预编译语句缓存（cached_statements），归还后下次借出仍可复用
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 默认数据库路径（与各服务原有配置一致）
+DB_PATH = './iot.db'
+
+# 连接池中最多保留的空闲连接数
+MAX_IDLE_CONNECTIONS = 16
+
+# 每个连接缓存的预编译语句数量（sqlite3 默认只有 128）
+STATEMENT_CACHE_SIZE = 256
+
+# 连接级参数；journal_mode 为数据库级持久设置，首次设置后对所有进程生效
+PRAGMAS = (
+    ('journal_mode', 'WAL'),          # 读写互不阻塞
+    ('synchronous', 'NORMAL'),        # WAL 模式下只在检查点时 fsync
+    ('cache_size', -32000),           # 页缓存约 32MB（负数单位为 KB）
+    ('mmap_size', 268435456),         # 256MB 内存映射读取
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),           # 多进程写冲突时最多等待 5 秒
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接：close() 会把连接归还连接池"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._checked_out = False
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+            return
+        # 重复 close 时忽略，防止同一连接被放回池中两次
+        if not self._checked_out:
+            return
+        self._checked_out = False
+        self._pool.release(self)
+
+    def really_close(self):
+        """真正关闭底层连接"""
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """SQLite 连接池"""
+
+    def __init__(self, db_path=DB_PATH, max_idle=MAX_IDLE_CONNECTIONS, pragmas=PRAGMAS):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.pragmas = pragmas
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # 统计信息
+        self.created = 0
+        self.reused = 0
+
+    def _create(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            factory=PooledConnection,
+            check_same_thread=False,  # 连接会在不同线程/协程之间轮转，但同一时刻只被一个使用者持有
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name}={value}")
+        conn._pool = self
+        self.created += 1
+        return conn
+
+    def acquire(self):
+        """借出一个连接"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+        if conn is None:
+            conn = self._create()
+        conn._checked_out = True
+        return conn
+
+    def release(self, conn):
+        """归还连接；未提交的事务会被回滚"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.really_close()
+            return
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.really_close()
+
+    @contextmanager
+    def connection(self):
+        """with 语句借用连接，退出时自动归还"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """with 语句执行一个事务，正常退出提交，异常回滚"""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def close_all(self):
+        """关闭所有空闲连接（进程退出时调用）"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.really_close()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {'created': self.created, 'reused': self.reused, 'idle': idle}
+
+
+# 每个数据库文件一个连接池
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """获取指定数据库文件的连接池"""
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[key] = pool
+    return pool
+
+
+def connect(db_path=DB_PATH):
+    """替代 sqlite3.connect：返回池化连接，调用 close() 即归还"""
+    return get_pool(db_path).acquire()
+
+
+def connection(db_path=DB_PATH):
+    return get_pool(db_path).connection()
+
+
+def transaction(db_path=DB_PATH):
+    return get_pool(db_path).transaction()
+
+
+def close_all():
+    """关闭所有连接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
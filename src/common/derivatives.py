@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片缩略图和预览图
+图库网格只需要小图，原图动辄几 MB。每张图片生成固定尺寸的衍生图：
+- thumb：最长边 320 像素，用于图库网格
+- medium：最长边 1280 像素，用于预览
+衍生图保存在 <衍生图目录>/<尺寸>/<图片存储键>.webp（不支持 WebP 时为 .jpg），与原图相同的分目录布局，
+删除图片（包括过期清理）时一并删除。上传后由后台线程池生成，旧图片在第一次请求时生成。
+"""
+
+import os
+import uuid
+
+from src.common import image_store
+
+# 尺寸名称 -> 最长边像素
+SIZES = {'thumb': 320, 'medium': 1280}
+
+QUALITY = 80
+
+# 可能的衍生图扩展名（取决于 Pillow 是否支持 WebP）
+EXTENSIONS = ('.webp', '.jpg')
+
+
+def _output_format():
+    """优先使用 WebP，Pillow 未编译 WebP 支持时使用 JPEG"""
+    from PIL import features
+    return ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+
+def generate(source_path, target_path, max_side, quality=QUALITY):
+    """按最长边 max_side 等比缩小 source_path（不放大），写入 target_path（先写临时文件再原子改名）"""
+    from PIL import Image, ImageOps
+
+    image_format = 'WEBP' if target_path.endswith('.webp') else 'JPEG'
+    with Image.open(source_path) as image:
+        # JPEG 按目标尺寸降采样解码，大图解码快很多
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((max_side, max_side))
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            image.save(tmp_path, format=image_format, quality=quality)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class DerivativeStore:
+    """按图片存储键定位和生成衍生图，不需要数据库记录"""
+
+    def __init__(self, root, sizes=SIZES, quality=QUALITY):
+        self.root = root
+        self.sizes = sizes
+        self.quality = quality
+        self._extension = None
+
+        # 统计信息
+        self.hits = 0
+        self.generated = 0
+        self.failures = 0
+
+    @property
+    def extension(self):
+        if self._extension is None:
+            self._extension = _output_format()[1]
+        return self._extension
+
+    @property
+    def mimetype(self):
+        return 'image/webp' if self.extension == '.webp' else 'image/jpeg'
+
+    def path_for(self, key, size):
+        return os.path.join(self.root, size, *key.split('/')) + self.extension
+
+    def ensure(self, source_path, key, size):
+        """返回衍生图路径，不存在时现场生成"""
+        path = self.path_for(key, size)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        try:
+            generate(source_path, path, self.sizes[size], self.quality)
+        except Exception:
+            self.failures += 1
+            raise
+        self.generated += 1
+        return path
+
+    def generate_all(self, source_path, key):
+        """生成所有尺寸（上传后在后台线程中调用）"""
+        for size in self.sizes:
+            try:
+                self.ensure(source_path, key, size)
+            except Exception as e:
+                print(f"⚠️  生成 {size} 衍生图失败: {key}, {type(e).__name__}: {e}")
+
+    def remove(self, key):
+        """删除一张图片的所有衍生图（两种格式都检查，不需要 Pillow），返回释放的字节数"""
+        freed = 0
+        for size in self.sizes:
+            size_root = os.path.join(self.root, size)
+            base = os.path.join(size_root, *key.split('/'))
+            for extension in EXTENSIONS:
+                try:
+                    freed += os.path.getsize(base + extension)
+                    os.remove(base + extension)
+                except FileNotFoundError:
+                    pass
+            image_store.prune_empty_dirs(os.path.dirname(base), size_root)
+        return freed
+
+    def stats(self):
+        return {'hits': self.hits, 'generated': self.generated, 'failures': self.failures}
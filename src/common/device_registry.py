@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备自动注册服务
+app.py 与 mqtt_server.py 共用，带缓存：
+- 已注册设备进入 LRU/TTL 缓存，稳定运行时每条消息不再查询 users/devices 表
+- 格式不合法的设备ID、注册频率过高或注册失败的设备ID进入否定缓存，在有效期内直接拒绝
+- 删除设备时调用 invalidate() 使缓存失效（其他进程通过本地事件总线收到失效通知）
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.common import db
+
+# 设备ID格式正则表达式（允许字母、数字、下划线和连字符，长度3-20）
+DEVICE_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{3,20}$')
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DeviceRegistry:
+    """设备注册服务"""
+
+    def __init__(self, db_path=db.DB_PATH, max_size=10000, ttl=3600, negative_ttl=300,
+                 retry_interval=60, log_prefix='自动注册'):
+        self.db_path = db_path
+        self.retry_interval = retry_interval  # 同一设备ID注册失败后的最短重试间隔（秒）
+        self.log_prefix = log_prefix
+        self._known = TTLCache(max_size, ttl)
+        self._rejected = TTLCache(max_size, negative_ttl)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.registrations = 0
+        self.failures = 0
+
+    def ensure_registered(self, device_id):
+        """确保设备已注册，返回设备是否可用"""
+        with self._lock:
+            if self._known.get(device_id):
+                self.hits += 1
+                return True
+            reason = self._rejected.get(device_id)
+            if reason is not None:
+                self.negative_hits += 1
+                return False
+            self.misses += 1
+
+        # 1. 设备ID格式验证
+        if not DEVICE_ID_PATTERN.match(device_id):
+            print(f"❌ [{self.log_prefix}] 设备ID格式无效: {device_id}")
+            with self._lock:
+                self._rejected.set(device_id, 'invalid')
+            return False
+
+        try:
+            created = self._register(device_id)
+        except Exception as e:
+            print(f"❌ [{self.log_prefix}] 设备注册失败: {device_id}, 错误: {type(e).__name__}: {e}")
+            with self._lock:
+                self.failures += 1
+                # 限制注册频率：失败后 retry_interval 秒内不再尝试
+                self._rejected.set(device_id, 'failed', ttl=self.retry_interval)
+            return False
+
+        with self._lock:
+            self._known.set(device_id, True)
+            if created:
+                self.registrations += 1
+        if created:
+            print(f"✅ [{self.log_prefix}] 设备注册成功: {device_id}")
+        return True
+
+    def _register(self, device_id):
+        """在数据库中查找或创建设备，返回是否新建了记录"""
+        created = False
+        try:
+            with db.transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                # 检查设备是否已存在于用户表
+                cursor.execute("SELECT 1 FROM users WHERE username=?", (device_id,))
+                if cursor.fetchone() is None:
+                    # 注册设备用户
+                    cursor.execute("INSERT INTO users (username, password, role, device_id) VALUES (?, ?, ?, ?)",
+                                   (device_id, '123456', 'device', device_id))
+                    print(f"🔧 [{self.log_prefix}] 成功注册设备用户: {device_id}")
+                    created = True
+
+                # 检查设备是否已存在于设备表
+                cursor.execute("SELECT 1 FROM devices WHERE device_id=?", (device_id,))
+                if cursor.fetchone() is None:
+                    # 创建设备记录
+                    cursor.execute("INSERT INTO devices (device_id, name) VALUES (?, ?)",
+                                   (device_id, f'设备{device_id}'))
+                    print(f"🔧 [{self.log_prefix}] 成功创建设备记录: {device_id}")
+                    created = True
+        except sqlite3.IntegrityError as e:
+            # 其他进程同时注册了同一设备，设备已经存在
+            print(f"ℹ️  [{self.log_prefix}] 设备注册冲突（设备已存在）: {device_id}, 错误: {e}")
+        return created
+
+    def invalidate(self, device_id=None):
+        """使缓存失效；不指定设备ID时清空全部缓存"""
+        with self._lock:
+            if device_id is None:
+                self._known.clear()
+                self._rejected.clear()
+            else:
+                self._known.pop(device_id)
+                self._rejected.pop(device_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'cached': len(self._known),
+                'rejected_cached': len(self._rejected),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'registrations': self.registrations,
+                'failures': self.failures,
+                'hit_rate': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0,
+            }
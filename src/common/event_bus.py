@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地事件总线
+复用本机 MQTT Broker 在各进程之间广播事件，替代 mqtt_server -> HTTP /push_sensor_data 的转发：
+- 发布方（如 mqtt_server）把事件发布到 internal/frontend/<事件名>
+- Web 进程订阅 internal/frontend/#，收到后直接通过 Socket.IO 推送给浏览器，不再重复入库
+- 删除设备时在 internal/registry/invalidate 上广播，各进程清除设备注册缓存
+"""
+
+import json
+import queue
+
+# 推送到前端的事件主题前缀
+FRONTEND_TOPIC_PREFIX = "internal/frontend/"
+FRONTEND_TOPIC = FRONTEND_TOPIC_PREFIX + "#"
+
+# 设备注册缓存失效通知主题（删除设备后通知各进程清除缓存）
+REGISTRY_INVALIDATE_TOPIC = "internal/registry/invalidate"
+
+
+def publish(client, event, data):
+    """发布一个前端事件（QoS 0：实时展示数据丢失一条无影响，不需要重传）"""
+    return client.publish(FRONTEND_TOPIC_PREFIX + event, json.dumps(data, ensure_ascii=False), qos=0)
+
+
+def publish_registry_invalidation(client, device_id):
+    """通知所有进程清除某个设备的注册缓存（QoS 1：失效通知不能丢）"""
+    return client.publish(REGISTRY_INVALIDATE_TOPIC, json.dumps({'device_id': device_id}), qos=1)
+
+
+def registry_invalidation_handler(registry):
+    """生成处理失效通知的 MQTT 回调"""
+    def on_message(client, userdata, msg):
+        try:
+            device_id = json.loads(msg.payload.decode('utf-8')).get('device_id')
+            registry.invalidate(device_id)
+        except Exception as e:
+            print(f"❌ 处理注册缓存失效通知失败: {type(e).__name__}: {e}")
+    return on_message
+
+
+def decode(msg):
+    """解析事件消息，返回 (事件名, 数据)"""
+    event = msg.topic[len(FRONTEND_TOPIC_PREFIX):]
+    return event, json.loads(msg.payload.decode('utf-8'))
+
+
+class FrontendRelay:
+    """
+    Web 进程侧的事件中转：MQTT 回调线程只入队，由 Socket.IO 后台任务取出并推送。
+    这样推送始终在 Socket.IO 自己的调度环境（eventlet 协程或线程）中执行。
+    """
+
+    def __init__(self, emit, max_queue=10000, batch_size=200, idle_sleep=0.05):
+        self.emit = emit
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self._queue = queue.Queue(maxsize=max_queue)
+
+        # 统计信息
+        self.received = 0
+        self.emitted = 0
+        self.dropped = 0
+
+    def on_message(self, client, userdata, msg):
+        """MQTT 消息回调"""
+        try:
+            self._queue.put_nowait(decode(msg))
+            self.received += 1
+        except queue.Full:
+            self.dropped += 1
+        except Exception as e:
+            print(f"❌ 解析前端事件失败: {type(e).__name__}: {e}")
+
+    def drain(self):
+        """取出并推送至多 batch_size 条事件，返回推送条数"""
+        count = 0
+        while count < self.batch_size:
+            try:
+                event, data = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self.emit(event, data)
+                self.emitted += 1
+            except Exception as e:
+                print(f"❌ 推送前端事件失败: {type(e).__name__}: {e}")
+            count += 1
+        return count
+
+    def run(self, sleep):
+        """后台任务主循环；sleep 使用 socketio.sleep 以便在协程模式下让出执行权"""
+        while True:
+            if not self.drain():
+                sleep(self.idle_sleep)
+            else:
+                sleep(0)
+
+    def stats(self):
+        return {'received': self.received, 'emitted': self.emitted, 'dropped': self.dropped,
+                'queue_depth': self._queue.qsize()}
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片存储目录布局
+图片按 <设备ID>/<年>/<月>/<日>/<文件名> 分目录保存，单个目录的文件数保持在较小范围：
+- images.filename 保存相对于图片根目录的路径（存储键），/data/images/<存储键> 据此做权限检查和读取，
+  不需要扫描目录；旧版平铺在根目录下的图片存储键就是文件名，可以继续访问
+- 过期清理按 images 记录删除文件（见 retention.py），删除后清理变空的日期目录
+- 旧图片用本模块迁移到分目录布局
+
+用法: python3 src/common/image_store.py migrate [图片目录] [数据库路径]
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common import db
+
+IMAGE_ROOT = '/data/images/'
+
+# 迁移时每个事务处理的文件数
+MIGRATE_CHUNK_SIZE = 500
+
+
+def shard_key(device_id, filename, when):
+    """图片存储键：<设备ID>/<年>/<月>/<日>/<文件名>"""
+    device_dir = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in device_id or '').strip('.') or 'unknown'
+    return '/'.join([device_dir, when.strftime('%Y'), when.strftime('%m'), when.strftime('%d'), filename])
+
+
+def key_for(root, image_path):
+    """由图片绝对路径得到存储键（也就是 /data/images/ 之后的 URL 部分）"""
+    if not image_path:
+        return ''
+    relative = os.path.relpath(image_path, root)
+    if relative.startswith('..'):
+        return os.path.basename(image_path)
+    return relative.replace(os.sep, '/')
+
+
+def parse_time(value):
+    """images.receive_time（ISO 格式）-> datetime，无法解析时返回 None"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def reserve(root, key):
+    """
+    以 O_CREAT | O_EXCL 创建空文件占用存储键，已被占用时在文件名后加随机后缀重试，返回 (存储键, 路径)。
+    并发上传同名文件时各自得到不同的键，调用方再用 os.replace 把数据放到该路径，已保存的图片不会被覆盖
+    """
+    directory, filename = key.rsplit('/', 1)
+    stem, ext = os.path.splitext(filename)
+    os.makedirs(os.path.join(root, *directory.split('/')), exist_ok=True)
+    while True:
+        path = os.path.join(root, *key.split('/'))
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return key, path
+        except FileExistsError:
+            key = f"{directory}/{stem}_{uuid.uuid4().hex[:8]}{ext}"
+
+
+def release(root, path):
+    """上传失败时删除 reserve() 占用的文件，并清理变空的日期目录"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    prune_empty_dirs(os.path.dirname(path), root)
+
+
+def prune_empty_dirs(path, root):
+    """从 path 向上删除变空的目录（日、月、年、设备），不删除 root 本身"""
+    root = os.path.abspath(root)
+    path = os.path.abspath(path)
+    while path.startswith(root + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+        path = os.path.dirname(path)
+
+
+def migrate_flat(root=IMAGE_ROOT, db_path=db.DB_PATH, chunk_size=MIGRATE_CHUNK_SIZE):
+    """
+    把平铺在根目录下的旧图片移动到分目录布局并更新 images 记录，每 chunk_size 个文件一个事务。
+    旧版本同名上传会覆盖文件，多条记录可能指向同一文件：文件按最新一条记录的接收时间归档，这些记录一起更新。
+    中断后可以重新运行。返回 (移动的文件数, 缺失的文件数)
+    """
+    moved = 0
+    missing = 0
+    last_filename = ''
+    while True:
+        with db.transaction(db_path) as conn:
+            rows = conn.execute("SELECT filename, device_id, MAX(receive_time) FROM images "
+                                "WHERE filename > ? AND instr(filename, '/') = 0 "
+                                "GROUP BY filename ORDER BY filename LIMIT ?",
+                                (last_filename, chunk_size)).fetchall()
+            for filename, device_id, receive_time in rows:
+                when = parse_time(receive_time) or datetime.now()
+                key = shard_key(device_id, filename, when)
+                source = os.path.join(root, filename)
+                target = os.path.join(root, *key.split('/'))
+                if os.path.exists(source):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(source, target)
+                    moved += 1
+                elif not os.path.exists(target):
+                    # 文件已被删除：记录保持不变
+                    missing += 1
+                    continue
+                # target 已存在说明上次移动后未提交，只需更新记录
+                conn.execute("UPDATE images SET filename = ?, image_path = ? WHERE filename = ?",
+                             (key, target, filename))
+        if not rows:
+            return moved, missing
+        last_filename = rows[-1][0]
+        print(f"📦 已迁移 {moved} 个图片文件（至 {last_filename}）")
+
+
+if __name__ == "__main__":
+    from src.common import migrations
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print(__doc__)
+        sys.exit(1)
+    root = sys.argv[2] if len(sys.argv) > 2 else IMAGE_ROOT
+    path = sys.argv[3] if len(sys.argv) > 3 else db.DB_PATH
+    migrations.migrate(path)
+    moved, missing = migrate_flat(root, path)
+    print(f"✅ 共迁移 {moved} 个图片文件，{missing} 条记录的文件已不存在")
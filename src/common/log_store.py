@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备日志存储
+设备上报的日志写入 iot.db 的 device_logs 表（表结构见 migrations.py）：
+- (device_id, timestamp) 等索引让 /api/logs 直接定位到请求的页，不再每次重新解析全部日志文件
+- 支持按日期范围、级别、关键字筛选；关键字优先走 FTS5 全文索引
+- 旧版本按天写入的 /data/logs/<设备ID>/<日期>.log 可用本模块导入
+
+用法: python3 src/common/log_store.py import [日志目录] [数据库路径]
+"""
+
+import os
+import sys
+import json
+import time
+from datetime import datetime, timedelta
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common import db
+
+# 每批导入的日志条数
+IMPORT_BATCH_SIZE = 5000
+
+# trigram 分词要求关键字至少 3 个字符，更短的关键字用 LIKE
+FTS_MIN_KEYWORD_LENGTH = 3
+
+SELECT_COLUMNS = "l.id, l.device_id, l.timestamp, l.date, l.body"
+
+
+def _row(device_id, log, date):
+    """日志转换为 device_logs 行"""
+    return (device_id, str(log.get('timestamp', '')), str(log.get('level', '')).upper() or None,
+            str(log.get('message', '')), date, json.dumps(log, ensure_ascii=False))
+
+
+def append(db_path, device_id, logs, date=None):
+    """写入一批日志（一个事务）"""
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    with db.transaction(db_path) as conn:
+        conn.executemany("INSERT INTO device_logs (device_id, timestamp, level, message, date, body) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", [_row(device_id, log, date) for log in logs])
+
+
+def has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'device_logs_fts'").fetchone() is not None
+
+
+def build_filters(conn, device_id=None, all_devices=False, date=None, start=None, end=None, level=None,
+                  keyword=None):
+    """
+    构造 WHERE 条件
+    device_id: 指定设备；all_devices=True 时查询 devices 表中的全部设备
+    date: 接收日期（与旧版日志文件名一致）
+    start/end: 日志时间戳的日期范围（YYYY-MM-DD，含两端）
+    """
+    conditions = []
+    params = []
+    if device_id:
+        conditions.append("l.device_id = ?")
+        params.append(device_id)
+    elif all_devices:
+        # "+" 让 SQLite 按 timestamp 索引顺序读取再过滤设备，避免取出全部日志后排序
+        conditions.append("+l.device_id IN (SELECT device_id FROM devices)")
+    else:
+        # 既没有指定设备也不是全部设备：不返回任何日志
+        conditions.append("0")
+    if date:
+        conditions.append("l.date = ?")
+        params.append(date)
+    if start:
+        conditions.append("l.timestamp >= ?")
+        params.append(start)
+    if end:
+        # 结束日期当天的日志也包含在内
+        next_day = (datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        conditions.append("l.timestamp < ?")
+        params.append(next_day)
+    if level:
+        conditions.append("l.level = ?")
+        params.append(level.upper())
+    if keyword:
+        if len(keyword) >= FTS_MIN_KEYWORD_LENGTH and has_fts(conn):
+            conditions.append("l.id IN (SELECT rowid FROM device_logs_fts WHERE device_logs_fts MATCH ?)")
+            params.append('"' + keyword.replace('"', '""') + '"')
+        else:
+            conditions.append("l.message LIKE ? ESCAPE '\\'")
+            params.append('%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    return conditions, params
+
+
+def _entries(rows):
+    entries = []
+    for log_id, device_id, timestamp, date, body in rows:
+        log_entry = json.loads(body)
+        log_entry['device_id'] = device_id
+        log_entry['date'] = date
+        entries.append(((timestamp, log_id), log_entry))
+    return entries
+
+
+def count_sql(filters):
+    """总数查询：返回 (SQL, 参数)"""
+    conditions, params = filters
+    where = ' AND '.join(conditions) or '1'
+    return f"SELECT COUNT(*) FROM device_logs l WHERE {where}", list(params)
+
+
+def page_sql(filters, per_page, offset=0):
+    """按页码查询（多取一条）：返回 (SQL, 参数)"""
+    conditions, params = filters
+    where = ' AND '.join(conditions) or '1'
+    return (f"SELECT {SELECT_COLUMNS} FROM device_logs l WHERE {where} "
+            f"ORDER BY l.timestamp DESC, l.id DESC LIMIT ? OFFSET ?", list(params) + [per_page + 1, offset])
+
+
+def after_sql(filters, per_page, after=None):
+    """游标查询（多取一条）：返回 (SQL, 参数)"""
+    conditions, params = filters
+    conditions = list(conditions)
+    params = list(params)
+    if after:
+        conditions.append("(l.timestamp, l.id) < (?, ?)")
+        params.extend(after)
+    where = ' AND '.join(conditions) or '1'
+    return (f"SELECT {SELECT_COLUMNS} FROM device_logs l WHERE {where} "
+            f"ORDER BY l.timestamp DESC, l.id DESC LIMIT ?", params + [per_page + 1])
+
+
+def count(conn, filters):
+    """符合条件的日志总数"""
+    return conn.execute(*count_sql(filters)).fetchone()[0]
+
+
+def query_page(conn, filters, per_page, offset=0, include_total=False):
+    """
+    按页码查询（旧接口）：返回 (日志列表, 是否有下一页, 总数)。
+    总数需要扫描全部符合条件的日志，只在 include_total=True 时计算，否则为 None
+    """
+    rows = conn.execute(*page_sql(filters, per_page, offset)).fetchall()
+    total = count(conn, filters) if include_total else None
+    return [entry for key, entry in _entries(rows[:per_page])], len(rows) > per_page, total
+
+
+def query_after(conn, filters, per_page, after=None):
+    """游标查询：返回 [(排序键, 日志)]，至多 per_page+1 条（多出的一条用于判断是否有下一页）"""
+    return _entries(conn.execute(*after_sql(filters, per_page, after)).fetchall())
+
+
+def import_files(db_path, logs_folder):
+    """导入旧版按天写入的日志文件；已导入过的文件会跳过，返回导入条数"""
+    imported = 0
+    for device_id in sorted(os.listdir(logs_folder)):
+        device_log_dir = os.path.join(logs_folder, device_id)
+        if not os.path.isdir(device_log_dir):
+            continue
+        for filename in sorted(os.listdir(device_log_dir)):
+            if not filename.endswith('.log'):
+                continue
+            path = os.path.join(device_log_dir, filename)
+            size = os.path.getsize(path)
+            with db.connection(db_path) as conn:
+                if conn.execute("SELECT 1 FROM device_log_imports WHERE path = ?", (path,)).fetchone():
+                    continue
+
+            date = filename[:-len('.log')]
+            rows = []
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rows.append(_row(device_id, json.loads(line), date))
+                    except json.JSONDecodeError:
+                        # 跳过无效的JSON行
+                        continue
+
+            # 同一文件的日志与导入记录在一个事务中写入
+            with db.transaction(db_path) as conn:
+                for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+                    conn.executemany("INSERT INTO device_logs (device_id, timestamp, level, message, date, body) "
+                                     "VALUES (?, ?, ?, ?, ?, ?)", rows[i:i + IMPORT_BATCH_SIZE])
+                conn.execute("INSERT INTO device_log_imports (path, size, imported_at) VALUES (?, ?, ?)",
+                             (path, size, time.strftime('%Y-%m-%d %H:%M:%S')))
+            imported += len(rows)
+            print(f"📥 已导入 {path}: {len(rows)} 条")
+    return imported
+
+
+if __name__ == "__main__":
+    from src.common import migrations
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'import':
+        print(__doc__)
+        sys.exit(1)
+    logs_folder = sys.argv[2] if len(sys.argv) > 2 else '/data/logs/'
+    path = sys.argv[3] if len(sys.argv) > 3 else db.DB_PATH
+    migrations.migrate(path)
+    print(f"✅ 共导入 {import_files(path, logs_folder)} 条日志")
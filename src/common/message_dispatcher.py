@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按键分发的工作线程池
+MQTT 网络线程只负责把消息交给这里，耗时的解析、注册、入库、推送在工作线程中执行。
+同一个键（设备ID）总是落到同一个工作线程，保证单个设备的消息按到达顺序处理；
+不同设备之间并行处理。每个工作线程一个有界队列，队列满时对调用方施加背压。
+"""
+
+import queue
+import threading
+import time
+import zlib
+
+# 停止信号
+_STOP = object()
+
+
+class KeyedDispatcher:
+    """按键保序的有界线程池"""
+
+    def __init__(self, handler, workers=4, queue_size=1000, put_timeout=1.0, name='dispatcher'):
+        self.handler = handler
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.name = name
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.submitted = 0
+        self.processed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.total_handle_ms = 0.0
+
+    def start(self):
+        """启动工作线程"""
+        if self._threads:
+            return
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"🔄 消息处理线程池已启动，{self.workers}个工作线程，每个队列上限{self._queues[0].maxsize}")
+
+    def _queue_for(self, key):
+        return self._queues[zlib.crc32(str(key).encode('utf-8')) % self.workers]
+
+    def submit(self, key, *args):
+        """提交一条消息；对应队列已满时最多等待 put_timeout 秒，仍满则拒绝并返回 False"""
+        q = self._queue_for(key)
+        try:
+            q.put_nowait(args)
+        except queue.Full:
+            with self._lock:
+                self.blocked += 1
+            try:
+                q.put(args, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.rejected += 1
+                return False
+        with self._lock:
+            self.submitted += 1
+            depth = q.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def stop(self, timeout=30):
+        """处理完已入队的消息后停止工作线程"""
+        for q in self._queues:
+            q.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+        self._threads = []
+        print(f"⏹️  消息处理线程池已停止，{self.format_stats()}")
+
+    def stats(self):
+        with self._lock:
+            processed = self.processed
+            return {
+                'workers': self.workers,
+                'queue_depths': [q.qsize() for q in self._queues],
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'processed': processed,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'blocked': self.blocked,
+                'avg_handle_ms': round(self.total_handle_ms / processed, 2) if processed else 0,
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"已处理 {s['processed']} 条（出错 {s['errors']}），队列 {sum(s['queue_depths'])}（峰值 {s['max_depth']}），"
+                f"背压 {s['blocked']} 次，拒绝 {s['rejected']} 条，平均处理 {s['avg_handle_ms']}ms")
+
+    def _run(self, q):
+        while True:
+            args = q.get()
+            if args is _STOP:
+                break
+            start = time.perf_counter()
+            try:
+                self.handler(*args)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"❌ 消息处理线程出错: {type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self.processed += 1
+                    self.total_handle_ms += (time.perf_counter() - start) * 1000
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微批处理队列
+请求方把任务放入有界队列后立即返回；工作线程凑够 max_batch_size 个任务
+或等待 max_wait 秒后，把这一批交给 process_batch 一次处理（如一次 YOLO 批量推理），
+再逐个回调 on_done。队列满时拒绝新任务，由调用方返回"繁忙"。
+workers > 1 时多个工作线程同时从队列取批次，空闲的线程先取（用于驱动多个推理进程）。
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+# 停止信号
+_STOP = object()
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class MicroBatcher:
+    """有界队列 + 工作线程的微批处理器"""
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait=0.05, max_queue=256, workers=1, name='batcher',
+                 latency_window=1000):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.submitted = 0
+        self.processed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.total_batch_ms = 0.0
+        self.batch_sizes = {}
+        self._latencies = deque(maxlen=latency_window)
+
+    def start(self):
+        """启动工作线程"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"🔄 微批处理线程已启动，{self.workers}个工作线程，每批最多{self.max_batch_size}个，"
+              f"最长等待{int(self.max_wait * 1000)}ms，队列上限{self._queue.maxsize}")
+
+    def submit(self, item, on_done):
+        """
+        提交一个任务，on_done(result, error) 在处理完成后由工作线程调用；
+        队列已满时返回 False
+        """
+        try:
+            self._queue.put_nowait((item, on_done, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+            depth = self._queue.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def stop(self, timeout=60):
+        """处理完已入队的任务后停止工作线程"""
+        if not self._threads:
+            return
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+        self._threads = []
+        print(f"⏹️  微批处理线程已停止，{self.format_stats()}")
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'avg_batch_ms': round(self.total_batch_ms / self.batches, 2) if self.batches else 0,
+                'latency_ms': {
+                    'avg': round(sum(latencies) / len(latencies), 2) if latencies else 0,
+                    'p50': round(_percentile(latencies, 0.5), 2),
+                    'p95': round(_percentile(latencies, 0.95), 2),
+                    'max': round(latencies[-1], 2) if latencies else 0,
+                },
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"已处理 {s['processed']} 个（出错 {s['errors']}），{s['batches']} 批，批大小分布 {s['batch_size_histogram']}，"
+                f"队列 {s['queue_depth']}（峰值 {s['max_depth']}），拒绝 {s['rejected']} 个，"
+                f"延迟 p50 {s['latency_ms']['p50']}ms / p95 {s['latency_ms']['p95']}ms")
+
+    def _collect(self, first):
+        """以 first 开头凑一批：凑满或超时即返回；遇到停止信号时返回 (批次, True)"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _process(self, batch):
+        """处理一批；整批失败时逐个重试，避免一个坏任务拖累同批的其他任务"""
+        items = [item for item, on_done, submitted_at in batch]
+        try:
+            results = self.process_batch(items)
+            return [(result, None) for result in results]
+        except Exception as e:
+            if len(batch) == 1:
+                return [(None, e)]
+        outcomes = []
+        for item in items:
+            try:
+                outcomes.append((self.process_batch([item])[0], None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopping = self._collect(first)
+
+            start = time.perf_counter()
+            outcomes = self._process(batch)
+            finished = time.perf_counter()
+
+            with self._lock:
+                self.batches += 1
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.total_batch_ms += (finished - start) * 1000
+                for (item, on_done, submitted_at), (result, error) in zip(batch, outcomes):
+                    self.processed += 1
+                    if error is not None:
+                        self.errors += 1
+                    self._latencies.append((finished - submitted_at) * 1000)
+
+            for (item, on_done, submitted_at), (result, error) in zip(batch, outcomes):
+                try:
+                    on_done(result, error)
+                except Exception as e:
+                    print(f"❌ 微批处理回调出错: {type(e).__name__}: {e}")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+iot.db 数据库结构迁移
+所有表和索引都在这里按版本定义，各服务启动时调用 migrate() 升级到最新版本，
+不再在 app.py / mqtt_server.py / mqtt_receiver.py 中各自建表。
+
+新增迁移：在 MIGRATIONS 末尾追加 (版本号, 说明, SQL语句列表或函数)，版本号递增，已发布的迁移不要修改。
+
+用法: python3 src/common/migrations.py [数据库路径]   # 手动升级并显示当前版本
+"""
+
+import os
+import sys
+import time
+import sqlite3
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common import db
+
+
+# ---- 需要用代码完成的迁移步骤 ----
+
+def _images_filename(conn):
+    """images 增加 filename 列（存储的文件名），并回填已有记录"""
+    conn.execute("ALTER TABLE images ADD COLUMN filename TEXT")
+    last_id = 0
+    while True:
+        rows = conn.execute("SELECT id, image_path FROM images WHERE id > ? ORDER BY id LIMIT 5000",
+                            (last_id,)).fetchall()
+        if not rows:
+            break
+        conn.executemany("UPDATE images SET filename = ? WHERE id = ?",
+                         [(os.path.basename(image_path or ''), image_id) for image_id, image_path in rows])
+        last_id = rows[-1][0]
+    # /data/images/<filename> 访问权限检查：WHERE filename = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_images_filename ON images (filename)")
+
+
+def _device_logs(conn):
+    """设备日志表：按设备、时间戳建索引，可用时建立 FTS5 全文索引"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS device_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        level TEXT,
+        message TEXT,
+        date TEXT NOT NULL,
+        body TEXT NOT NULL
+    )''')
+    # /api/logs：WHERE device_id = ? [AND timestamp 范围] ORDER BY timestamp DESC, id DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_device_logs_device_ts ON device_logs (device_id, timestamp)")
+    # 不指定设备时按时间倒序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_device_logs_ts ON device_logs (timestamp)")
+    # 按级别筛选
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_device_logs_device_level_ts ON device_logs (device_id, level, timestamp)")
+    # 已导入的旧日志文件，避免重复导入
+    conn.execute('''CREATE TABLE IF NOT EXISTS device_log_imports (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        imported_at TEXT NOT NULL
+    )''')
+    try:
+        # trigram 分词支持中文子串检索（需要 SQLite 3.34+）
+        conn.execute("CREATE VIRTUAL TABLE device_logs_fts USING fts5("
+                     "message, content='device_logs', content_rowid='id', tokenize='trigram')")
+    except sqlite3.OperationalError as e:
+        print(f"⚠️  当前SQLite不支持FTS5 trigram，日志关键字检索将使用 LIKE: {e}")
+        return
+    conn.execute('''CREATE TRIGGER device_logs_ai AFTER INSERT ON device_logs BEGIN
+        INSERT INTO device_logs_fts (rowid, message) VALUES (new.id, new.message);
+    END''')
+    conn.execute('''CREATE TRIGGER device_logs_ad AFTER DELETE ON device_logs BEGIN
+        INSERT INTO device_logs_fts (device_logs_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    END''')
+
+
+
+def _detections(conn):
+    """识别目标明细表和每张图片按种类、性别的计数表，统计查询直接在 SQL 中完成；旧结果用 visual_results.py backfill 回填"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS detections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        result_id INTEGER NOT NULL,
+        image_id INTEGER NOT NULL,
+        class TEXT,
+        species TEXT,
+        gender TEXT,
+        confidence REAL,
+        x INTEGER,
+        y INTEGER,
+        w INTEGER,
+        h INTEGER
+    )''')
+    # 重新识别时替换某条结果的明细：WHERE result_id = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_detections_result ON detections (result_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_detections_image ON detections (image_id)")
+    # 按种类、性别、置信度筛选
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_detections_species_gender ON detections (species, gender, confidence)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS detection_counts (
+        result_id INTEGER NOT NULL,
+        image_id INTEGER NOT NULL,
+        species TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (result_id, species, gender)
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_detection_counts_image ON detection_counts (image_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_detection_counts_species ON detection_counts (species, gender)")
+    # 是否已写入明细，回填工具据此跳过已处理的结果
+    conn.execute("ALTER TABLE visual_recognition_results ADD COLUMN detections_indexed INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = [
+    (1, '基础表结构', [
+        '''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'device',
+            device_id TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS devices (
+            device_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            status TEXT DEFAULT 'active',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            receive_time TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS sensor_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            timestamp TEXT,
+            temperature_inside REAL,
+            temperature_outside REAL,
+            humidity REAL,
+            duoj1 INTEGER,
+            duoj2 INTEGER,
+            duoj3 INTEGER,
+            duoj4 INTEGER,
+            feng1 INTEGER,
+            feng2 INTEGER,
+            jia INTEGER,
+            raw_data TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS visual_recognition_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            total_count INTEGER,
+            analyze_time INTEGER,
+            species_count TEXT,
+            gender_count TEXT,
+            objects TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (2, '热点查询索引', [
+        # /api/sensor_data、/get_latest_sensor_data：ORDER BY created_at DESC LIMIT N
+        'CREATE INDEX IF NOT EXISTS idx_sensor_data_created_at ON sensor_data (created_at)',
+        # 设备用户查看自己的数据：WHERE device_id = ? ORDER BY created_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_sensor_data_device_created ON sensor_data (device_id, created_at)',
+        # 过期数据清理：WHERE timestamp < ?
+        'CREATE INDEX IF NOT EXISTS idx_sensor_data_timestamp ON sensor_data (timestamp)',
+        # /api/images（管理员）：ORDER BY receive_time DESC
+        'CREATE INDEX IF NOT EXISTS idx_images_receive_time ON images (receive_time)',
+        # /api/images（设备用户）、/api/devices、删除设备：WHERE device_id = ? ORDER BY receive_time DESC
+        'CREATE INDEX IF NOT EXISTS idx_images_device_receive ON images (device_id, receive_time)',
+        # /api/visual_results/<image_id>：WHERE image_id = ? ORDER BY created_at DESC LIMIT 1
+        'CREATE INDEX IF NOT EXISTS idx_visual_results_image_created ON visual_recognition_results (image_id, created_at)',
+        # 删除设备：DELETE FROM users WHERE device_id = ?
+        'CREATE INDEX IF NOT EXISTS idx_users_device_id ON users (device_id)',
+    ]),
+    (3, 'images.filename 列及索引', _images_filename),
+    (4, '设备日志表及索引', _device_logs),
+    (5, '图片分析任务队列', [
+        # 状态：queued（排队）/ running（已提交视觉服务，等待回调）/ done / failed
+        '''CREATE TABLE IF NOT EXISTS analysis_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_id INTEGER NOT NULL,
+            image_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            available_at REAL NOT NULL,
+            started_at REAL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # 去重：同一图片同时只有一个未完成的任务
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_analysis_tasks_active ON analysis_tasks (image_id) "
+        "WHERE status IN ('queued', 'running')",
+        # 取任务：WHERE status = 'queued' ORDER BY priority DESC, id
+        'CREATE INDEX IF NOT EXISTS idx_analysis_tasks_claim ON analysis_tasks (status, priority DESC, id)',
+    ]),
+    (6, '识别结果模型版本及去重索引', [
+        'ALTER TABLE visual_recognition_results ADD COLUMN model_version TEXT',
+        # 回调重试幂等：同一图片、同一模型版本只保存一条结果（旧数据 model_version 为 NULL，不受约束）
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_visual_results_image_model '
+        'ON visual_recognition_results (image_id, model_version)',
+    ]),
+    (7, '识别目标明细表及计数表', _detections),
+    (8, '捕获数量小时汇总表', [
+        # 由 catch_stats.py 增量维护，/api/stats/catches 只读此表
+        '''CREATE TABLE IF NOT EXISTS catch_rollup_hourly (
+            hour TEXT NOT NULL,
+            device_id TEXT NOT NULL,
+            species TEXT NOT NULL,
+            gender TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, device_id, species, gender)
+        )''',
+        # 设备用户：WHERE device_id = ? AND hour 范围
+        'CREATE INDEX IF NOT EXISTS idx_catch_rollup_device_hour ON catch_rollup_hourly (device_id, hour)',
+    ]),
+    (9, '图片大小和内容哈希', [
+        # 上传时流式计算，旧记录为 NULL
+        'ALTER TABLE images ADD COLUMN size INTEGER',
+        'ALTER TABLE images ADD COLUMN sha256 TEXT',
+    ]),
+    (10, '数据保留清理索引', [
+        # 按设备的保留策略：WHERE device_id = ? AND timestamp < ?
+        'CREATE INDEX IF NOT EXISTS idx_sensor_data_device_timestamp ON sensor_data (device_id, timestamp)',
+        # 过期图片连同分析任务一起删除：WHERE image_id IN (...)
+        'CREATE INDEX IF NOT EXISTS idx_analysis_tasks_image ON analysis_tasks (image_id)',
+    ]),
+    (11, '图片路径索引', [
+        # 清理过期图片时检查文件是否仍被其他记录引用：WHERE image_path = ?
+        'CREATE INDEX IF NOT EXISTS idx_images_image_path ON images (image_path)',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """当前数据库结构版本"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )''')
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(db_path=db.DB_PATH, verbose=True):
+    """把数据库升级到最新版本，返回升级后的版本号；多个进程同时调用时只有一个会执行迁移"""
+    with db.connection(db_path) as conn:
+        if current_version(conn) >= SCHEMA_VERSION:
+            conn.commit()
+            return SCHEMA_VERSION
+
+        # BEGIN IMMEDIATE 获取写锁，其他进程在此等待，拿到锁后重新检查版本
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = current_version(conn)
+            for migration_version, name, steps in MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                if callable(steps):
+                    steps(conn)
+                else:
+                    for sql in steps:
+                        conn.execute(sql)
+                conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                             (migration_version, name, time.strftime('%Y-%m-%d %H:%M:%S')))
+                if verbose:
+                    print(f"🗄️  数据库迁移完成: v{migration_version} {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return SCHEMA_VERSION
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else db.DB_PATH
+    print(f"✅ 数据库 {path} 当前版本: v{migrate(path)}")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+游标（keyset）分页工具
+游标是上一页最后一条记录排序键的不透明编码，下一页从该位置之后继续读取，
+不需要 OFFSET 跳过前面的记录，第1000页和第1页的开销相同。
+"""
+
+import base64
+import json
+
+
+def encode_cursor(values):
+    """把排序键编码为 URL 安全的字符串"""
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """解析游标，返回长度为 size 的列表；格式错误时抛出 ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page_result(rows, per_page, key):
+    """
+    rows 为按排序键取出的至多 per_page+1 条记录；
+    返回 (本页记录, 下一页游标或 None)
+    """
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(key(rows[-1])) if has_more and rows else None
+    return rows, next_cursor
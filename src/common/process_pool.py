@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理工作进程池
+每个工作进程启动时调用一次 init(num_threads)（如加载模型、固定 torch 线程数），
+之后循环执行 handler(items) 处理主进程发来的批次。多进程绕开 GIL，
+每个进程只用 num_threads 个计算线程，避免多个进程的线程池互相争抢 CPU。
+
+- 负载均衡：process_batch() 取一个空闲进程执行，所有进程都忙时等待
+- 健康检查：后台线程定期 ping 空闲进程，无响应或已退出则重启
+- 崩溃重启：执行中进程退出或超时时重启该进程，并向调用方抛出 WorkerError
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+
+class WorkerError(Exception):
+    """工作进程崩溃、超时或启动失败"""
+
+
+def _worker_main(conn, init, handler, num_threads):
+    """工作进程入口"""
+    try:
+        if init:
+            init(num_threads)
+        conn.send(('ready', os.getpid()))
+    except Exception as e:
+        conn.send(('failed', f"{type(e).__name__}: {e}"))
+        return
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        kind, payload = message
+        if kind == 'ping':
+            conn.send(('pong', None))
+            continue
+        try:
+            conn.send(('ok', handler(payload)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """一个工作进程及其管道"""
+
+    def __init__(self, ctx, index, init, handler, num_threads, start_timeout):
+        self.ctx = ctx
+        self.index = index
+        self.init = init
+        self.handler = handler
+        self.num_threads = num_threads
+        self.start_timeout = start_timeout
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+
+        # 统计信息
+        self.calls = 0
+        self.errors = 0
+        self.restarts = 0
+        self.total_call_ms = 0.0
+
+    def start(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, name=f"inference-worker-{self.index}", daemon=True,
+                                        args=(child_conn, self.init, self.handler, self.num_threads))
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        kind, payload = self._receive(self.start_timeout)
+        if kind != 'ready':
+            self.kill()
+            raise WorkerError(f"工作进程{self.index}启动失败: {payload}")
+        print(f"✅ 推理工作进程{self.index}已启动，PID {payload}，计算线程 {self.num_threads}")
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def _receive(self, timeout):
+        """等待一条回复；进程退出或超时时抛出 WorkerError"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.kill()
+                raise WorkerError(f"工作进程{self.index}超时（{timeout}秒）")
+            try:
+                if self.conn.poll(min(remaining, 0.5)):
+                    return self.conn.recv()
+            except (EOFError, OSError):
+                pass
+            else:
+                if self.alive():
+                    continue
+            # 管道已关闭或进程已退出；退出前可能已经写入了最后一条回复
+            exitcode = self.process.exitcode
+            self.kill()
+            raise WorkerError(f"工作进程{self.index}已退出（exitcode={exitcode}）")
+
+    def call(self, items, timeout):
+        if not self.alive():
+            raise WorkerError(f"工作进程{self.index}未运行")
+        start = time.perf_counter()
+        try:
+            self.conn.send(('run', items))
+            kind, payload = self._receive(timeout)
+        except (OSError, EOFError) as e:
+            self.kill()
+            raise WorkerError(f"工作进程{self.index}通信失败: {e}")
+        finally:
+            self.calls += 1
+            self.total_call_ms += (time.perf_counter() - start) * 1000
+        if kind == 'error':
+            self.errors += 1
+            raise RuntimeError(payload)
+        return payload
+
+    def ping(self, timeout):
+        self.conn.send(('ping', None))
+        return self._receive(timeout)[0] == 'pong'
+
+    def kill(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        if self.conn is not None:
+            self.conn.close()
+
+    def stop(self, timeout=10):
+        if self.alive():
+            try:
+                self.conn.send(None)
+            except (OSError, EOFError):
+                pass
+            self.process.join(timeout)
+        self.kill()
+
+    def stats(self):
+        return {
+            'index': self.index,
+            'pid': self.process.pid if self.process else None,
+            'alive': self.alive(),
+            'busy': self.lock.locked(),
+            'calls': self.calls,
+            'errors': self.errors,
+            'restarts': self.restarts,
+            'avg_call_ms': round(self.total_call_ms / self.calls, 2) if self.calls else 0,
+        }
+
+
+class InferencePool:
+    """推理工作进程池"""
+
+    def __init__(self, handler, init=None, workers=2, threads_per_worker=None, call_timeout=120,
+                 start_timeout=300, health_interval=30, start_method='spawn'):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.call_timeout = call_timeout
+        self.health_interval = health_interval
+        # 默认 spawn：子进程不继承主进程的线程和 torch/OpenMP 状态。
+        # spawn 的子进程会重新导入主模块（作为 __mp_main__），init / handler 应放在没有导入副作用的模块中，
+        # 主模块中创建进程池、打开数据库等操作放在 if __name__ == '__main__' 之后（见 visual_service.py）
+        ctx = multiprocessing.get_context(start_method)
+        self._workers = [_Worker(ctx, i, init, handler, self.threads_per_worker, start_timeout)
+                         for i in range(workers)]
+        self._idle = queue.Queue()
+        self._stop_event = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        """启动全部工作进程（等待每个进程完成 init）和健康检查线程"""
+        for worker in self._workers:
+            worker.start()
+            self._idle.put(worker)
+        self._monitor = threading.Thread(target=self._health_check_loop, name='inference-health', daemon=True)
+        self._monitor.start()
+        print(f"🔄 推理进程池已启动，{self.workers}个工作进程，每个进程 {self.threads_per_worker} 个计算线程")
+
+    def process_batch(self, items):
+        """在一个空闲工作进程中处理一批任务，返回结果列表"""
+        worker = self._idle.get()
+        try:
+            with worker.lock:
+                try:
+                    return worker.call(items, self.call_timeout)
+                except WorkerError as e:
+                    # 持有锁重启，健康检查不会同时重启同一进程
+                    print(f"❌ {e}，正在重启")
+                    self._restart(worker)
+                    raise
+        finally:
+            self._idle.put(worker)
+
+    def _restart(self, worker):
+        """重启工作进程；调用方必须持有 worker.lock，保证同一进程只被重启一次"""
+        worker.restarts += 1
+        try:
+            worker.kill()
+            worker.start()
+        except Exception as e:
+            # 重启失败时保持停止状态，下一次调用或健康检查时再尝试
+            print(f"❌ 推理工作进程{worker.index}重启失败: {type(e).__name__}: {e}")
+
+    def check_health(self):
+        """ping 当前空闲的工作进程，异常的进程重启；返回重启的进程数"""
+        restarted = 0
+        for worker in self._workers:
+            if not worker.lock.acquire(blocking=False):
+                continue  # 正在执行任务，由 call 自己发现崩溃或超时
+            try:
+                healthy = worker.alive() and worker.ping(timeout=10)
+            except (WorkerError, OSError, EOFError):
+                healthy = False
+            try:
+                if not healthy:
+                    print(f"⚠️  推理工作进程{worker.index}健康检查失败，正在重启")
+                    self._restart(worker)
+                    restarted += 1
+            finally:
+                worker.lock.release()
+        return restarted
+
+    def _health_check_loop(self):
+        while not self._stop_event.wait(self.health_interval):
+            self.check_health()
+
+    def stop(self):
+        self._stop_event.set()
+        for worker in self._workers:
+            with worker.lock:
+                worker.stop()
+        print("⏹️  推理进程池已停止")
+
+    def stats(self):
+        return {
+            'workers': [worker.stats() for worker in self._workers],
+            'threads_per_worker': self.threads_per_worker,
+        }
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web 服务（app.py）的热点查询语句
+集中定义在这里，app.py 和 test_query_plans.py 使用同一份 SQL，修改查询后执行计划测试会检查新语句是否仍然走索引。
+其他模块的查询定义在各自模块中（log_store、analysis_queue、visual_results、catch_stats、retention）。
+"""
+
+# /api/sensor_data：最新 100 条
+SENSOR_DATA_LATEST = "SELECT * FROM sensor_data ORDER BY created_at DESC LIMIT 100"
+SENSOR_DATA_LATEST_DEVICE = "SELECT * FROM sensor_data WHERE device_id=? ORDER BY created_at DESC LIMIT 100"
+
+# /api/devices：每个设备只取最新一张图片，子查询走 (device_id, receive_time) 索引，
+# 开销只与设备数量有关，与图片总数无关；设备用户追加 DEVICE_FILTER
+DEVICES_WITH_LATEST_IMAGE = """
+    SELECT d.device_id, d.name, d.status, d.created_at,
+           i.id, i.image_path, i.original_filename, i.receive_time
+    FROM devices d
+    LEFT JOIN images i ON i.id = (
+        SELECT id FROM images
+        WHERE device_id = d.device_id
+        ORDER BY receive_time DESC, id DESC
+        LIMIT 1
+    )
+"""
+DEVICE_FILTER = " WHERE d.device_id = ?"
+
+# /api/images 页码分页
+IMAGE_COLUMNS = """
+    SELECT i.id, i.image_path, i.original_filename, i.receive_time,
+           i.device_id, d.name as device_name
+    FROM images i
+    LEFT JOIN devices d ON i.device_id = d.device_id
+"""
+IMAGES_PAGE = IMAGE_COLUMNS + " ORDER BY i.receive_time DESC LIMIT ? OFFSET ?"
+IMAGES_PAGE_DEVICE = IMAGE_COLUMNS + " WHERE i.device_id = ? ORDER BY i.receive_time DESC LIMIT ? OFFSET ?"
+IMAGES_COUNT = "SELECT COUNT(*) FROM images"
+IMAGES_COUNT_DEVICE = "SELECT COUNT(*) FROM images WHERE device_id = ?"
+# 管理员的近似总数：按自增ID跨度估算，不扫描
+IMAGES_ID_SPAN = "SELECT COALESCE(MAX(id) - MIN(id) + 1, 0) FROM images"
+
+
+def images_after(device=False, after=False):
+    """
+    /api/images 游标分页：按 (receive_time, id) 倒序，多取一条用于判断是否还有下一页。
+    参数依次为 [设备ID]、[游标 receive_time, id]、条数
+    """
+    conditions = []
+    if device:
+        conditions.append("i.device_id = ?")
+    if after:
+        conditions.append("(i.receive_time, i.id) < (?, ?)")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return IMAGE_COLUMNS + where + " ORDER BY i.receive_time DESC, i.id DESC LIMIT ?"
+
+
+# /data/images/<存储键> 权限检查（filename 列有索引）
+IMAGE_OWNER = "SELECT device_id, sha256 FROM images WHERE filename = ? LIMIT 1"
+
+# /api/visual_results/<image_id>
+VISUAL_RESULT_LATEST = "SELECT * FROM visual_recognition_results WHERE image_id = ? ORDER BY created_at DESC LIMIT 1"
+
+# /api/visual_results/<image_id>/annotated：最新一次成功识别结果的目标框
+ANNOTATION_SOURCE = ("SELECT id, objects FROM visual_recognition_results "
+                     "WHERE image_id = ? AND status = 'success' ORDER BY created_at DESC LIMIT 1")
+
+# 删除设备
+DELETE_DEVICE_IMAGES = "DELETE FROM images WHERE device_id = ?"
+DELETE_DEVICE_USERS = "DELETE FROM users WHERE device_id = ?"
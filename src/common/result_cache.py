@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果缓存
+设备经常重复上传完全相同的图片。以 (图片内容 SHA-256, 模型版本) 为键保存识别结果，
+相同内容再次分析时直接返回缓存结果，不再推理；更换模型后模型版本变化，旧结果自动失效。
+缓存保存在视觉服务自己的 SQLite 文件中，重启后仍然有效。
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from src.common import db
+
+# 计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """分块读取文件计算 SHA-256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """按内容哈希 + 模型版本缓存识别结果"""
+
+    def __init__(self, db_path, model_version=None, max_entries=100000, prune_every=1000):
+        self.db_path = db_path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        with db.transaction(db_path) as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS analysis_cache (
+                content_hash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, model_version)
+            )''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used_at)")
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_ms = 0
+
+    def get(self, content_hash):
+        """返回缓存的识别结果，未命中返回 None"""
+        with db.connection(self.db_path) as conn:
+            row = conn.execute("SELECT result FROM analysis_cache WHERE content_hash = ? AND model_version = ?",
+                               (content_hash, self.model_version)).fetchone()
+            if row:
+                conn.execute("UPDATE analysis_cache SET last_used_at = ? WHERE content_hash = ? AND model_version = ?",
+                             (time.time(), content_hash, self.model_version))
+                conn.commit()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            result = json.loads(row[0])
+            self.hits += 1
+            # 命中节省的时间按该结果原本的推理耗时估算
+            self.saved_ms += result.get('analyze_time', 0) or 0
+            return result
+
+    def put(self, content_hash, result):
+        with db.transaction(self.db_path) as conn:
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO analysis_cache "
+                         "(content_hash, model_version, result, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                         (content_hash, self.model_version, json.dumps(result, ensure_ascii=False), now, now))
+        with self._lock:
+            self.stores += 1
+            prune = self.stores % self.prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """超过 max_entries 时删除最久未使用的结果，返回删除条数"""
+        with db.transaction(self.db_path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+            if count <= self.max_entries:
+                return 0
+            cursor = conn.execute("DELETE FROM analysis_cache WHERE rowid IN ("
+                                  "SELECT rowid FROM analysis_cache ORDER BY last_used_at LIMIT ?)",
+                                  (count - self.max_entries,))
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'model_version': self.model_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'saved_ms': self.saved_ms,
+            }
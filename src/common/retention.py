@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据保留（过期清理）
+按表和设备配置保留天数，后台线程每隔 interval 秒清理一次。每批按时间列索引取出至多 batch_size 行删除，
+一批一个短事务，批与批之间让出写锁，传感器数据写入和回调入库不会被长时间阻塞：
+- sensor_data / device_logs / catch_rollup_hourly：按 rowid 分批删除过期行
+- images：图片文件、缩略图和预览图与 images、visual_recognition_results、detections、detection_counts、
+  analysis_tasks 记录以及标注图缓存一起删除（先提交数据库再删除文件，中断时最多留下没有记录的文件），
+  删除后清理变空的日期目录，不再遍历图片目录；仍被其他图片记录引用的文件（迁移前同名上传的旧记录）保留
+- catch_rollup_hourly 是长期统计数据，默认不随图片删除，可单独配置保留天数
+
+策略：{表名: 保留天数}，None 表示不清理；设备策略 {设备ID: {表名: 保留天数}} 覆盖该设备的默认值。
+
+用法: python3 src/common/retention.py run [数据库路径] [图片目录] [衍生图目录] [标注图目录]   # 按默认策略执行一次
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common import db, image_store
+
+# 可清理的表 -> 时间列（均有以该列开头的索引，以及 (device_id, 时间列) 索引）
+TABLES = {
+    'sensor_data': 'timestamp',
+    'device_logs': 'timestamp',
+    'images': 'receive_time',
+    'catch_rollup_hourly': 'hour',
+}
+
+# 默认保留天数（与原来的每日清理一致：传感器数据和图片保留 7 天）
+DEFAULT_POLICIES = {'sensor_data': 7, 'images': 7, 'device_logs': None, 'catch_rollup_hourly': None}
+
+# 删除图片时一并删除的关联记录
+IMAGE_CHILD_TABLES = ('detections', 'detection_counts', 'visual_recognition_results', 'analysis_tasks')
+
+
+def purge_rows_sql(table, condition=''):
+    """一批过期行的删除语句，参数为 [截止日期, 范围参数..., 条数]"""
+    return (f"DELETE FROM {table} WHERE rowid IN ("
+            f"SELECT rowid FROM {table} WHERE {TABLES[table]} < ?{condition} LIMIT ?)")
+
+
+def expired_images_sql(condition=''):
+    """一批过期图片，参数为 [截止日期, 范围参数..., 条数]"""
+    return f"SELECT id, image_path FROM images WHERE receive_time < ?{condition} ORDER BY receive_time LIMIT ?"
+
+
+def delete_by_image_sql(table, count):
+    """按图片ID删除一批记录（images 表按 id，关联表按 image_id）"""
+    column = 'id' if table == 'images' else 'image_id'
+    return f"DELETE FROM {table} WHERE {column} IN ({', '.join('?' * count)})"
+
+
+# 删除记录后该路径是否已没有图片记录引用（走 image_path 索引）
+UNREFERENCED_PATH_SQL = "SELECT NOT EXISTS (SELECT 1 FROM images WHERE image_path = ?)"
+
+
+def cutoff_day(now, days):
+    """保留 days 天时的截止日期 'YYYY-MM-DD'；各表时间列都以日期开头，按字符串比较"""
+    return (now - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+class RetentionEngine:
+    """按保留策略分批删除过期数据"""
+
+    def __init__(self, db_path=db.DB_PATH, image_root=image_store.IMAGE_ROOT, derivatives=None, policies=None,
+                 device_policies=None, batch_size=500, interval=300, batch_pause=0.05, annotated=None):
+        for table in list(policies or {}) + [t for p in (device_policies or {}).values() for t in p]:
+            if table not in TABLES:
+                raise ValueError(f"不支持的保留策略表: {table}")
+        self.db_path = db_path
+        self.image_root = image_root
+        self.derivatives = derivatives
+        # 标注图缓存（annotated_images.FileCache），键为 <图片ID>-<识别结果ID>.jpg
+        self.annotated = annotated
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self.device_policies = device_policies or {}
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+        # 统计信息：每张表累计删除的行数和释放的文件字节数
+        self.reclaimed = {table: {'rows': 0, 'bytes': 0} for table in TABLES}
+        self.runs = 0
+        self.last_run = None
+        self.last_duration = 0.0
+
+    def scopes(self, table, now=None):
+        """
+        该表的清理范围 [(附加条件, 参数, 截止日期)]：默认策略排除有单独策略的设备，
+        每个设备策略单独一个范围（走 (device_id, 时间列) 索引）
+        """
+        now = now or datetime.now()
+        overrides = {device_id: policy[table] for device_id, policy in self.device_policies.items() if table in policy}
+        scopes = []
+        days = self.policies.get(table)
+        if days is not None:
+            if overrides:
+                scopes.append((f" AND device_id NOT IN ({', '.join('?' * len(overrides))})", list(overrides),
+                               cutoff_day(now, days)))
+            else:
+                scopes.append(("", [], cutoff_day(now, days)))
+        for device_id, days in sorted(overrides.items()):
+            if days is not None:
+                scopes.append((" AND device_id = ?", [device_id], cutoff_day(now, days)))
+        return scopes
+
+    def purge_rows(self, table, now=None):
+        """分批删除表中的过期行，返回删除的行数"""
+        deleted = 0
+        for condition, params, cutoff in self.scopes(table, now):
+            while not self._stopping:
+                with db.transaction(self.db_path) as conn:
+                    count = conn.execute(purge_rows_sql(table, condition),
+                                         [cutoff] + params + [self.batch_size]).rowcount
+                deleted += count
+                if count < self.batch_size:
+                    break
+                time.sleep(self.batch_pause)
+        return deleted
+
+    def purge_images(self, now=None):
+        """分批删除过期图片的记录和文件，返回 (删除的图片数, 释放的字节数)"""
+        deleted = 0
+        freed = 0
+        for condition, params, cutoff in self.scopes('images', now):
+            while not self._stopping:
+                with db.transaction(self.db_path) as conn:
+                    rows = conn.execute(expired_images_sql(condition),
+                                        [cutoff] + params + [self.batch_size]).fetchall()
+                    ids = [row[0] for row in rows]
+                    if ids:
+                        for table in IMAGE_CHILD_TABLES + ('images',):
+                            conn.execute(delete_by_image_sql(table, len(ids)), ids)
+                    # 在同一事务中找出已没有记录引用的文件，未过期的记录可能与过期记录共用同一文件
+                    paths = [path for path in dict.fromkeys(row[1] for row in rows)
+                             if conn.execute(UNREFERENCED_PATH_SQL, (path,)).fetchone()[0]]
+                # 记录已提交后再删除文件
+                for image_path in paths:
+                    freed += self.remove_image_files(image_path)
+                if self.annotated and ids:
+                    freed += self.annotated.remove_prefixes(f"{image_id}-" for image_id in ids)
+                deleted += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+                time.sleep(self.batch_pause)
+        return deleted, freed
+
+    def remove_image_files(self, image_path):
+        """删除原图和衍生图，返回释放的字节数"""
+        freed = 0
+        try:
+            freed += os.path.getsize(image_path)
+            os.remove(image_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️  删除图片文件失败: {image_path}, {e}")
+        image_store.prune_empty_dirs(os.path.dirname(image_path), self.image_root)
+        if self.derivatives:
+            freed += self.derivatives.remove(image_store.key_for(self.image_root, image_path))
+        return freed
+
+    def run_once(self, now=None):
+        """按所有策略清理一遍，返回本次的 {表名: {'rows': 行数, 'bytes': 字节数}}"""
+        start = time.perf_counter()
+        report = {}
+        for table in TABLES:
+            try:
+                if table == 'images':
+                    rows, freed = self.purge_images(now)
+                else:
+                    rows, freed = self.purge_rows(table, now), 0
+            except Exception as e:
+                print(f"❌ 清理 {table} 时出错: {type(e).__name__}: {e}")
+                continue
+            report[table] = {'rows': rows, 'bytes': freed}
+            self.reclaimed[table]['rows'] += rows
+            self.reclaimed[table]['bytes'] += freed
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_duration = time.perf_counter() - start
+        if any(item['rows'] for item in report.values()):
+            summary = '，'.join(f"{table} {item['rows']} 行" for table, item in report.items() if item['rows'])
+            freed = sum(item['bytes'] for item in report.values())
+            print(f"🗑️  过期数据清理: {summary}，释放文件 {freed / (1024 * 1024):.2f} MB，耗时 {self.last_duration:.2f}s")
+        return report
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+        policies = '，'.join(f"{table} {days} 天" for table, days in self.policies.items() if days is not None)
+        print(f"🔄 数据保留清理线程已启动，每 {self.interval} 秒清理一次（{policies}，"
+              f"单独策略设备 {len(self.device_policies)} 个）")
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self.run_once()
+            self._wakeup.wait(self.interval)
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'last_duration_s': round(self.last_duration, 3),
+            'reclaimed': {table: dict(item) for table, item in self.reclaimed.items()},
+        }
+
+
+if __name__ == "__main__":
+    from src.common import migrations
+    from src.common.annotated_images import FileCache
+    from src.common.derivatives import DerivativeStore
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'run':
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) > 2 else db.DB_PATH
+    root = sys.argv[3] if len(sys.argv) > 3 else image_store.IMAGE_ROOT
+    derivatives_root = sys.argv[4] if len(sys.argv) > 4 else '/data/derivatives/'
+    annotated_root = sys.argv[5] if len(sys.argv) > 5 else '/data/annotated/'
+    migrations.migrate(path)
+    # 只用于删除，缓存上限不起作用
+    annotated = FileCache(annotated_root, max_bytes=0)
+    report = RetentionEngine(path, root, DerivativeStore(derivatives_root), annotated=annotated).run_once()
+    for table, item in report.items():
+        print(f"  {table}: {item['rows']} 行，{item['bytes'] / (1024 * 1024):.2f} MB")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据批量写入
+MQTT 回调只负责把解析好的数据放进有界队列，由单独的写入线程攒批：
+每满 batch_size 条或等待 flush_interval 秒后，用 executemany 在一个事务里写入 sensor_data，
+一次提交（一次 fsync）落盘一整批数据。
+入队时可以附带 on_commit 回调，该条数据所在的批次提交成功后由写入线程调用（如向设备发送确认），
+写入失败或进程退出前未写入的数据不会回调。
+写入失败（如清理任务占用写锁超时）时按退避时间重试整批；重试时在同一事务里逐条插入，
+只跳过本身有问题的行，一条坏数据或一次锁超时不会丢掉整批数据。
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from src.common import db
+
+INSERT_SQL = '''INSERT INTO sensor_data (
+            device_id, timestamp, temperature_inside, temperature_outside, humidity,
+            duoj1, duoj2, duoj3, duoj4, feng1, feng2, jia, raw_data
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+# 传感器数据字段（不含 device_id 与 raw_data）
+SENSOR_FIELDS = ('timestamp', 'temperature_inside', 'temperature_outside', 'humidity',
+                 'duoj1', 'duoj2', 'duoj3', 'duoj4', 'feng1', 'feng2', 'jia')
+
+# 单行数据本身有问题（参数个数或类型不对、违反约束）时的异常，重试也不会成功；锁超时等为 OperationalError
+ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError)
+
+# 停止信号
+_STOP = object()
+
+
+def build_sensor_data(device_id, data):
+    """从设备上报的原始数据中提取传感器字段"""
+    sensor_data = {"device_id": device_id}
+    for field in SENSOR_FIELDS:
+        sensor_data[field] = data.get(field, None)
+    if sensor_data['timestamp'] is None:
+        sensor_data['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    return sensor_data
+
+
+def build_row(sensor_data, data):
+    """转换为 INSERT_SQL 的参数元组"""
+    return (sensor_data['device_id'],) + tuple(sensor_data[f] for f in SENSOR_FIELDS) + (json.dumps(data),)
+
+
+class SensorIngest:
+    """sensor_data 批量写入器"""
+
+    def __init__(self, db_path=db.DB_PATH, batch_size=500, flush_interval=0.2,
+                 max_queue=20000, put_timeout=1.0, report_interval=60, retries=3, retry_backoff=0.1):
+        self.db_path = db_path
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.report_interval = report_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.submitted = 0
+        self.inserted = 0
+        self.failed = 0
+        self.retried = 0            # 写入失败后重试的次数
+        self.dropped = 0            # 队列满且等待超时后丢弃的条数
+        self.blocked = 0            # 入队时因队列满而需要等待的次数（背压）
+        self.batches = 0
+        self.max_depth = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        """启动写入线程"""
+        if self._thread is None:
+            # 非守护线程：进程退出前必须等待最后一批数据写完
+            self._thread = threading.Thread(target=self._run, name='sensor-ingest')
+            self._thread.start()
+            print(f"🔄 传感器数据批量写入线程已启动（每批最多{self.batch_size}条，最长等待{int(self.flush_interval * 1000)}ms）")
+
+    def submit(self, row, on_commit=None):
+        """
+        放入一条待写入数据；队列已满时最多等待 put_timeout 秒，仍满则丢弃并返回 False。
+        on_commit 在该条数据提交到数据库后调用（写入线程中执行）
+        """
+        item = (row, on_commit)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.blocked += 1
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                print(f"❌ 传感器数据写入队列已满，丢弃数据 - 设备ID: {row[0]}")
+                return False
+        with self._lock:
+            self.submitted += 1
+            depth = self._queue.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def stop(self, timeout=30):
+        """停止写入线程，队列中剩余数据全部写入后返回"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        print(f"💾 传感器数据写入线程已停止，{self.format_stats()}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'inserted': self.inserted,
+                'failed': self.failed,
+                'retried': self.retried,
+                'dropped': self.dropped,
+                'blocked': self.blocked,
+                'batches': self.batches,
+                'last_batch_size': self.last_batch_size,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"已写入 {s['inserted']} 条 / {s['batches']} 批，队列 {s['queue_depth']}（峰值 {s['max_depth']}），"
+                f"背压 {s['blocked']} 次，丢弃 {s['dropped']} 条，失败 {s['failed']} 条（重试 {s['retried']} 次）")
+
+    def _run(self):
+        last_report = time.monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                break
+
+            # 攒批：满 batch_size 条或到达截止时间即写入
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                print(f"📊 传感器数据写入统计: {self.format_stats()}")
+                last_report = time.monotonic()
+
+        # 退出前写入队列中剩余的数据
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        for i in range(0, len(remaining), self.batch_size):
+            self._flush(remaining[i:i + self.batch_size])
+
+    def _write(self, batch, row_by_row):
+        """在一个事务中写入一批数据，返回成功写入的 (row, on_commit)；逐条写入时跳过有问题的行"""
+        with db.transaction(self.db_path) as conn:
+            if not row_by_row:
+                conn.executemany(INSERT_SQL, [row for row, on_commit in batch])
+                return batch
+            written = []
+            for item in batch:
+                try:
+                    conn.execute(INSERT_SQL, item[0])
+                except ROW_ERRORS as e:
+                    print(f"❌ 传感器数据写入失败，跳过 - 设备ID: {item[0][0]}, {type(e).__name__}: {e}")
+                    continue
+                written.append(item)
+            return written
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                written = self._write(batch, row_by_row=attempt > 0)
+                break
+            except Exception as e:
+                print(f"❌ 批量写入传感器数据失败（{len(batch)}条，第{attempt + 1}次）: {type(e).__name__}: {e}")
+                if attempt == self.retries:
+                    with self._lock:
+                        self.failed += len(batch)
+                    return
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.retry_backoff * 2 ** attempt)
+        with self._lock:
+            self.inserted += len(written)
+            self.failed += len(batch) - len(written)
+            self.batches += 1
+            self.last_batch_size = len(written)
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+        
+        # 已落盘，通知调用方
+        for row, on_commit in written:
+            if on_commit is not None:
+                try:
+                    on_commit()
+                except Exception as e:
+                    print(f"❌ 传感器数据提交回调出错 - 设备ID: {row[0]}, {type(e).__name__}: {e}")
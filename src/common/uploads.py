@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式图片上传
+- receive(): 请求体按固定大小分块写入临时文件，边写边计算 SHA-256，超过上限立即中止，
+  完成后原子改名到目标路径；大小和哈希在写入时得到，不再重新读取文件
+- UploadSessions: 可续传的分块上传，设备网络不稳定时从已收到的偏移继续上传，
+  已收到的数据保存在 <临时目录>/<上传ID>.part，上传信息保存在 <上传ID>.json
+临时目录应与图片目录在同一文件系统，保证改名是原子操作。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# 每次读取请求体的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """上传失败，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def copy_stream(stream, f, digest, limit, chunk_size=CHUNK_SIZE):
+    """把 stream 分块写入 f 并更新 digest，返回写入字节数；超过 limit 时抛出 UploadError(413)"""
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return size
+        size += len(chunk)
+        if size > limit:
+            raise UploadError(f'文件超过大小上限 {limit} 字节', 413)
+        digest.update(chunk)
+        f.write(chunk)
+
+
+def receive(stream, target_path, tmp_dir, max_bytes, chunk_size=CHUNK_SIZE):
+    """流式接收一个完整文件，返回 (字节数, SHA-256)"""
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            size = copy_stream(stream, f, digest, max_bytes, chunk_size)
+        if size == 0:
+            raise UploadError('文件为空')
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return size, digest.hexdigest()
+
+
+class UploadSessions:
+    """可续传的分块上传"""
+
+    def __init__(self, directory, max_bytes, max_age=86400, chunk_size=CHUNK_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.chunk_size = chunk_size
+        # 全局锁只保护下面的状态，网络读取和文件读写都在锁外进行
+        self._lock = threading.Lock()
+        # 正在写入或完成中的上传ID，同一上传同时只允许一个请求写入，cleanup() 跳过这些上传
+        self._active = set()
+        # 上传ID -> (已哈希的字节数, 哈希对象)；进程重启后丢失时从 .part 文件重新计算
+        self._digests = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('上传不存在', 404)
+        base = os.path.join(self.directory, upload_id)
+        return base + '.part', base + '.json'
+
+    def create(self, size, sha256=None, **info):
+        """
+        创建上传，size 为文件总字节数，sha256 为设备计算的哈希（可选，完成时校验），
+        info 为完成时需要的其他信息（如设备ID、文件名）。返回上传ID
+        """
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('size 必须是正整数')
+        if size > self.max_bytes:
+            raise UploadError(f'文件超过大小上限 {self.max_bytes} 字节', 413)
+        self.cleanup()
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({'size': size, 'sha256': sha256, 'info': info, 'created_at': time.time()}, f)
+        return upload_id
+
+    def status(self, upload_id):
+        """返回 (已收到的字节数, 上传信息)"""
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return os.path.getsize(part_path), meta
+        except FileNotFoundError:
+            raise UploadError('上传不存在或已过期', 404)
+
+    def _claim(self, upload_id):
+        """在全局锁内占用上传，返回 (已收到的字节数, 上传信息)；已被其他请求占用时 409"""
+        if upload_id in self._active:
+            raise UploadError('该上传正在写入，请稍后查询偏移后重试', 409)
+        current, meta = self.status(upload_id)
+        self._active.add(upload_id)
+        return current, meta
+
+    def _release(self, upload_id):
+        with self._lock:
+            self._active.discard(upload_id)
+
+    def _digest(self, upload_id, part_path, offset):
+        with self._lock:
+            state = self._digests.get(upload_id)
+        if state and state[0] == offset:
+            return state[1]
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(chunk)
+        return digest
+
+    def append(self, upload_id, offset, stream):
+        """
+        从 offset 处追加一块数据，offset 必须等于已收到的字节数（否则 409，设备应先查询偏移）。
+        返回 (新的偏移, 上传信息)
+        """
+        part_path, meta_path = self._paths(upload_id)
+        # 只在锁内检查并占用偏移，接收数据时不阻塞其他上传
+        with self._lock:
+            current, meta = self._claim(upload_id)
+        try:
+            if offset != current:
+                raise UploadError(f'偏移不一致，服务器已收到 {current} 字节', 409)
+            digest = self._digest(upload_id, part_path, current)
+            with open(part_path, 'ab') as f:
+                try:
+                    written = copy_stream(stream, f, digest, meta['size'] - current, self.chunk_size)
+                except UploadError:
+                    # 超出声明大小的块整块丢弃，保留之前已收到的数据
+                    f.truncate(current)
+                    with self._lock:
+                        self._digests.pop(upload_id, None)
+                    raise UploadError('数据超过上传时声明的大小', 413)
+            with self._lock:
+                self._digests[upload_id] = (current + written, digest)
+            # 按最后一次收到数据的时间判断是否过期
+            os.utime(meta_path)
+            return current + written, meta
+        finally:
+            self._release(upload_id)
+
+    def finish(self, upload_id, target_path):
+        """已收到全部数据时校验哈希并改名到 target_path，返回 (字节数, SHA-256)"""
+        part_path, meta_path = self._paths(upload_id)
+        with self._lock:
+            size, meta = self._claim(upload_id)
+        try:
+            if size != meta['size']:
+                raise UploadError(f'上传未完成：{size}/{meta["size"]} 字节', 409)
+            # 进程重启后需要重新读取 .part 计算哈希，在锁外进行
+            sha256 = self._digest(upload_id, part_path, size).hexdigest()
+            with self._lock:
+                self._digests.pop(upload_id, None)
+            if meta.get('sha256') and meta['sha256'].lower() != sha256:
+                self._remove(part_path, meta_path)
+                raise UploadError('SHA-256 校验失败，请重新上传', 422)
+            os.replace(part_path, target_path)
+            self._remove(meta_path)
+            return size, sha256
+        finally:
+            self._release(upload_id)
+
+    def _remove(self, *paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def cleanup(self):
+        """
+        删除超过 max_age 没有收到数据的上传（以及 receive() 中断留下的临时文件），返回删除的上传数；
+        正在写入的上传不删除
+        """
+        removed = 0
+        deadline = time.time() - self.max_age
+        with self._lock, os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    expired = entry.stat().st_mtime < deadline
+                except FileNotFoundError:
+                    continue
+                if not expired:
+                    continue
+                if entry.name.endswith('.json'):
+                    upload_id = entry.name[:-5]
+                    if upload_id in self._active:
+                        continue
+                    self._remove(entry.path, os.path.join(self.directory, upload_id + '.part'))
+                    self._digests.pop(upload_id, None)
+                    removed += 1
+                elif entry.name.endswith('.tmp'):
+                    self._remove(entry.path)
+        return removed
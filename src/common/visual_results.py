@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视觉识别结果入库
+/api/callback（单条）和 /api/callback/batch（批量）共用：在一个事务中写入 visual_recognition_results
+并更新分析任务状态。按 (image_id, model_version) 去重，视觉服务重试回调不会产生重复记录：
+- 已有成功结果时忽略重复的回调
+- 已有失败结果时用新结果覆盖（如重新分析成功）
+同时把识别目标拆分写入 detections 明细表和 detection_counts 计数表（表结构见 migrations.py），
+按种类、性别、设备、日期的统计直接用 SQL 聚合，不再逐行解析 objects JSON。
+JSON 列保留给 /api/visual_results 和标注图使用。捕获数量汇总表的增量更新见 catch_stats.py。
+
+用法: python3 src/common/visual_results.py backfill [数据库路径]   # 为旧结果回填明细
+"""
+
+import os
+import sys
+import json
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common import analysis_queue, catch_stats, db
+
+# 回填时每个事务处理的结果条数
+BACKFILL_CHUNK_SIZE = 1000
+
+# 热点查询（test_query_plans.py 检查执行计划）
+# 写入后取结果ID
+RESULT_ID_SQL = ("SELECT id FROM visual_recognition_results WHERE image_id = ? AND model_version IS ? "
+                 "ORDER BY id DESC LIMIT 1")
+# 替换一条结果的目标明细
+DELETE_DETECTIONS_SQL = "DELETE FROM detections WHERE result_id = ?"
+DELETE_COUNTS_SQL = "DELETE FROM detection_counts WHERE result_id = ?"
+# 回填：按ID顺序取未处理的结果
+BACKFILL_SQL = ("SELECT id, image_id, objects FROM visual_recognition_results "
+                "WHERE id > ? AND detections_indexed = 0 ORDER BY id LIMIT ?")
+
+
+def _row(data):
+    result = data.get('result') or {}
+    return (
+        data.get('image_id'),
+        data.get('status'),
+        data.get('model_version'),
+        result.get('total_count'),
+        result.get('analyze_time'),
+        json.dumps(result.get('species_count', {})),
+        json.dumps(result.get('gender_count', {})),
+        json.dumps(result.get('objects', [])),
+    )
+
+
+def index_detections(conn, result_id, image_id, objects):
+    """在调用方的事务中写入（替换）一条识别结果的目标明细和计数"""
+    conn.execute(DELETE_DETECTIONS_SQL, (result_id,))
+    conn.execute(DELETE_COUNTS_SQL, (result_id,))
+    rows = []
+    counts = {}
+    for obj in objects:
+        x, y, w, h = (list(obj.get('bbox') or []) + [None] * 4)[:4]
+        species = obj.get('species', '普通蚊子')
+        gender = obj.get('gender', '未知')
+        rows.append((result_id, image_id, obj.get('class'), species, gender, obj.get('confidence'), x, y, w, h))
+        counts[(species, gender)] = counts.get((species, gender), 0) + 1
+    conn.executemany("INSERT INTO detections (result_id, image_id, class, species, gender, confidence, x, y, w, h) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO detection_counts (result_id, image_id, species, gender, count) VALUES (?, ?, ?, ?, ?)",
+                     [(result_id, image_id, species, gender, count) for (species, gender), count in counts.items()])
+    conn.execute("UPDATE visual_recognition_results SET detections_indexed = 1 WHERE id = ?", (result_id,))
+
+
+def store(conn, results):
+    """
+    在调用方的事务中保存一批回调结果，返回实际写入（新增或覆盖）的结果列表；
+    缺少 image_id 或 status 的结果跳过
+    """
+    stored = []
+    for data in results:
+        image_id = data.get('image_id')
+        status = data.get('status')
+        if image_id is None or not status:
+            print(f"⚠️  忽略无效的识别结果: {data}")
+            continue
+        analysis_queue.complete(conn, image_id, status == 'success', data.get('error'))
+        before = catch_stats.image_counts(conn, image_id)
+        cursor = conn.execute('''
+        INSERT INTO visual_recognition_results
+        (image_id, status, model_version, total_count, analyze_time, species_count, gender_count, objects)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (image_id, model_version) DO UPDATE SET
+            status = excluded.status,
+            total_count = excluded.total_count,
+            analyze_time = excluded.analyze_time,
+            species_count = excluded.species_count,
+            gender_count = excluded.gender_count,
+            objects = excluded.objects,
+            created_at = CURRENT_TIMESTAMP
+        WHERE visual_recognition_results.status != 'success'
+        ''', _row(data))
+        if cursor.rowcount:
+            result_id = conn.execute(RESULT_ID_SQL, (image_id, data.get('model_version'))).fetchone()[0]
+            index_detections(conn, result_id, image_id, (data.get('result') or {}).get('objects') or [])
+            catch_stats.apply_change(conn, image_id, before, catch_stats.image_counts(conn, image_id))
+            stored.append(data)
+    return stored
+
+
+def backfill(db_path=db.DB_PATH, chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    为迁移前保存的结果写入目标明细，每 chunk_size 条一个事务，不长时间占用写锁；
+    中断后重新运行会跳过已处理的结果。返回处理的结果条数
+    """
+    done = 0
+    last_id = 0
+    while True:
+        with db.transaction(db_path) as conn:
+            rows = conn.execute(BACKFILL_SQL, (last_id, chunk_size)).fetchall()
+            for result_id, image_id, objects in rows:
+                try:
+                    parsed = json.loads(objects) if objects else []
+                except ValueError:
+                    print(f"⚠️  识别结果 {result_id} 的 objects 不是有效JSON，按无目标处理")
+                    parsed = []
+                index_detections(conn, result_id, image_id, parsed)
+        if not rows:
+            return done
+        done += len(rows)
+        last_id = rows[-1][0]
+        print(f"📥 已回填 {done} 条识别结果（至ID {last_id}）")
+
+
+if __name__ == "__main__":
+    from src.common import migrations
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'backfill':
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) > 2 else db.DB_PATH
+    migrations.migrate(path)
+    print(f"✅ 共回填 {backfill(path)} 条识别结果")
@@ -0,0 +1,102 @@
+import requests
+import time
+import os
+import sys
+import signal
+
+# 项目根目录加入模块搜索路径，以便导入共享模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import analysis_queue, db, migrations
+
+class AnalysisDispatcher:
+    """
+    图片分析任务调度服务
+    从 analysis_tasks 表中按优先级取出任务提交给视觉服务，
+    Web 请求只负责入队，不再同步调用视觉服务
+    """
+    def __init__(self):
+        # 配置
+        self.DB_PATH = "./iot.db"
+        self.VISUAL_SERVICE_URL = "http://localhost:8000/api/analyze"
+        self.CALLBACK_URL = "http://localhost:5000/api/callback"
+        self.POLL_INTERVAL = 1  # 没有任务时的轮询间隔（秒）
+        self.CLAIM_BATCH = 16  # 每轮最多取出的任务数
+        self.MAX_RUNNING = 64  # 同时在视觉服务中的任务上限，避免视觉服务队列溢出
+        self.RUNNING_TIMEOUT = 600  # 提交后超过该时间仍未回调的任务重新排队（秒）
+        self.MAX_ATTEMPTS = analysis_queue.MAX_ATTEMPTS  # 每个任务最多尝试次数
+        self.REQUEST_TIMEOUT = 10  # 调用视觉服务的超时（秒）
+        self.STATS_INTERVAL = 60  # 统计信息输出间隔（秒）
+
+        # 复用连接的 HTTP 会话
+        self.session = requests.Session()
+
+        # 统计信息
+        self.submitted = 0
+        self.submit_failures = 0
+        self.requeued = 0
+
+        # 初始化数据库
+        migrations.migrate(self.DB_PATH)
+
+    def submit(self, task_id, image_id, image_path):
+        """提交一个任务给视觉服务，失败时按退避时间重新排队"""
+        payload = {
+            'image_id': image_id,
+            'image_path': image_path,
+            'callback_url': self.CALLBACK_URL
+        }
+        try:
+            response = self.session.post(self.VISUAL_SERVICE_URL, json=payload, timeout=self.REQUEST_TIMEOUT)
+            if response.status_code == 200:
+                self.submitted += 1
+                return True
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.RequestException as e:
+            error = f"{type(e).__name__}: {e}"
+        self.submit_failures += 1
+        print(f"⚠️  提交分析任务失败: 图片 {image_id}, {error}")
+        analysis_queue.retry_later(self.DB_PATH, task_id, error, self.MAX_ATTEMPTS)
+        return False
+
+    def run_once(self):
+        """执行一轮调度，返回提交的任务数"""
+        self.requeued += analysis_queue.requeue_stale(self.DB_PATH, self.RUNNING_TIMEOUT, self.MAX_ATTEMPTS)
+        tasks = analysis_queue.claim(self.DB_PATH, self.CLAIM_BATCH, self.MAX_RUNNING)
+        submitted = 0
+        for i, (task_id, image_id, image_path) in enumerate(tasks):
+            if not self.submit(task_id, image_id, image_path):
+                # 视觉服务不可用或繁忙：本轮剩余任务原样放回队列，等下一轮再试
+                analysis_queue.release(self.DB_PATH, [task[0] for task in tasks[i + 1:]])
+                break
+            submitted += 1
+        return submitted
+
+    def run(self):
+        """启动调度循环"""
+        print("🚀 图片分析调度服务已启动")
+        last_report = time.time()
+        try:
+            while True:
+                try:
+                    if not self.run_once():
+                        time.sleep(self.POLL_INTERVAL)
+                except Exception as e:
+                    print(f"❌ 调度出错: {type(e).__name__}: {e}")
+                    time.sleep(self.POLL_INTERVAL)
+
+                if time.time() - last_report >= self.STATS_INTERVAL:
+                    last_report = time.time()
+                    counts = analysis_queue.stats(self.DB_PATH)
+                    print(f"📊 分析任务: 排队 {counts['queued']}，进行中 {counts['running']}，完成 {counts['done']}，"
+                          f"失败 {counts['failed']}；已提交 {self.submitted}，提交失败 {self.submit_failures}，"
+                          f"超时重排 {self.requeued}")
+        except KeyboardInterrupt:
+            print("⏹️  图片分析调度服务已停止")
+        finally:
+            db.close_all()
+
+if __name__ == "__main__":
+    # systemd 停止服务时发送 SIGTERM，转换为正常退出
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    dispatcher = AnalysisDispatcher()
+    dispatcher.run()
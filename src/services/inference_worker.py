@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视觉识别推理工作进程
+由 visual_service 的推理进程池在每个工作进程中加载：
+init() 加载一次模型并固定计算线程数，infer() 对一批图片推理并格式化结果。
+
+推理后端：
+- torch:     直接运行 best.pt
+- onnx:      best.pt 导出为 best.onnx，用 ONNX Runtime 推理
+- onnx-int8: 在 onnx 基础上做动态 INT8 量化（best.int8.onnx）
+三种后端都通过 ultralytics 加载，前处理、NMS 和结果格式完全相同。导出只需一次：
+python3 src/services/inference_worker.py export [onnx|onnx-int8] [模型路径]
+（visual_service 启动时也会在启动工作进程之前自动导出）
+"""
+
+import os
+import sys
+import time
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.common.result_cache import file_sha256
+
+# 模型文件路径
+MODEL_PATH = '/home/ubuntu/Intelligent-mosquito-catching-device/models/best.pt'
+
+# 推理后端
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+# --- 标签映射字典 ---#
+# 将模型输出的标签映射到对应的中文
+label_mapping = {
+    "BWYC": "白纹伊蚊雌",
+    "BWYX": "白纹伊蚊雄",
+    "DSKC": "淡色库蚊雌",
+    "DSKX": "淡色库蚊雄",
+    "PCMC": "膨橱毛纹雌",
+    "PCMX": "膨橱毛纹雄",
+    "SRAC": "骚扰阿纹雌",
+    "SRAX": "骚扰阿蚊雄",
+    "YWC": "小摇蚊雌",
+    "YWX": "小摇蚊雄",
+    "ZJKC": "致卷库蚊雌",
+    "ZJKX": "致卷库蚊雄"
+}
+
+# 每个工作进程各自持有一个模型实例
+model = None
+
+def model_version(model_path=MODEL_PATH, backend='torch'):
+    """模型版本：模型文件内容哈希 + 推理后端，用作识别结果缓存和回调的版本号"""
+    return f"{file_sha256(model_path)[:12]}-{backend}"
+
+def exported_path(model_path, backend):
+    """后端对应的模型文件路径"""
+    base = os.path.splitext(model_path)[0]
+    return {'torch': model_path, 'onnx': base + '.onnx', 'onnx-int8': base + '.int8.onnx'}[backend]
+
+def export_model(model_path=MODEL_PATH, backend='onnx'):
+    """把 .pt 导出为后端所需的模型文件；已导出且不比 .pt 旧时直接返回"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的推理后端: {backend}")
+    target = exported_path(model_path, backend)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(model_path):
+        return target
+    
+    if backend == 'onnx':
+        from ultralytics import YOLO
+        print(f"正在导出 ONNX 模型: {target}")
+        # dynamic=True 支持任意批大小
+        exported = YOLO(model_path).export(format='onnx', dynamic=True, simplify=True)
+        if os.path.abspath(exported) != os.path.abspath(target):
+            os.replace(exported, target)
+    elif backend == 'onnx-int8':
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        source = export_model(model_path, 'onnx')
+        print(f"正在量化 INT8 模型: {target}")
+        quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+    return target
+
+def _pin_onnx_threads(onnx_path, num_threads):
+    """
+    ultralytics 创建的 ONNX Runtime 会话默认使用全部核心，
+    预热一次让会话创建出来后，按分到的线程数重建会话
+    """
+    import numpy as np
+    import onnxruntime
+    
+    model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+    backend = model.predictor.model
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = num_threads
+    options.inter_op_num_threads = 1
+    backend.session = onnxruntime.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+def init(num_threads, model_path=MODEL_PATH, backend='torch'):
+    """工作进程启动时调用：固定计算线程数并加载模型"""
+    global model
+    import torch
+    from ultralytics import YOLO
+    
+    # 每个进程只用分到的线程数，避免多个进程的线程池争抢 CPU
+    torch.set_num_threads(num_threads)
+    
+    # --- 1. 加载你训练好的模型 ---
+    # 在进程启动时加载模型，不要放在推理函数里，否则每次请求都会卡顿
+    print(f"正在加载模型（{backend}）...")
+    path = export_model(model_path, backend) if backend != 'torch' else model_path
+    model = YOLO(path, task='detect')
+    if backend != 'torch':
+        try:
+            _pin_onnx_threads(path, num_threads)
+        except Exception as e:
+            print(f"⚠️  ONNX Runtime 线程数设置失败，使用默认线程数: {e}")
+    print("模型加载完成！")
+
+def parse_label(class_name):
+    """模型标签 -> (中文标签, 蚊子种类, 雌雄)"""
+    # 使用标签映射字典将英文标签转化为中文
+    chinese_label = label_mapping.get(class_name, class_name)  # 如果没有映射，使用原标签
+    
+    # 从中文标签中提取种类和雌雄信息
+    # 初始化种类和雌雄信息
+    mosquito_species = "普通蚊子"  # 默认值
+    mosquito_gender = "未知"      # 默认值
+    
+    # 提取种类信息（去掉最后一个字，因为最后一个字通常是性别）
+    if len(chinese_label) > 1:
+        mosquito_species = chinese_label[:-1]  # 去掉最后一个字
+        # 提取雌雄信息（最后一个字）
+        last_char = chinese_label[-1]
+        if last_char == "雌":
+            mosquito_gender = "雌性"
+        elif last_char == "雄":
+            mosquito_gender = "雄性"
+    return chinese_label, mosquito_species, mosquito_gender
+
+def format_result(result, analyze_time):
+    """把一张图的 YOLO 结果格式化为回调中的 result 字段"""
+    objects_list = []
+    
+    # 遍历识别到的每一个物体
+    for box in result.boxes:
+        # 获取类别名称 (例如 'mosquito')
+        class_id = int(box.cls[0])
+        class_name = model.names[class_id]
+        
+        # 获取置信度
+        confidence = float(box.conf[0])
+        
+        # 获取坐标 (YOLO默认返回 x1, y1, x2, y2)
+        x1, y1, x2, y2 = box.xyxy[0].tolist()
+        
+        # 转换为前端需要的格式 [x, y, width, height] (左上角坐标 + 宽高)
+        x = int(x1)
+        y = int(y1)
+        w = int(x2 - x1)
+        h = int(y2 - y1)
+        
+        # --- 添加蚊子种类和雌雄识别 ---
+        chinese_label, mosquito_species, mosquito_gender = parse_label(class_name)
+        
+        obj_data = {
+            "class": class_name,  # 原始标签
+            "chinese_class": chinese_label,  # 中文标签
+            "confidence": round(confidence, 2),
+            "bbox": [x, y, w, h],
+            "type": "adult",  # 如果你的模型没有分公母，这里可以是固定值或后续逻辑判断
+            "species": mosquito_species,  # 蚊子种类
+            "gender": mosquito_gender     # 蚊子雌雄
+        }
+        objects_list.append(obj_data)
+    
+    # 统计不同种类和性别的蚊子数量
+    species_count = {}
+    gender_count = {}
+    
+    for obj in objects_list:
+        # 统计种类
+        species = obj.get("species", "普通蚊子")
+        species_count[species] = species_count.get(species, 0) + 1
+        
+        # 统计性别
+        gender = obj.get("gender", "未知")
+        gender_count[gender] = gender_count.get(gender, 0) + 1
+    
+    return {
+        "objects": objects_list,
+        "total_count": len(objects_list),
+        "species_count": species_count,  # 不同种类的数量
+        "gender_count": gender_count,    # 不同性别的数量
+        "analyze_time": analyze_time
+    }
+
+def infer(image_paths):
+    """
+    对一批图片执行一次批量推理，返回与 image_paths 一一对应的结果
+    同一批图片共用一次推理，analyze_time 为整批的推理耗时
+    """
+    start_time = time.time()
+    
+    # --- 2. 使用模型进行预测 ---
+    # conf=0.3 表示置信度大于 0.3 才算识别到；传入图片列表时 YOLO 按批推理
+    # save=False：只需要检测框数据，标注图由 Web 服务按需绘制（/api/visual_results/<id>/annotated）
+    results = model(image_paths, conf=0.3, save=False, verbose=False)
+    
+    analyze_time = int((time.time() - start_time) * 1000) # 毫秒
+    return [format_result(result, analyze_time) for result in results]
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'export':
+        print(__doc__)
+        sys.exit(1)
+    backend = sys.argv[2] if len(sys.argv) > 2 else 'onnx'
+    path = sys.argv[3] if len(sys.argv) > 3 else MODEL_PATH
+    print(f"✅ 已导出: {export_model(path, backend)}")
@@ -1,7 +1,12 @@
 import paho.mqtt.client as mqtt
 import json
-import sqlite3
 import time
+import os
+import sys
+
+# 项目根目录加入模块搜索路径，以便导入共享模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db, migrations
 
 # 配置
 MQTT_BROKER = "localhost" 
@@ -9,29 +14,9 @@ MQTT_PORT = 1883
 SENSOR_TOPIC = "control/sensor_data/+"
 DB_PATH = "./iot.db"
 
-# 初始化数据库
+# 初始化数据库（创建/升级表结构）
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS sensor_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id TEXT NOT NULL,
-                timestamp TEXT,
-                temperature_inside REAL,
-                temperature_outside REAL,
-                humidity REAL,
-                duoj1 INTEGER,
-                duoj2 INTEGER,
-                duoj3 INTEGER,
-                duoj4 INTEGER,
-                feng1 INTEGER,
-                feng2 INTEGER,
-                jia INTEGER,
-                raw_data TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )''')
-    conn.commit()
-    conn.close()
+    migrations.migrate(DB_PATH)
 
 # 连接回调函数
 def on_connect(client, userdata, flags, rc):
@@ -53,7 +38,7 @@ def on_message(client, userdata, msg):
         print(f"📩 收到传感器数据 - 设备ID: {device_id}")
         
         # 保存数据到数据库
-        conn = sqlite3.connect(DB_PATH)
+        conn = db.connect(DB_PATH)
         c = conn.cursor()
         
         # 准备数据
@@ -104,4 +89,6 @@ try:
 except KeyboardInterrupt:
     print("⏹️  MQTT接收器已停止")
 except Exception as e:
-    print(f"💥 MQTT接收器意外停止: {e}")
\ No newline at end of file
+    print(f"💥 MQTT接收器意外停止: {e}")
+finally:
+    db.close_all()
@@ -1,140 +1,99 @@
 from flask import Flask, request, jsonify
-from ultralytics import YOLO
-import requests
-import time
-import threading
+import functools
+import os
+import sys
+
+# 项目根目录加入模块搜索路径，以便导入共享模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.callback_outbox import CallbackOutbox
+from src.common.micro_batcher import MicroBatcher
+from src.common.process_pool import InferencePool
+from src.common.result_cache import ResultCache, file_sha256
+from src.services import inference_worker
 
 app = Flask(__name__)
 
-# --- 标签映射字典 ---#
-# 将模型输出的标签映射到对应的中文
-label_mapping = {
-    "BWYC": "白纹伊蚊雌",
-    "BWYX": "白纹伊蚊雄",
-    "DSKC": "淡色库蚊雌",
-    "DSKX": "淡色库蚊雄",
-    "PCMC": "膨橱毛纹雌",
-    "PCMX": "膨橱毛纹雄",
-    "SRAC": "骚扰阿纹雌",
-    "SRAX": "骚扰阿蚊雄",
-    "YWC": "小摇蚊雌",
-    "YWX": "小摇蚊雄",
-    "ZJKC": "致卷库蚊雌",
-    "ZJKX": "致卷库蚊雄"
-}
-
-# --- 1. 加载你训练好的模型 ---
-# 建议在服务启动时就加载模型，不要放在接口函数里，否则每次请求都会卡顿
-print("正在加载模型...")
-model = YOLO('/home/ubuntu/Intelligent-mosquito-catching-device/models/best.pt')  # 模型文件路径
-print("模型加载完成！")
-
-def run_inference_and_callback(image_path, image_id, callback_url):
-    """
-    后台执行推理任务，并在完成后通过 Webhook 回调主服务器
-    """
-    try:
-        start_time = time.time()
-        
-        # --- 2. 使用模型进行预测 ---
-        # conf=0.5 表示置信度大于 0.5 才算识别到
-        # save=False 因为我们只需要数据，不需要保存画好框的图
-        results = model(image_path, conf=0.3, save=True) 
-        
-        # --- 3. 格式化结果 ---
-        # YOLOv8 可能返回多张图的结果（如果传入的是列表），这里我们只处理一张
-        result = results[0]
-        
-        objects_list = []
-        
-        # 遍历识别到的每一个物体
-        for box in result.boxes:
-            # 获取类别名称 (例如 'mosquito')
-            class_id = int(box.cls[0])
-            class_name = model.names[class_id]
-            
-            # 获取置信度
-            confidence = float(box.conf[0])
-            
-            # 获取坐标 (YOLO默认返回 x1, y1, x2, y2)
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            
-            # 转换为前端需要的格式 [x, y, width, height] (左上角坐标 + 宽高)
-            x = int(x1)
-            y = int(y1)
-            w = int(x2 - x1)
-            h = int(y2 - y1)
-            
-            # --- 添加蚊子种类和雌雄识别 ---
-            # 使用标签映射字典将英文标签转化为中文
-            chinese_label = label_mapping.get(class_name, class_name)  # 如果没有映射，使用原标签
-            
-            # 从中文标签中提取种类和雌雄信息
-            # 初始化种类和雌雄信息
-            mosquito_species = "普通蚊子"  # 默认值
-            mosquito_gender = "未知"      # 默认值
-            
-            # 提取种类信息（去掉最后一个字，因为最后一个字通常是性别）
-            if len(chinese_label) > 1:
-                mosquito_species = chinese_label[:-1]  # 去掉最后一个字
-                # 提取雌雄信息（最后一个字）
-                last_char = chinese_label[-1]
-                if last_char == "雌":
-                    mosquito_gender = "雌性"
-                elif last_char == "雄":
-                    mosquito_gender = "雄性"
-            
-            obj_data = {
-                "class": class_name,  # 原始标签
-                "chinese_class": chinese_label,  # 中文标签
-                "confidence": round(confidence, 2),
-                "bbox": [x, y, w, h],
-                "type": "adult",  # 如果你的模型没有分公母，这里可以是固定值或后续逻辑判断
-                "species": mosquito_species,  # 蚊子种类
-                "gender": mosquito_gender     # 蚊子雌雄
-            }
-            objects_list.append(obj_data)
-
-        # 构造最终 JSON
-        analyze_time = int((time.time() - start_time) * 1000) # 毫秒
-        
-        # 统计不同种类和性别的蚊子数量
-        species_count = {}
-        gender_count = {}
-        
-        for obj in objects_list:
-            # 统计种类
-            species = obj.get("species", "普通蚊子")
-            species_count[species] = species_count.get(species, 0) + 1
-            
-            # 统计性别
-            gender = obj.get("gender", "未知")
-            gender_count[gender] = gender_count.get(gender, 0) + 1
-        
+# --- 批量推理配置 ---
+BATCH_SIZE = 8         # 每批最多推理的图片数
+BATCH_WAIT_MS = 50     # 凑批最长等待时间（毫秒）
+QUEUE_SIZE = 256       # 待推理队列上限，超过后 /api/analyze 返回 503
+
+# --- 推理进程池配置 ---
+INFERENCE_WORKERS = 2      # 推理工作进程数，每个进程加载一份模型
+THREADS_PER_WORKER = None  # 每个进程的 torch 计算线程数，None 表示 CPU 核数平均分配
+INFERENCE_TIMEOUT = 120    # 单批推理超时（秒），超时的工作进程会被重启
+INFERENCE_BACKEND = 'torch'  # 推理后端：torch / onnx / onnx-int8（见 inference_worker.py）
+
+# --- 识别结果缓存配置 ---
+CACHE_DB_PATH = './visual_cache.db'  # 按图片内容哈希缓存识别结果
+CACHE_MAX_ENTRIES = 100000           # 超过后删除最久未使用的结果
+
+# --- 回调投递配置 ---
+CALLBACK_BATCH_SIZE = 50        # 积压时每个回调请求最多合并的结果数（发送到 <callback_url>/batch）
+CALLBACK_TIMEOUT = (3, 10)      # 回调的连接/读取超时（秒）
+CALLBACK_MAX_BACKOFF = 300      # 回调失败后重试间隔上限（秒），从 1 秒开始指数增长
+
+def infer_batch(jobs):
+    """在推理进程池中对一批任务执行一次批量推理，返回与 jobs 一一对应的结果"""
+    return pool.process_batch([job['image_path'] for job in jobs])
+
+def success_payload(image_id, result, cached=False):
+    return {
+        "image_id": image_id,
+        "status": "success",
+        "model_version": result_cache.model_version,
+        "cached": cached,
+        "result": result
+    }
+
+def on_inference_done(job, result, error):
+    """推理完成（由推理线程调用），结果写入回调发件箱，推理线程立即处理下一批"""
+    if error is None:
+        if job['content_hash']:
+            try:
+                result_cache.put(job['content_hash'], result)
+            except Exception as e:
+                print(f"保存识别结果缓存失败: {e}")
+        payload = success_payload(job['image_id'], result)
+        print(f"识别完成，正在回调: {job['callback_url']}")
+    else:
+        print(f"识别出错: {error}")
+        # 出错也回调通知主服务
         payload = {
-            "image_id": image_id,
-            "status": "success",
-            "result": {
-                "objects": objects_list,
-                "total_count": len(objects_list),
-                "species_count": species_count,  # 不同种类的数量
-                "gender_count": gender_count,    # 不同性别的数量
-                "analyze_time": analyze_time
-            }
+            "image_id": job['image_id'],
+            "status": "failed",
+            "model_version": result_cache.model_version,
+            "error": str(error)
         }
+    outbox.add(job['callback_url'], payload)
 
-        # --- 4. 回调主服务器 (Callback) ---
-        print(f"识别完成，正在回调: {callback_url}")
-        requests.post(callback_url, json=payload)
+# 推理进程池、推理队列、结果缓存和回调发件箱由 create_services() 在主进程中创建。
+# 工作进程以 spawn 方式启动时会把本文件作为 __mp_main__ 重新导入，模块顶层不能打开数据库或创建进程池，
+# 否则每个工作进程都会多出一份；工作进程只需要 inference_worker 中的 init / infer
+pool = None
+batcher = None
+result_cache = None
+outbox = None
 
-    except Exception as e:
-        print(f"识别出错: {e}")
-        # 出错也可以回调通知主服务
-        requests.post(callback_url, json={
-            "image_id": image_id, 
-            "status": "failed", 
-            "error": str(e)
-        })
+def create_services():
+    """创建推理进程池、推理队列、结果缓存和回调发件箱（只在主进程中调用）"""
+    global pool, batcher, result_cache, outbox
+    
+    # 推理进程池：模型只在工作进程中加载，主进程只负责接收请求和回调
+    pool = InferencePool(inference_worker.infer, workers=INFERENCE_WORKERS,
+                         init=functools.partial(inference_worker.init, backend=INFERENCE_BACKEND),
+                         threads_per_worker=THREADS_PER_WORKER, call_timeout=INFERENCE_TIMEOUT)
+    
+    # 每个工作进程对应一个推理线程，从有界队列中按批取任务，空闲的进程先取
+    batcher = MicroBatcher(infer_batch, max_batch_size=BATCH_SIZE, max_wait=BATCH_WAIT_MS / 1000,
+                           max_queue=QUEUE_SIZE, workers=INFERENCE_WORKERS, name='inference')
+    
+    # 模型版本在启动时计算（见 __main__），换模型后旧的缓存结果不会被使用
+    result_cache = ResultCache(CACHE_DB_PATH, max_entries=CACHE_MAX_ENTRIES)
+    
+    # 识别结果先持久化再投递，主服务重启期间的结果在其恢复后补发
+    outbox = CallbackOutbox(CACHE_DB_PATH, batch_size=CALLBACK_BATCH_SIZE, timeout=CALLBACK_TIMEOUT,
+                            max_backoff=CALLBACK_MAX_BACKOFF)
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
@@ -149,15 +108,41 @@ def analyze():
     if not image_path or not callback_url:
         return jsonify({"error": "Missing parameters"}), 400
 
-    # 使用线程异步处理，让接口立即返回，不阻塞主服务
-    thread = threading.Thread(
-        target=run_inference_and_callback, 
-        args=(image_path, image_id, callback_url)
-    )
-    thread.start()
+    # 相同内容的图片已经识别过时直接回调缓存的结果，不再推理
+    try:
+        content_hash = file_sha256(image_path)
+    except OSError:
+        # 文件读取失败交给推理流程，按识别出错回调
+        content_hash = None
+    if content_hash:
+        cached = result_cache.get(content_hash)
+        if cached is not None:
+            outbox.add(callback_url, success_payload(image_id, cached, cached=True))
+            return jsonify({"message": "Task completed from cache"})
+
+    # 放入推理队列后立即返回，不阻塞主服务
+    job = {'image_id': image_id, 'image_path': image_path, 'callback_url': callback_url,
+           'content_hash': content_hash}
+    if not batcher.submit(job, lambda result, error: on_inference_done(job, result, error)):
+        return jsonify({"error": "Inference queue is full, please retry later"}), 503
 
     return jsonify({"message": "Task received, processing started..."})
 
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """推理队列统计：队列深度、批大小分布、单张图片延迟（入队到推理完成）、各工作进程状态、结果缓存命中率、
+    回调积压数和投递延迟（结果产生到主服务确认）"""
+    return jsonify({'queue': batcher.stats(), 'pool': pool.stats(), 'cache': result_cache.stats(),
+                    'callbacks': outbox.stats()})
+
 if __name__ == '__main__':
+    create_services()
+    # 导出模型只在主进程中做一次，避免多个工作进程同时导出
+    inference_worker.export_model(inference_worker.MODEL_PATH, INFERENCE_BACKEND)
+    result_cache.model_version = inference_worker.model_version(inference_worker.MODEL_PATH, INFERENCE_BACKEND)
+    pool.start()
+    batcher.start()
+    outbox.start()
     # 视觉服务运行在 8000 端口，避免和主 Flask (通常 5000) 冲突
-    app.run(port=8000, debug=True)
\ No newline at end of file
+    # 关闭自动重载：重载器会再启动一个服务进程，推理工作进程也会多出一份
+    app.run(port=8000, debug=True, use_reloader=False)
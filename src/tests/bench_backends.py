@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理后端对比测试（CPU）
+每个后端在独立的工作进程中加载（与 visual_service 相同），逐张推理，
+比较单张延迟和进程峰值内存（RSS）。需要安装 ultralytics 和 onnxruntime。
+
+用法: python3 src/tests/bench_backends.py <模型路径> <图片目录> [图片数] [后端列表，如 torch,onnx,onnx-int8] [计算线程数]
+"""
+
+import functools
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.process_pool import InferencePool
+from src.services import inference_worker
+from src.tests.bench_visual_batch import list_images
+
+
+def measure(paths):
+    """在工作进程中执行：逐张推理，返回每张耗时（毫秒）和峰值 RSS（MB）"""
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        inference_worker.infer([path])
+        latencies.append((time.perf_counter() - start) * 1000)
+    # Linux 下 ru_maxrss 单位为 KB
+    return latencies, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench(model_path, backend, paths, threads):
+    inference_worker.export_model(model_path, backend)
+    pool = InferencePool(measure, workers=1, threads_per_worker=threads,
+                         init=functools.partial(inference_worker.init, model_path=model_path, backend=backend))
+    pool.start()
+    try:
+        # 预热
+        pool.process_batch(paths[:2])
+        latencies, rss = pool.process_batch(paths)
+    finally:
+        pool.stop()
+    latencies.sort()
+    return {
+        'avg': sum(latencies) / len(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        'rss': rss,
+    }
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    model_path, image_dir = sys.argv[1], sys.argv[2]
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    backends = sys.argv[4].split(',') if len(sys.argv) > 4 else list(inference_worker.BACKENDS)
+    threads = int(sys.argv[5]) if len(sys.argv) > 5 else (os.cpu_count() or 1)
+    paths = list_images(image_dir, count)
+
+    results = [(backend, bench(model_path, backend, paths, threads)) for backend in backends]
+
+    print("=" * 60)
+    print(f"推理后端对比（{count}张，{threads} 个计算线程）")
+    print("=" * 60)
+    for backend, r in results:
+        print(f"{backend:>10}: 平均 {r['avg']:>7.1f}ms, p50 {r['p50']:>7.1f}ms, p95 {r['p95']:>7.1f}ms, "
+              f"峰值RSS {r['rss']:>7.1f}MB")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接池性能对比脚本
+对比"每次操作都 sqlite3.connect/close"与共享连接池两种方式：
+- 传感器数据写入吞吐（条/秒）
+- 典型接口查询（最新100条传感器数据、设备列表）的 p50/p99 延迟
+
+用法: python3 src/tests/bench_db_pool.py [写入条数] [查询次数]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db
+
+SENSOR_DDL = '''CREATE TABLE IF NOT EXISTS sensor_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL,
+    timestamp TEXT,
+    temperature_inside REAL,
+    temperature_outside REAL,
+    humidity REAL,
+    duoj1 INTEGER,
+    duoj2 INTEGER,
+    duoj3 INTEGER,
+    duoj4 INTEGER,
+    feng1 INTEGER,
+    feng2 INTEGER,
+    jia INTEGER,
+    raw_data TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+)'''
+
+DEVICES_DDL = '''CREATE TABLE IF NOT EXISTS devices (
+    device_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT DEFAULT 'active',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+)'''
+
+INSERT_SQL = '''INSERT INTO sensor_data (
+    device_id, timestamp, temperature_inside, temperature_outside, humidity,
+    duoj1, duoj2, duoj3, duoj4, feng1, feng2, jia, raw_data
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def make_row(i):
+    data = {'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'temperature_inside': 25.0 + i % 5,
+            'temperature_outside': 30.0, 'humidity': 60.0}
+    return (f"dev-{i % 300:03d}", data['timestamp'], data['temperature_inside'], data['temperature_outside'],
+            data['humidity'], 0, 1, 0, 1, 0, 1, 0, json.dumps(data))
+
+
+def raw_connect(path):
+    return sqlite3.connect(path)
+
+
+def bench_inserts(connect, path, count):
+    """每条数据一次连接、一次插入、一次提交（与原 save_sensor_data 相同）"""
+    start = time.perf_counter()
+    for i in range(count):
+        conn = connect(path)
+        conn.execute(INSERT_SQL, make_row(i))
+        conn.commit()
+        conn.close()
+    return count / (time.perf_counter() - start)
+
+
+def bench_queries(connect, path, count):
+    """模拟 /api/sensor_data 与 /api/devices 的数据库部分"""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        conn = connect(path)
+        cursor = conn.cursor()
+        if i % 2:
+            cursor.execute("SELECT * FROM sensor_data ORDER BY created_at DESC LIMIT 100")
+        else:
+            cursor.execute("SELECT * FROM devices")
+        cursor.fetchall()
+        conn.close()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def prepare(path):
+    conn = sqlite3.connect(path)
+    conn.execute(SENSOR_DDL)
+    conn.execute(DEVICES_DDL)
+    conn.executemany("INSERT INTO devices (device_id, name) VALUES (?, ?)",
+                     [(f"dev-{i:03d}", f"设备dev-{i:03d}") for i in range(300)])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    inserts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    print("=" * 60)
+    print("数据库连接池性能对比")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 原方式：每次 connect/close，默认 rollback 日志
+        before_path = os.path.join(tmp, 'before.db')
+        prepare(before_path)
+        before_ips = bench_inserts(raw_connect, before_path, inserts)
+        before_p50, before_p99 = bench_queries(raw_connect, before_path, queries)
+
+        # 新方式：连接池 + WAL + 参数调优
+        after_path = os.path.join(tmp, 'after.db')
+        prepare(after_path)
+        after_ips = bench_inserts(db.connect, after_path, inserts)
+        after_p50, after_p99 = bench_queries(db.connect, after_path, queries)
+        db.close_all()
+
+    print(f"{'':20}{'connect/close':>16}{'连接池':>16}")
+    print(f"{'写入 (条/秒)':20}{before_ips:>16.0f}{after_ips:>16.0f}")
+    print(f"{'查询 p50 (ms)':20}{before_p50:>16.3f}{after_p50:>16.3f}")
+    print(f"{'查询 p99 (ms)':20}{before_p99:>16.3f}{after_p99:>16.3f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/api/devices 负载测试
+对比原实现（读出全部图片记录再按设备分组）与每设备最新图片子查询的耗时和内存占用
+
+用法: python3 src/tests/bench_devices_query.py [设备数] [图片数]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db, migrations
+
+LATEST_IMAGE_QUERY = """
+    SELECT d.device_id, d.name, d.status, d.created_at,
+           i.id, i.image_path, i.original_filename, i.receive_time
+    FROM devices d
+    LEFT JOIN images i ON i.id = (
+        SELECT id FROM images
+        WHERE device_id = d.device_id
+        ORDER BY receive_time DESC, id DESC
+        LIMIT 1
+    )
+"""
+
+
+def prepare(path, devices, images):
+    migrations.migrate(path, verbose=False)
+    with db.transaction(path) as conn:
+        conn.executemany("INSERT INTO devices (device_id, name) VALUES (?, ?)",
+                         [(f"dev-{i:04d}", f"设备dev-{i:04d}") for i in range(devices)])
+        rows = ((f"dev-{i % devices:04d}", f"/data/images/dev-{i % devices:04d}_{i}.jpg",
+                 f"dev-{i % devices:04d}_{i}.jpg", f"{i}.jpg",
+                 time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(1700000000 + i))) for i in range(images))
+        conn.executemany("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def old_devices(conn):
+    """原 get_devices 的数据库与分组部分"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM devices")
+    devices = cursor.fetchall()
+    cursor.execute("SELECT id, device_id, image_path, original_filename, receive_time FROM images ORDER BY receive_time DESC")
+    images_by_device = {}
+    for image_id, device_id, image_path, original_filename, receive_time in cursor.fetchall():
+        images_by_device.setdefault(device_id, []).append({
+            'id': image_id, 'image_path': image_path,
+            'original_filename': original_filename, 'receive_time': receive_time})
+    result = []
+    for device_id, name, status, created_at in devices:
+        device_images = images_by_device.get(device_id, [])
+        result.append((device_id, device_images[0] if device_images else None))
+    return result
+
+
+def new_devices(conn):
+    """新 get_devices 的数据库部分"""
+    return [(row[0], row[4]) for row in conn.execute(LATEST_IMAGE_QUERY).fetchall()]
+
+
+def measure(func, conn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(conn)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    images = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    print("=" * 60)
+    print(f"/api/devices 负载测试（{devices}个设备，{images}张图片）")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'iot.db')
+        prepare(path, devices, images)
+        with db.connection(path) as conn:
+            old, old_ms, old_mb = measure(old_devices, conn)
+            new, new_ms, new_mb = measure(new_devices, conn)
+        db.close_all()
+
+    # 两种实现返回的每设备最新图片必须一致
+    assert [(d, img['id'] if img else None) for d, img in old] == new
+
+    print(f"{'':16}{'耗时 (ms)':>14}{'内存峰值 (MB)':>16}")
+    print(f"{'原实现':14}{old_ms:>14.1f}{old_mb:>16.1f}")
+    print(f"{'最新图片子查询':10}{new_ms:>14.1f}{new_mb:>16.2f}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片 HTTP 缓存负载测试（需要运行中的 Web 服务和 requests）
+模拟图库翻页：按游标分页列出图片，每张图片先无缓存请求一次，再带 If-None-Match 重新请求（浏览器缓存过期或强制刷新），
+以及一次 Range 请求，统计状态码、传输字节数、延迟和缓存节省的字节比例。
+
+用法: python3 src/tests/bench_image_cache.py <服务地址，如 http://127.0.0.1:5000> <用户名> <密码> [图片数] [尺寸 full|thumb|medium]
+"""
+
+import sys
+import time
+from collections import Counter
+
+import requests
+
+
+def login(base_url, username, password):
+    session = requests.Session()
+    response = session.post(f"{base_url}/login", data={'username': username, 'password': password},
+                            allow_redirects=False)
+    if response.status_code not in (200, 302) or not session.cookies:
+        raise SystemExit(f"登录失败: HTTP {response.status_code}")
+    return session
+
+
+def list_images(session, base_url, count):
+    """按游标分页读取图片存储键"""
+    keys = []
+    after = ''
+    while len(keys) < count:
+        data = session.get(f"{base_url}/api/images", params={'after': after, 'per_page': 100}).json()['data']
+        keys.extend(image['filename'] for image in data['images'] if image['filename'])
+        after = data['pagination']['next_cursor']
+        if not after:
+            break
+    return keys[:count]
+
+
+def fetch(session, url, headers=None):
+    start = time.perf_counter()
+    response = session.get(url, headers=headers or {})
+    return response, len(response.content), (time.perf_counter() - start) * 1000
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return sum(latencies) / len(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+def main():
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+    base_url, username, password = sys.argv[1].rstrip('/'), sys.argv[2], sys.argv[3]
+    count = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+    size = sys.argv[5] if len(sys.argv) > 5 else 'full'
+
+    session = login(base_url, username, password)
+    keys = list_images(session, base_url, count)
+    if not keys:
+        raise SystemExit("没有可访问的图片")
+
+    results = {name: {'status': Counter(), 'bytes': 0, 'latency': []} for name in ('首次请求', '条件请求', 'Range')}
+
+    def record(name, response, body_bytes, latency):
+        results[name]['status'][response.status_code] += 1
+        results[name]['bytes'] += body_bytes
+        results[name]['latency'].append(latency)
+
+    missing_etag = 0
+    for key in keys:
+        url = f"{base_url}/data/images/{key}" + (f"?size={size}" if size != 'full' else '')
+        response, body_bytes, latency = fetch(session, url)
+        record('首次请求', response, body_bytes, latency)
+        etag = response.headers.get('ETag')
+        if not etag:
+            missing_etag += 1
+            continue
+        record('条件请求', *fetch(session, url, {'If-None-Match': etag}))
+        record('Range', *fetch(session, url, {'Range': 'bytes=0-1023'}))
+
+    print("=" * 72)
+    print(f"图片缓存测试（{len(keys)}张图片，尺寸 {size}）")
+    print("=" * 72)
+    print(f"{'':10}{'请求数':>8}{'传输 (KB)':>14}{'平均 (ms)':>12}{'p95 (ms)':>12}  状态码")
+    for name, result in results.items():
+        if not result['latency']:
+            continue
+        avg, p95 = summary(result['latency'])
+        statuses = ', '.join(f"{status}×{n}" for status, n in sorted(result['status'].items()))
+        print(f"{name:10}{len(result['latency']):>8}{result['bytes'] / 1024:>14.1f}{avg:>12.2f}{p95:>12.2f}  {statuses}")
+
+    cold = results['首次请求']['bytes']
+    revalidated = results['条件请求']['bytes']
+    if cold:
+        print(f"重新验证节省: {(cold - revalidated) / 1024:.1f} KB（{(cold - revalidated) / cold * 100:.1f}%）")
+    if missing_etag:
+        print(f"⚠️  {missing_etag} 张图片响应没有 ETag")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片访问权限查询性能测试
+对比 serve_image 原来的 image_path LIKE '%文件名' 与 filename 列精确查询（索引 O(log n)）
+
+用法: python3 src/tests/bench_image_lookup.py [图片记录数]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db, migrations
+
+
+def prepare(path, count):
+    migrations.migrate(path, verbose=False)
+    with db.transaction(path) as conn:
+        rows = ((f"dev-{i % 500:03d}", f"/data/images/dev-{i % 500:03d}_{i}.jpg", f"dev-{i % 500:03d}_{i}.jpg",
+                 f"{i}.jpg", f"2025-01-01T00:00:{i % 60:02d}") for i in range(count))
+        conn.executemany("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def bench(conn, sql, make_param, count):
+    latencies = []
+    for _ in range(count):
+        param = make_param()
+        start = time.perf_counter()
+        conn.execute(sql, (param,)).fetchone()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return sum(latencies) / len(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    print("=" * 60)
+    print(f"图片访问权限查询测试（{total}条图片记录）")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'iot.db')
+        start = time.perf_counter()
+        prepare(path, total)
+        print(f"准备数据耗时 {time.perf_counter() - start:.1f}s")
+
+        def random_name():
+            i = random.randrange(total)
+            return f"dev-{i % 500:03d}_{i}.jpg"
+
+        with db.connection(path) as conn:
+            like_avg, like_p99 = bench(conn, "SELECT device_id FROM images WHERE image_path LIKE ?",
+                                       lambda: '%' + random_name(), 20)
+            exact_avg, exact_p99 = bench(conn, "SELECT device_id FROM images WHERE filename = ? LIMIT 1",
+                                         random_name, 20000)
+        db.close_all()
+
+    print(f"{'':18}{'平均 (ms)':>12}{'p99 (ms)':>12}")
+    print(f"{'LIKE 全表扫描':16}{like_avg:>12.3f}{like_p99:>12.3f}")
+    print(f"{'filename 索引':16}{exact_avg:>12.4f}{exact_p99:>12.4f}")
+    print(f"加速比: {like_avg / exact_avg:.0f}x")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理进程池扩展性测试（CPU）
+按 visual_service 的方式组合 InferencePool + MicroBatcher，
+工作进程数从 1 增加到 N（计算线程按核数平均分配），测量吞吐（张/秒）。需要安装 ultralytics。
+
+用法: python3 src/tests/bench_inference_pool.py <模型路径> <图片目录> [图片数] [最大进程数] [批大小]
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.micro_batcher import MicroBatcher
+from src.common.process_pool import InferencePool
+from src.services import inference_worker
+from src.tests.bench_visual_batch import list_images
+
+
+def bench(model_path, paths, workers, batch_size):
+    pool = InferencePool(inference_worker.infer, init=functools.partial(inference_worker.init, model_path=model_path),
+                         workers=workers)
+    pool.start()
+    # 预热：每个工作进程先推理一张
+    for _ in range(workers):
+        pool.process_batch(paths[:1])
+
+    done = threading.Event()
+    remaining = [len(paths)]
+    lock = threading.Lock()
+
+    def on_done(result, error):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+
+    batcher = MicroBatcher(pool.process_batch, max_batch_size=batch_size, max_wait=0.05,
+                           max_queue=len(paths), workers=workers)
+    batcher.start()
+    start = time.perf_counter()
+    for path in paths:
+        batcher.submit(path, on_done)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    batcher.stop()
+    pool.stop()
+    return len(paths) / elapsed, pool.threads_per_worker
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    model_path, image_dir = sys.argv[1], sys.argv[2]
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    max_workers = int(sys.argv[4]) if len(sys.argv) > 4 else (os.cpu_count() or 1)
+    batch_size = int(sys.argv[5]) if len(sys.argv) > 5 else 4
+    paths = list_images(image_dir, count)
+
+    results = []
+    workers = 1
+    while workers <= max_workers:
+        results.append((workers,) + bench(model_path, paths, workers, batch_size))
+        workers *= 2
+
+    print("=" * 60)
+    print(f"推理进程池扩展性测试（{count}张，批大小 {batch_size}，{os.cpu_count()} 核）")
+    print("=" * 60)
+    base = results[0][1]
+    for workers, throughput, threads in results:
+        print(f"{workers:>3} 个进程 x {threads:>2} 线程: {throughput:>8.2f} 张/秒（{throughput / base:.2f}x）")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
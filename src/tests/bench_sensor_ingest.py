@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据批量写入性能测试
+对比逐条提交与 SensorIngest 攒批写入 sensor_data 的吞吐（条/秒）
+
+用法: python3 src/tests/bench_sensor_ingest.py [条数]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db
+from src.common.sensor_ingest import SensorIngest, INSERT_SQL, build_sensor_data, build_row
+from src.tests.bench_db_pool import SENSOR_DDL
+
+
+def make_message(i):
+    return {'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'temperature_inside': 25.0 + i % 5,
+            'temperature_outside': 30.0, 'humidity': 60.0, 'duoj1': 0, 'duoj2': 1,
+            'duoj3': 0, 'duoj4': 1, 'feng1': 0, 'feng2': 1, 'jia': 0}
+
+
+def prepare(path):
+    with db.transaction(path) as conn:
+        conn.execute(SENSOR_DDL)
+
+
+def bench_per_message(path, count):
+    """原方式：每条消息一次插入一次提交"""
+    start = time.perf_counter()
+    for i in range(count):
+        data = make_message(i)
+        row = build_row(build_sensor_data(f"dev-{i % 300:03d}", data), data)
+        with db.transaction(path) as conn:
+            conn.execute(INSERT_SQL, row)
+    return count / (time.perf_counter() - start)
+
+
+def bench_batched(path, count):
+    """SensorIngest：入队 + 后台攒批写入，计时到最后一条落盘为止"""
+    ingest = SensorIngest(path, report_interval=0)
+    ingest.start()
+    start = time.perf_counter()
+    for i in range(count):
+        data = make_message(i)
+        ingest.submit(build_row(build_sensor_data(f"dev-{i % 300:03d}", data), data))
+    ingest.stop()
+    elapsed = time.perf_counter() - start
+    return count / elapsed, ingest.stats()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    print("=" * 60)
+    print(f"传感器数据写入吞吐测试（{count}条）")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'single.db')
+        prepare(path)
+        single = bench_per_message(path, min(count, 5000))
+
+        path = os.path.join(tmp, 'batched.db')
+        prepare(path)
+        batched, stats = bench_batched(path, count)
+        db.close_all()
+
+    print(f"逐条提交:  {single:>10.0f} 条/秒")
+    print(f"攒批写入:  {batched:>10.0f} 条/秒")
+    print(f"批次数: {stats['batches']}, 队列峰值: {stats['max_depth']}, 背压: {stats['blocked']}, 丢弃: {stats['dropped']}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视觉识别批量推理吞吐测试（CPU）
+用与 visual_service 相同的 MicroBatcher 驱动 YOLO，一次性提交全部图片，
+测量不同批大小下的吞吐（张/秒）和单张延迟。需要安装 ultralytics。
+
+用法: python3 src/tests/bench_visual_batch.py <模型路径> <图片目录> [图片数] [批大小列表，如 1,2,4,8,16]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.micro_batcher import MicroBatcher
+
+
+def list_images(image_dir, count):
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    if not names:
+        raise SystemExit(f"目录中没有图片: {image_dir}")
+    # 图片不够时循环使用
+    return [os.path.join(image_dir, names[i % len(names)]) for i in range(count)]
+
+
+def bench(model, paths, batch_size):
+    done = threading.Event()
+    remaining = [len(paths)]
+    lock = threading.Lock()
+
+    def infer(items):
+        return list(model(items, conf=0.3, save=False, verbose=False))
+
+    def on_done(result, error):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+
+    batcher = MicroBatcher(infer, max_batch_size=batch_size, max_wait=0.05, max_queue=len(paths))
+    batcher.start()
+    start = time.perf_counter()
+    for path in paths:
+        batcher.submit(path, on_done)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    stats = batcher.stats()
+    batcher.stop()
+    return len(paths) / elapsed, stats
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    model_path, image_dir = sys.argv[1], sys.argv[2]
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    batch_sizes = [int(n) for n in sys.argv[4].split(',')] if len(sys.argv) > 4 else [1, 2, 4, 8, 16]
+
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    paths = list_images(image_dir, count)
+    # 预热，排除首次推理的初始化开销
+    model(paths[:1], conf=0.3, save=False, verbose=False)
+
+    print("=" * 60)
+    print(f"批量推理吞吐测试（{count}张）")
+    print("=" * 60)
+    for batch_size in batch_sizes:
+        throughput, stats = bench(model, paths, batch_size)
+        print(f"批大小 {batch_size:>3}: {throughput:>8.2f} 张/秒, 平均每批 {stats['avg_batch_ms']}ms, "
+              f"单张延迟 p50 {stats['latency_ms']['p50']}ms / p95 {stats['latency_ms']['p95']}ms")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
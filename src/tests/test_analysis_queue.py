@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片分析任务队列测试
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import analysis_queue, db, migrations
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    return path
+
+
+def enqueue(path, image_id, priority=analysis_queue.PRIORITY_UPLOAD):
+    with db.transaction(path) as conn:
+        return analysis_queue.enqueue(conn, image_id, f'/data/images/{image_id}.jpg', priority)
+
+
+def status_of(path, task_id):
+    with db.connection(path) as conn:
+        return conn.execute("SELECT status, attempts FROM analysis_tasks WHERE id = ?", (task_id,)).fetchone()
+
+
+def test_dedup_priority_and_claim_order(db_path):
+    first = enqueue(db_path, 1)
+    enqueue(db_path, 2)
+    # 同一图片重复入队只提高优先级
+    assert enqueue(db_path, 2, analysis_queue.PRIORITY_MANUAL) == 2
+    assert enqueue(db_path, 1) == first
+
+    tasks = analysis_queue.claim(db_path, 10)
+    assert [task[1] for task in tasks] == [2, 1]
+    assert analysis_queue.claim(db_path, 10) == []
+    assert analysis_queue.stats(db_path)['running'] == 2
+
+
+def test_max_running(db_path):
+    for image_id in range(5):
+        enqueue(db_path, image_id)
+    assert len(analysis_queue.claim(db_path, 10, max_running=3)) == 3
+    assert analysis_queue.claim(db_path, 10, max_running=3) == []
+
+
+def test_complete_retry_and_fail(db_path):
+    task_id = enqueue(db_path, 7)
+    analysis_queue.claim(db_path, 1)
+    with db.transaction(db_path) as conn:
+        assert analysis_queue.complete(conn, 7, False, 'model error', max_attempts=2) == 1
+    assert status_of(db_path, task_id) == ('queued', 1)
+    # 退避期间不会被取出
+    assert analysis_queue.claim(db_path, 1) == []
+
+    with db.transaction(db_path) as conn:
+        conn.execute("UPDATE analysis_tasks SET available_at = 0")
+    analysis_queue.claim(db_path, 1)
+    with db.transaction(db_path) as conn:
+        analysis_queue.complete(conn, 7, False, 'model error', max_attempts=2)
+    assert status_of(db_path, task_id) == ('failed', 2)
+
+    # 失败后可以重新入队，成功回调后为 done
+    retry_id = enqueue(db_path, 7)
+    assert retry_id != task_id
+    analysis_queue.claim(db_path, 1)
+    with db.transaction(db_path) as conn:
+        analysis_queue.complete(conn, 7, True)
+    assert status_of(db_path, retry_id) == ('done', 1)
+
+
+def test_release_and_requeue_stale(db_path):
+    a, b = enqueue(db_path, 1), enqueue(db_path, 2)
+    analysis_queue.claim(db_path, 2)
+    analysis_queue.release(db_path, [b])
+    assert status_of(db_path, b) == ('queued', 0)
+    assert analysis_queue.requeue_stale(db_path, timeout=-1) == 1
+    assert status_of(db_path, a)[0] == 'queued'
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果标注图测试
+"""
+
+import io
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.annotated_images import FileCache, render
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=2500)
+    assert cache.path_for('1-1.jpg') is None
+    cache.put('1-1.jpg', b'a' * 1000)
+    cache.put('2-2.jpg', b'b' * 1000)
+    # 访问 1-1 后它变为最近使用，超过上限时淘汰 2-2
+    past = time.time() - 60
+    os.utime(tmp_path / '2-2.jpg', (past, past))
+    os.utime(tmp_path / '1-1.jpg', (past - 60, past - 60))
+    assert cache.path_for('1-1.jpg')
+    cache.put('3-3.jpg', b'c' * 1000)
+    assert sorted(os.listdir(tmp_path)) == ['1-1.jpg', '3-3.jpg']
+    assert cache.stats()['evicted'] == 1 and cache.stats()['size_bytes'] == 2000
+
+
+def test_remove_prefix(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=10000)
+    for key in ('12-1.jpg', '12-2.jpg', '123-3.jpg'):
+        cache.put(key, b'x' * 10)
+    cache.remove_prefix('12-')
+    assert os.listdir(tmp_path) == ['123-3.jpg']
+    assert cache.stats()['size_bytes'] == 10
+
+
+def test_render_draws_boxes(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    path = str(tmp_path / 'source.jpg')
+    Image.new('RGB', (200, 100), (255, 255, 255)).save(path)
+    data = render(path, [{'class': 'BWYC', 'confidence': 0.9, 'bbox': [20, 30, 50, 40], 'gender': '雌性'}])
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (200, 100)
+        red, green, blue = image.convert('RGB').getpixel((20, 50))
+        assert red > 150 and green < 120
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web 服务路由冒烟测试：上传后入队、超大表单在解析前拒绝、图片列表游标翻页、图片 ETag / 304 / Range
+需要 flask、flask_socketio 和 paho-mqtt；MQTT 连接被替换为空操作，数据库和图片目录使用临时目录
+"""
+
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+from src.common import db
+from src.common.derivatives import DerivativeStore
+
+IMAGE = b'\xff\xd8\xff\xe0' + os.urandom(4096)
+
+
+@pytest.fixture(scope='module')
+def web(tmp_path_factory):
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_socketio')
+    mqtt = pytest.importorskip('paho.mqtt.client')
+
+    tmp = tmp_path_factory.mktemp('web')
+    patch = pytest.MonkeyPatch()
+    patch.setattr(mqtt.Client, 'connect', lambda self, *args, **kwargs: 0)
+    patch.setattr(mqtt.Client, 'loop_start', lambda self: None)
+    # app.py 导入时在当前目录创建 iot.db
+    patch.chdir(tmp)
+    try:
+        import app as web_app
+    except PermissionError:
+        patch.undo()
+        pytest.skip('需要 /data 目录的写权限')
+
+    web_app.app.config.update(TESTING=True, DB_PATH=str(tmp / 'iot.db'),
+                              UPLOAD_FOLDER=str(tmp / 'images') + '/',
+                              UPLOAD_TMP_FOLDER=str(tmp / 'images' / '.incoming') + '/')
+    os.makedirs(web_app.app.config['UPLOAD_TMP_FOLDER'])
+    web_app.derivative_store = DerivativeStore(str(tmp / 'derivatives'))
+    web_app.image_owner_cache.clear()
+    yield web_app
+    web_app.derivative_pool.shutdown(wait=True)
+    patch.undo()
+    db.close_all()
+
+
+@pytest.fixture(scope='module')
+def client(web):
+    client = web.app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': '123456'})
+    assert response.status_code == 302
+    return client
+
+
+def upload(client, name='a.jpg'):
+    response = client.post('/upload/image', data={'device_id': 'dev-001', 'image': (io.BytesIO(IMAGE), name)},
+                           content_type='multipart/form-data')
+    body = response.get_json()
+    assert response.status_code == 200 and body['code'] == 200, body
+    return body
+
+
+def test_upload_enqueues_analysis(web, client):
+    first = upload(client)
+    second = upload(client)
+    # 同名上传不覆盖已保存的图片
+    assert first['filename'] != second['filename']
+    assert open(first['path'], 'rb').read() == IMAGE
+    with db.connection(web.app.config['DB_PATH']) as conn:
+        tasks = conn.execute("SELECT image_id, status FROM analysis_tasks WHERE image_id IN (?, ?) ORDER BY image_id",
+                             (first['image_id'], second['image_id'])).fetchall()
+    assert tasks == [(first['image_id'], 'queued'), (second['image_id'], 'queued')]
+
+
+def test_oversized_form_rejected_before_parsing(web, client):
+    limit = web.app.config['MAX_CONTENT_LENGTH']
+    web.app.config['MAX_CONTENT_LENGTH'] = 1024
+    try:
+        response = client.post('/upload/image', data={'device_id': 'dev-001', 'image': (io.BytesIO(IMAGE), 'big.jpg')},
+                               content_type='multipart/form-data')
+    finally:
+        web.app.config['MAX_CONTENT_LENGTH'] = limit
+    assert response.status_code == 413 and response.get_json()['code'] == 413
+
+
+def test_images_cursor_pagination(web, client):
+    for name in ('b.jpg', 'c.jpg', 'd.jpg'):
+        upload(client, name)
+    with db.connection(web.app.config['DB_PATH']) as conn:
+        total = conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    seen = []
+    after = ''
+    while True:
+        data = client.get('/api/images', query_string={'after': after, 'per_page': 2}).get_json()['data']
+        assert len(data['images']) <= 2
+        seen.extend(image['id'] for image in data['images'])
+        if not data['pagination']['has_more']:
+            break
+        after = data['pagination']['next_cursor']
+    # 每张图片出现且只出现一次，按接收时间倒序
+    assert len(seen) == len(set(seen)) == total
+    assert seen[0] == max(seen)
+
+
+def test_serve_image_etag_304_and_range(web, client):
+    body = upload(client, 'e.jpg')
+    url = f"/data/images/{body['filename']}"
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == IMAGE
+    assert response.headers['ETag'] == f'"{body["sha256"]}"'
+    assert 'immutable' in response.headers['Cache-Control']
+
+    response = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304 and response.data == b''
+
+    response = client.get(url, headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206 and response.data == IMAGE[:4]
+    assert response.headers['Content-Range'] == f"bytes 0-3/{len(IMAGE)}"
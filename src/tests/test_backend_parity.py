@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理后端一致性测试
+同一张图片分别用 torch 和 onnx 后端推理，检测框数量、类别一致，
+框位置（IoU）和置信度在容差范围内。需要 ultralytics、onnxruntime 和模型文件，缺少时跳过。
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+pytest.importorskip('ultralytics')
+pytest.importorskip('onnxruntime')
+
+from src.services import inference_worker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SAMPLE_IMAGE = os.path.join(ROOT, '7f4723fb8c06b62fd145da927ba566bb.jpg')
+
+MIN_IOU = 0.9
+MAX_CONFIDENCE_DIFF = 0.05
+
+
+def iou(a, b):
+    """[x, y, w, h] 格式的两个框的 IoU"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 1.0
+
+
+def run(backend):
+    inference_worker.init(2, backend=backend)
+    return inference_worker.infer([SAMPLE_IMAGE])[0]
+
+
+@pytest.mark.skipif(not os.path.exists(inference_worker.MODEL_PATH), reason='模型文件不存在')
+def test_onnx_matches_torch():
+    expected = run('torch')
+    actual = run('onnx')
+    assert actual['total_count'] == expected['total_count']
+    assert actual['species_count'] == expected['species_count']
+    assert actual['gender_count'] == expected['gender_count']
+
+    unmatched = list(actual['objects'])
+    for obj in expected['objects']:
+        candidates = [o for o in unmatched if o['class'] == obj['class']]
+        assert candidates, f"onnx 缺少检测结果: {obj}"
+        best = max(candidates, key=lambda o: iou(o['bbox'], obj['bbox']))
+        assert iou(best['bbox'], obj['bbox']) >= MIN_IOU
+        assert abs(best['confidence'] - obj['confidence']) <= MAX_CONFIDENCE_DIFF
+        unmatched.remove(best)
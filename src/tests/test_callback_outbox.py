@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回调发件箱测试（用假的 HTTP 会话代替主服务）
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.callback_outbox import CallbackOutbox
+
+CALLBACK_URL = 'http://main/api/callback'
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """按 URL 返回预设的状态码，记录每次请求"""
+
+    def __init__(self, status=None):
+        self.status = status or {}
+        self.requests = []
+
+    def post(self, url, json, timeout):
+        self.requests.append((url, json))
+        status = self.status.get(url, 200)
+        if isinstance(status, Exception):
+            raise status
+        return FakeResponse(status, {'code': 200})
+
+
+def payload(image_id):
+    return {'image_id': image_id, 'status': 'success', 'result': {}}
+
+
+def test_single_result_goes_to_callback_url(tmp_path):
+    session = FakeSession()
+    outbox = CallbackOutbox(str(tmp_path / 'v.db'), session=session)
+    outbox.add(CALLBACK_URL, payload(1))
+    assert outbox.deliver_due() == 1
+    assert session.requests == [(CALLBACK_URL, payload(1))]
+    stats = outbox.stats()
+    assert stats['backlog'] == 0 and stats['delivered'] == 1
+
+
+def test_backlog_is_batched(tmp_path):
+    session = FakeSession()
+    outbox = CallbackOutbox(str(tmp_path / 'v.db'), batch_size=2, session=session)
+    for image_id in range(3):
+        outbox.add(CALLBACK_URL, payload(image_id))
+    outbox.deliver_due()
+    outbox.deliver_due()
+    assert session.requests == [
+        (CALLBACK_URL + '/batch', {'results': [payload(0), payload(1)]}),
+        (CALLBACK_URL, payload(2)),
+    ]
+    assert outbox.stats()['batch_requests'] == 1
+
+
+def test_failure_is_kept_and_retried_with_backoff(tmp_path):
+    session = FakeSession({CALLBACK_URL: ConnectionError('refused')})
+    outbox = CallbackOutbox(str(tmp_path / 'v.db'), session=session)
+    outbox.add(CALLBACK_URL, payload(1))
+    outbox.deliver_due()
+    # 退避期内不再重试，结果仍在发件箱中（重启后也能继续投递）
+    assert outbox.deliver_due() == 0
+    assert CallbackOutbox(str(tmp_path / 'v.db'), session=session).backlog() == 1
+    assert outbox.stats()['failures'] == 1
+
+
+def test_falls_back_to_single_when_batch_unsupported(tmp_path):
+    session = FakeSession({CALLBACK_URL + '/batch': 404})
+    outbox = CallbackOutbox(str(tmp_path / 'v.db'), session=session)
+    outbox.add(CALLBACK_URL, payload(1))
+    outbox.add(CALLBACK_URL, payload(2))
+    outbox.deliver_due()
+    assert [url for url, body in session.requests] == [CALLBACK_URL + '/batch', CALLBACK_URL, CALLBACK_URL]
+    assert outbox.backlog() == 0
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+捕获数量汇总表测试：增量更新与重建结果一致，重新识别不重复计数
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import catch_stats, db, migrations, visual_results
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    with db.transaction(path) as conn:
+        conn.executemany("INSERT INTO images (id, device_id, image_path, original_filename, receive_time) "
+                         "VALUES (?, ?, ?, 'a.jpg', ?)", [
+            (1, 'dev-001', '/data/images/1.jpg', '2025-06-01T08:15:00.000001'),
+            (2, 'dev-001', '/data/images/2.jpg', '2025-06-01T21:40:00.000001'),
+            (3, 'dev-002', '/data/images/3.jpg', '2025-06-02T08:05:00.000001'),
+        ])
+    return path
+
+
+def result(image_id, females, males=0, model_version='abc-torch'):
+    objects = [{'species': '白纹伊蚊', 'gender': '雌性'}] * females + [{'species': '白纹伊蚊', 'gender': '雄性'}] * males
+    return {'image_id': image_id, 'status': 'success', 'model_version': model_version, 'result': {'objects': objects}}
+
+
+def store(path, results):
+    with db.transaction(path) as conn:
+        visual_results.store(conn, results)
+
+
+def query(path, **kwargs):
+    with db.connection(path) as conn:
+        return catch_stats.query(conn, **kwargs)
+
+
+def test_incremental_rollup_and_query(db_path):
+    store(db_path, [result(1, 2, 1), result(2, 3), result(3, 1)])
+    assert query(db_path, group_by=['gender']) == [
+        {'time': '2025-06-01', 'gender': '雄性', 'count': 1},
+        {'time': '2025-06-01', 'gender': '雌性', 'count': 5},
+        {'time': '2025-06-02', 'gender': '雌性', 'count': 1},
+    ]
+    assert query(db_path, interval='hour', group_by=['device'], start='2025-06-01 20:00', end='2025-06-01') == [
+        {'time': '2025-06-01 21:00', 'device': 'dev-001', 'count': 3},
+    ]
+    assert query(db_path, group_by=[], device_id='dev-002') == [{'time': '2025-06-02', 'count': 1}]
+
+
+def test_reanalysis_replaces_counts_and_rebuild_matches(db_path):
+    store(db_path, [result(1, 2, 1), result(3, 1)])
+    # 换模型重新识别：只计入最新结果；重复回调不影响
+    store(db_path, [result(1, 1, model_version='def-onnx'), result(1, 1, model_version='def-onnx')])
+    incremental = query(db_path, interval='hour', group_by=['device', 'species', 'gender'])
+    assert sum(row['count'] for row in incremental) == 2
+
+    assert catch_stats.rebuild(db_path) == 2
+    assert query(db_path, interval='hour', group_by=['device', 'species', 'gender']) == incremental
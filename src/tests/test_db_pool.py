@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享数据库连接池测试
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db
+
+
+def test_connection_reused_after_close(tmp_path):
+    """close() 归还连接，下次借出复用同一连接"""
+    pool = db.ConnectionPool(str(tmp_path / 'iot.db'))
+    conn = pool.acquire()
+    conn.close()
+    conn.close()  # 重复 close 不能把连接放回两次
+    assert pool.acquire() is conn
+    assert pool.stats()['created'] == 1
+    pool.close_all()
+
+
+def test_pragmas_applied(tmp_path):
+    """连接开启 WAL 等参数"""
+    pool = db.ConnectionPool(str(tmp_path / 'iot.db'))
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    pool.close_all()
+
+
+def test_uncommitted_transaction_rolled_back(tmp_path):
+    """归还时未提交的事务被回滚，不会泄漏给下一个使用者"""
+    pool = db.ConnectionPool(str(tmp_path / 'iot.db'))
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE t (v INTEGER)")
+    conn = pool.acquire()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close_all()
+
+
+def test_concurrent_threads_get_distinct_connections(tmp_path):
+    """多个线程同时借用时各自持有不同连接"""
+    pool = db.ConnectionPool(str(tmp_path / 'iot.db'))
+    barrier = threading.Barrier(4)
+    held = []
+
+    def worker():
+        with pool.connection() as conn:
+            held.append(conn)
+            barrier.wait()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(map(id, held))) == 4
+    pool.close_all()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缩略图和预览图测试（需要 Pillow）
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.derivatives import DerivativeStore
+
+
+def test_generate_and_remove(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    source = str(tmp_path / 'a.jpg')
+    Image.new('RGB', (4000, 3000), (200, 100, 50)).save(source, format='JPEG')
+
+    store = DerivativeStore(str(tmp_path / 'derivatives'))
+    key = 'dev-001/2025/06/01/a.jpg'
+    path = store.ensure(source, key, 'thumb')
+    assert path == store.path_for(key, 'thumb') and path.startswith(str(tmp_path / 'derivatives' / 'thumb' / 'dev-001'))
+    with Image.open(path) as thumb:
+        assert max(thumb.size) == 320 and thumb.size[0] / thumb.size[1] == pytest.approx(4 / 3, rel=0.01)
+
+    # 第二次直接返回已生成的文件
+    store.generate_all(source, key)
+    assert store.stats() == {'hits': 1, 'generated': 2, 'failures': 0}
+
+    store.remove(key)
+    assert not os.path.exists(path) and not os.path.exists(store.path_for(key, 'medium'))
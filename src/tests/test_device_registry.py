@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备注册服务测试
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db
+from src.common.device_registry import DeviceRegistry
+
+
+def make_db(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    with db.transaction(path) as conn:
+        conn.execute('''CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL UNIQUE, password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'device', device_id TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('''CREATE TABLE devices (
+            device_id TEXT PRIMARY KEY, name TEXT NOT NULL, status TEXT DEFAULT 'active',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    return path
+
+
+def test_steady_state_hits_cache(tmp_path):
+    """首次注册后，后续调用全部命中缓存"""
+    path = make_db(tmp_path)
+    registry = DeviceRegistry(path)
+    for _ in range(50):
+        assert registry.ensure_registered('dev-001')
+    stats = registry.stats()
+    assert stats['misses'] == 1 and stats['hits'] == 49 and stats['registrations'] == 1
+    with db.connection(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+
+
+def test_invalid_id_negative_cached(tmp_path):
+    """格式无效的设备ID进入否定缓存"""
+    registry = DeviceRegistry(make_db(tmp_path))
+    assert not registry.ensure_registered('bad id!')
+    assert not registry.ensure_registered('bad id!')
+    stats = registry.stats()
+    assert stats['misses'] == 1 and stats['negative_hits'] == 1
+
+
+def test_invalidate_reregisters_deleted_device(tmp_path):
+    """删除设备并清除缓存后，设备再次上报时重新注册"""
+    path = make_db(tmp_path)
+    registry = DeviceRegistry(path)
+    assert registry.ensure_registered('dev-001')
+    with db.transaction(path) as conn:
+        conn.execute("DELETE FROM devices WHERE device_id = 'dev-001'")
+        conn.execute("DELETE FROM users WHERE device_id = 'dev-001'")
+    registry.invalidate('dev-001')
+    assert registry.ensure_registered('dev-001')
+    assert registry.stats()['registrations'] == 2
+
+
+def test_failure_throttled(tmp_path):
+    """注册失败后在重试间隔内直接拒绝"""
+    registry = DeviceRegistry(str(tmp_path / 'empty.db'))  # 没有 users/devices 表
+    assert not registry.ensure_registered('dev-001')
+    assert not registry.ensure_registered('dev-001')
+    stats = registry.stats()
+    assert stats['failures'] == 1 and stats['negative_hits'] == 1
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地事件总线测试
+"""
+
+import os
+import sys
+import json
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import event_bus
+
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append(SimpleNamespace(topic=topic, payload=payload.encode('utf-8'), qos=qos))
+
+
+def test_published_event_relayed_to_emit():
+    """发布的事件经中转后以原事件名推送"""
+    client = FakeClient()
+    event_bus.publish(client, 'sensor_data', {'device_id': 'dev-001', 'humidity': 55.0})
+
+    emitted = []
+    relay = event_bus.FrontendRelay(lambda event, data: emitted.append((event, data)))
+    for msg in client.published:
+        relay.on_message(None, None, msg)
+    assert relay.drain() == 1
+    assert emitted == [('sensor_data', {'device_id': 'dev-001', 'humidity': 55.0})]
+
+
+def test_relay_drops_when_full():
+    """中转队列满时丢弃并计数"""
+    relay = event_bus.FrontendRelay(lambda event, data: None, max_queue=1)
+    msg = SimpleNamespace(topic=event_bus.FRONTEND_TOPIC_PREFIX + 'sensor_data', payload=json.dumps({}).encode())
+    relay.on_message(None, None, msg)
+    relay.on_message(None, None, msg)
+    assert relay.stats()['dropped'] == 1
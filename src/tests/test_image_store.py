@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片分目录布局测试：存储键、上传时占用存储键、按日期目录清理、旧图片迁移
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db, image_store, migrations
+
+
+def test_shard_key_and_key_for(tmp_path):
+    key = image_store.shard_key('dev/../001', 'dev_001_a.jpg', datetime(2025, 6, 1, 8, 0))
+    assert key == 'dev_.._001/2025/06/01/dev_001_a.jpg'
+    root = str(tmp_path)
+    assert image_store.key_for(root, os.path.join(root, 'dev-001', '2025', '06', '01', 'a.jpg')) == 'dev-001/2025/06/01/a.jpg'
+    assert image_store.key_for(root, '/elsewhere/a.jpg') == 'a.jpg'
+
+
+def test_reserve_never_reuses_key(tmp_path):
+    root = str(tmp_path)
+    key = 'dev-001/2025/06/01/dev-001_a.jpg'
+    first = image_store.reserve(root, key)
+    second = image_store.reserve(root, key)
+    assert first == (key, os.path.join(root, 'dev-001', '2025', '06', '01', 'dev-001_a.jpg'))
+    # 同名键已被占用时加随机后缀，不会指向同一文件
+    assert second[0] != key and second[0].startswith('dev-001/2025/06/01/dev-001_a_') and second[0].endswith('.jpg')
+    assert os.path.exists(second[1])
+
+    # 上传失败时删除占用的文件，变空的日期目录一并删除
+    image_store.release(root, first[1])
+    image_store.release(root, second[1])
+    assert os.listdir(root) == []
+
+
+def test_prune_empty_dirs(tmp_path):
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, 'dev-001', '2025', '05', '31'))
+    os.makedirs(os.path.join(root, 'dev-001', '2025', '06', '01'))
+
+    image_store.prune_empty_dirs(os.path.join(root, 'dev-001', '2025', '05', '31'), root)
+    # 5月目录空了一并删除，年目录下还有6月
+    assert not os.path.exists(os.path.join(root, 'dev-001', '2025', '05'))
+    assert os.path.exists(os.path.join(root, 'dev-001', '2025', '06', '01'))
+
+    image_store.prune_empty_dirs(os.path.join(root, 'dev-001', '2025', '06', '01'), root)
+    assert os.listdir(root) == []
+    # 根目录本身不删除
+    image_store.prune_empty_dirs(root, root)
+    assert os.path.isdir(root)
+
+
+def test_migrate_flat(tmp_path):
+    root = str(tmp_path / 'images')
+    os.makedirs(root)
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    with open(os.path.join(root, 'dev-001_a.jpg'), 'wb') as f:
+        f.write(b'a')
+    with db.transaction(path) as conn:
+        # 同名上传覆盖过的文件有两条记录；第三条记录的文件已不存在
+        conn.executemany("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time) "
+                         "VALUES (?, ?, ?, 'a.jpg', ?)", [
+                             ('dev-001', os.path.join(root, 'dev-001_a.jpg'), 'dev-001_a.jpg', '2025-05-31T10:00:00'),
+                             ('dev-001', os.path.join(root, 'dev-001_a.jpg'), 'dev-001_a.jpg', '2025-06-01T10:00:00'),
+                             ('dev-001', os.path.join(root, 'dev-001_b.jpg'), 'dev-001_b.jpg', '2025-06-01T10:00:00'),
+                         ])
+
+    assert image_store.migrate_flat(root, path, chunk_size=1) == (1, 1)
+    target = os.path.join(root, 'dev-001', '2025', '06', '01', 'dev-001_a.jpg')
+    assert open(target, 'rb').read() == b'a'
+    with db.connection(path) as conn:
+        rows = conn.execute("SELECT DISTINCT filename, image_path FROM images ORDER BY filename").fetchall()
+    assert rows == [('dev-001/2025/06/01/dev-001_a.jpg', target),
+                    ('dev-001_b.jpg', os.path.join(root, 'dev-001_b.jpg'))]
+    # 重复运行不再移动
+    assert image_store.migrate_flat(root, path) == (0, 1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备日志存储测试
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db, log_store, migrations
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    with db.transaction(path) as conn:
+        conn.executemany("INSERT INTO devices (device_id, name) VALUES (?, ?)",
+                         [('dev-001', '设备dev-001'), ('dev-002', '设备dev-002')])
+    log_store.append(path, 'dev-001', [
+        {'timestamp': '2025-01-01T08:00:00', 'level': 'info', 'message': '舵机初始化完成'},
+        {'timestamp': '2025-01-02T09:00:00', 'level': 'error', 'message': '温度传感器读取失败'},
+        {'timestamp': '2025-01-03T10:00:00', 'level': 'info', 'message': 'fan_1 on'},
+    ], date='2025-01-03')
+    log_store.append(path, 'dev-002', [
+        {'timestamp': '2025-01-02T12:00:00', 'level': 'warn', 'message': '温度过高'},
+    ], date='2025-01-03')
+    log_store.append(path, 'removed', [{'timestamp': '2025-01-04T00:00:00', 'message': 'x'}])
+    return path
+
+
+def query(path, **kwargs):
+    with db.connection(path) as conn:
+        logs, has_more, total = log_store.query_page(conn, log_store.build_filters(conn, **kwargs), 100,
+                                                     include_total=True)
+    return logs, total
+
+
+def test_filters(db_path):
+    logs, total = query(db_path, device_id='dev-001')
+    assert total == 3
+    assert [log['timestamp'][:10] for log in logs] == ['2025-01-03', '2025-01-02', '2025-01-01']
+    assert logs[0]['device_id'] == 'dev-001' and logs[0]['date'] == '2025-01-03'
+
+    # 全部设备只包含 devices 表中的设备
+    assert query(db_path, all_devices=True)[1] == 4
+    assert query(db_path)[1] == 0
+    assert query(db_path, device_id='dev-001', start='2025-01-02', end='2025-01-02')[1] == 1
+    assert query(db_path, all_devices=True, level='ERROR')[1] == 1
+
+
+@pytest.mark.parametrize('keyword, expected', [('温度', 2), ('传感器读取', 1), ('fan_', 1), ('%', 0)])
+def test_keyword(db_path, keyword, expected):
+    assert query(db_path, all_devices=True, keyword=keyword)[1] == expected
+
+
+def test_query_after(db_path):
+    seen = []
+    after = None
+    with db.connection(db_path) as conn:
+        filters = log_store.build_filters(conn, all_devices=True)
+        while True:
+            entries = log_store.query_after(conn, filters, 3, after)
+            seen.extend(entry['message'] for key, entry in entries[:3])
+            if len(entries) <= 3:
+                break
+            after = list(entries[2][0])
+    assert seen == [log['message'] for log in query(db_path, all_devices=True)[0]]
+
+
+def test_import_files(db_path, tmp_path):
+    log_dir = tmp_path / 'logs' / 'dev-002'
+    log_dir.mkdir(parents=True)
+    lines = [json.dumps({'timestamp': '2024-12-31T23:00:00', 'message': '旧日志'}, ensure_ascii=False), 'bad json']
+    (log_dir / '2024-12-31.log').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    assert log_store.import_files(db_path, str(tmp_path / 'logs')) == 1
+    # 再次导入时跳过已导入的文件
+    assert log_store.import_files(db_path, str(tmp_path / 'logs')) == 0
+    assert query(db_path, device_id='dev-002', date='2024-12-31')[1] == 1
+
+
+def test_query_page_without_total(db_path):
+    with db.connection(db_path) as conn:
+        filters = log_store.build_filters(conn, all_devices=True)
+        logs, has_more, total = log_store.query_page(conn, filters, 3)
+        assert len(logs) == 3 and has_more and total is None
+        logs, has_more, total = log_store.query_page(conn, filters, 3, offset=3)
+        assert len(logs) == 1 and not has_more
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按键分发线程池测试
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.message_dispatcher import KeyedDispatcher
+
+
+def test_per_key_order_preserved():
+    """同一设备的消息按提交顺序处理"""
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(device_id, seq):
+        with lock:
+            seen.setdefault(device_id, []).append(seq)
+
+    dispatcher = KeyedDispatcher(handler, workers=4)
+    dispatcher.start()
+    for seq in range(200):
+        for device_id in ('dev-a', 'dev-b', 'dev-c'):
+            assert dispatcher.submit(device_id, device_id, seq)
+    dispatcher.stop()
+    for device_id in ('dev-a', 'dev-b', 'dev-c'):
+        assert seen[device_id] == list(range(200))
+    assert dispatcher.stats()['processed'] == 600
+
+
+def test_handler_errors_counted():
+    """处理函数抛出异常不会中断工作线程"""
+    def handler(n):
+        if n % 2:
+            raise ValueError(n)
+
+    dispatcher = KeyedDispatcher(handler, workers=1)
+    dispatcher.start()
+    for n in range(10):
+        dispatcher.submit('dev', n)
+    dispatcher.stop()
+    stats = dispatcher.stats()
+    assert stats['processed'] == 10 and stats['errors'] == 5
+
+
+def test_full_queue_rejects():
+    """队列满且等待超时后拒绝消息"""
+    dispatcher = KeyedDispatcher(lambda: None, workers=1, queue_size=1, put_timeout=0.01)
+    assert dispatcher.submit('dev')
+    assert not dispatcher.submit('dev')
+    assert dispatcher.stats()['rejected'] == 1
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微批处理队列测试
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.micro_batcher import MicroBatcher
+
+
+def test_items_batched_and_results_delivered():
+    """任务按批处理，每个任务收到自己的结果"""
+    batches = []
+    results = {}
+    done = threading.Event()
+
+    def process(items):
+        batches.append(len(items))
+        return [n * 2 for n in items]
+
+    def on_done(n):
+        def callback(result, error):
+            results[n] = result
+            if len(results) == 20:
+                done.set()
+        return callback
+
+    batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.5)
+    for n in range(20):
+        assert batcher.submit(n, on_done(n))
+    batcher.start()
+    assert done.wait(5)
+    batcher.stop()
+    assert results == {n: n * 2 for n in range(20)}
+    assert batches == [8, 8, 4]
+    stats = batcher.stats()
+    assert stats['batch_size_histogram'] == {4: 1, 8: 2}
+    assert stats['processed'] == 20 and stats['latency_ms']['max'] > 0
+
+
+def test_failed_batch_retried_per_item():
+    """整批失败时逐个重试，只有出错的任务收到异常"""
+    outcomes = {}
+
+    def process(items):
+        if 'bad' in items:
+            raise ValueError('bad image')
+        return items
+
+    batcher = MicroBatcher(process, max_batch_size=3, max_wait=0.5)
+    for item in ('a', 'bad', 'b'):
+        batcher.submit(item, lambda result, error, item=item: outcomes.__setitem__(item, (result, error)))
+    batcher.start()
+    batcher.stop()
+    assert outcomes['a'] == ('a', None) and outcomes['b'] == ('b', None)
+    assert isinstance(outcomes['bad'][1], ValueError)
+    assert batcher.stats()['errors'] == 1
+
+
+def test_full_queue_rejects():
+    batcher = MicroBatcher(lambda items: items, max_queue=1)
+    assert batcher.submit(1, lambda result, error: None)
+    assert not batcher.submit(2, lambda result, error: None)
+    assert batcher.stats()['rejected'] == 1
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+游标分页测试
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db, migrations
+from src.common.pagination import encode_cursor, decode_cursor, page_result
+
+# 与 app.get_images_by_cursor 相同的查询
+CURSOR_QUERY = """
+    SELECT i.id, i.receive_time FROM images i
+    LEFT JOIN devices d ON i.device_id = d.device_id
+    WHERE (i.receive_time, i.id) < (?, ?)
+    ORDER BY i.receive_time DESC, i.id DESC
+    LIMIT ?
+"""
+FIRST_PAGE_QUERY = """
+    SELECT i.id, i.receive_time FROM images i
+    LEFT JOIN devices d ON i.device_id = d.device_id
+    ORDER BY i.receive_time DESC, i.id DESC
+    LIMIT ?
+"""
+
+
+def test_cursor_roundtrip():
+    token = encode_cursor(['2025-01-01T00:00:00', 42])
+    assert decode_cursor(token, 2) == ['2025-01-01T00:00:00', 42]
+
+
+@pytest.mark.parametrize('token', ['not-base64!', encode_cursor([1]), encode_cursor({'a': 1})])
+def test_invalid_cursor(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token, 2)
+
+
+def test_keyset_walk_visits_every_row_once(tmp_path):
+    """相同 receive_time 的记录也不会在翻页时重复或遗漏"""
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    with db.transaction(path) as conn:
+        conn.executemany("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time) "
+                         "VALUES ('dev-001', '', '', '', ?)", [(f"2025-01-01T00:00:{i // 7:02d}",) for i in range(95)])
+
+    seen = []
+    with db.connection(path) as conn:
+        rows = conn.execute(FIRST_PAGE_QUERY, (11,)).fetchall()
+        while True:
+            rows, next_cursor = page_result(rows, 10, key=lambda row: (row[1], row[0]))
+            seen.extend(row[0] for row in rows)
+            if not next_cursor:
+                break
+            rows = conn.execute(CURSOR_QUERY, decode_cursor(next_cursor, 2) + [11]).fetchall()
+    assert sorted(seen) == list(range(1, 96))
+    assert len(seen) == len(set(seen))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理工作进程池测试
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.process_pool import InferencePool, WorkerError
+
+
+def test_batches_run_in_workers():
+    pool = InferencePool(list, workers=2, threads_per_worker=1, health_interval=60)
+    pool.start()
+    try:
+        assert pool.process_batch(['a.jpg', 'b.jpg']) == ['a.jpg', 'b.jpg']
+        # handler 抛出的异常作为 RuntimeError 返回，进程继续运行
+        with pytest.raises(RuntimeError):
+            pool.process_batch(None)
+        assert pool.check_health() == 0
+        stats = pool.stats()['workers']
+        assert all(w['alive'] for w in stats) and sum(w['calls'] for w in stats) == 2
+    finally:
+        pool.stop()
+
+
+def test_crashed_worker_restarted():
+    """工作进程在执行中退出时抛出 WorkerError 并重启该进程"""
+    pool = InferencePool(sys.exit, workers=1, threads_per_worker=1, health_interval=60)
+    pool.start()
+    try:
+        with pytest.raises(WorkerError):
+            pool.process_batch([3])
+        worker = pool.stats()['workers'][0]
+        assert worker['restarts'] == 1 and worker['alive']
+    finally:
+        pool.stop()
+
+
+def test_restart_not_duplicated_by_health_check():
+    """执行中崩溃的进程只由 process_batch 重启一次，同时运行的健康检查不会再重启"""
+    pool = InferencePool(sys.exit, workers=1, threads_per_worker=1, health_interval=60)
+    pool.start()
+    stopping = threading.Event()
+
+    def health_loop():
+        while not stopping.is_set():
+            pool.check_health()
+
+    checker = threading.Thread(target=health_loop)
+    checker.start()
+    try:
+        with pytest.raises(WorkerError):
+            pool.process_batch([3])
+        stopping.set()
+        checker.join()
+        worker = pool.stats()['workers'][0]
+        assert worker['restarts'] == 1 and worker['alive']
+    finally:
+        stopping.set()
+        pool.stop()
+
+
+def test_visual_service_import_has_no_side_effects(tmp_path, monkeypatch):
+    """spawn 的工作进程会重新导入视觉服务主模块，导入时不能创建进程池或打开结果缓存数据库"""
+    pytest.importorskip('flask')
+    import importlib
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(sys.modules, 'src.services.visual_service', raising=False)
+    visual_service = importlib.import_module('src.services.visual_service')
+    assert visual_service.pool is None and visual_service.outbox is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点查询执行计划回归测试
+对迁移后的空库执行 EXPLAIN QUERY PLAN，确保每个热点查询都走索引，
+不出现全表扫描或为 ORDER BY 建临时 B 树。
+查询语句直接取自各模块的常量和构造函数，新增热点查询时把它加入 HOT_QUERIES。
+"""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import analysis_queue, catch_stats, db, log_store, migrations, queries, retention, visual_results
+from src.common.retention import RetentionEngine
+
+# 清理范围：默认策略（排除有单独策略的设备）和设备策略各一个
+RETENTION = RetentionEngine(policies={'device_logs': 30, 'catch_rollup_hourly': 365},
+                            device_policies={'dev-001': {table: 30 for table in retention.TABLES}})
+LOG_FILTERS = log_store.build_filters(None, device_id='dev-001')
+ADMIN_LOG_FILTERS = log_store.build_filters(None, all_devices=True)
+
+# (说明, SQL, 参数[, 允许全表扫描的表])；SQL 直接取自各模块，与实际执行的语句一致
+HOT_QUERIES = [
+    ('最新传感器数据（管理员）', queries.SENSOR_DATA_LATEST, ()),
+    ('最新传感器数据（设备用户）', queries.SENSOR_DATA_LATEST_DEVICE, ('dev-001',)),
+    ('设备列表及最新图片', queries.DEVICES_WITH_LATEST_IMAGE, (), {'d'}),  # 本来就要列出全部设备
+    ('设备列表及最新图片（设备用户）', queries.DEVICES_WITH_LATEST_IMAGE + queries.DEVICE_FILTER, ('dev-001',)),
+    ('图片列表（管理员）', queries.IMAGES_PAGE, (10, 0)),
+    ('图片列表（设备用户）', queries.IMAGES_PAGE_DEVICE, ('dev-001', 10, 0)),
+    ('图片列表游标首页（管理员）', queries.images_after(), (11,)),
+    ('图片列表游标翻页（管理员）', queries.images_after(after=True), ('2025-01-01', 100, 11)),
+    ('图片列表游标翻页（设备用户）', queries.images_after(device=True, after=True), ('dev-001', '2025-01-01', 100, 11)),
+    ('图片总数（设备用户）', queries.IMAGES_COUNT_DEVICE, ('dev-001',)),
+    ('图片近似总数（管理员）', queries.IMAGES_ID_SPAN, ()),
+    ('删除设备的图片', queries.DELETE_DEVICE_IMAGES, ('dev-001',)),
+    ('删除设备用户', queries.DELETE_DEVICE_USERS, ('dev-001',)),
+    ('图片访问权限检查', queries.IMAGE_OWNER, ('dev-001_a.jpg',)),
+    ('视觉识别结果', queries.VISUAL_RESULT_LATEST, (1,)),
+    ('标注图的识别结果', queries.ANNOTATION_SOURCE, (1,)),
+    ('设备日志（设备用户）', *log_store.page_sql(LOG_FILTERS, 20, 0)),
+    ('设备日志游标翻页（设备用户）', *log_store.after_sql(LOG_FILTERS, 20, ('2025-01-01', 100))),
+    ('设备日志总数（设备用户）', *log_store.count_sql(LOG_FILTERS)),
+    ('设备日志游标首页（管理员）', *log_store.after_sql(ADMIN_LOG_FILTERS, 20)),
+    ('取分析任务', analysis_queue.CLAIM_SQL, (0, 16)),
+    ('未完成的分析任务（去重）', analysis_queue.ACTIVE_TASK_SQL, (1,)),
+    ('分析任务完成', analysis_queue.COMPLETE_SQL, (1,)),
+    ('写入后取识别结果ID', visual_results.RESULT_ID_SQL, (1, 'abc-torch')),
+    ('替换识别目标明细', visual_results.DELETE_DETECTIONS_SQL, (1,)),
+    ('替换识别目标计数', visual_results.DELETE_COUNTS_SQL, (1,)),
+    ('回填识别目标明细', visual_results.BACKFILL_SQL, (0, 1000)),
+    ('图片当前计入统计的数量', catch_stats.IMAGE_COUNTS_SQL, (1,)),
+]
+for _table in retention.TABLES:
+    for _condition, _params, _cutoff in RETENTION.scopes(_table):
+        _scope = '设备策略' if _condition == ' AND device_id = ?' else '默认策略'
+        if _table == 'images':
+            HOT_QUERIES.append((f"过期图片（{_scope}）", retention.expired_images_sql(_condition),
+                                [_cutoff] + _params + [500]))
+        else:
+            HOT_QUERIES.append((f"过期 {_table} 分批清理（{_scope}）", retention.purge_rows_sql(_table, _condition),
+                                [_cutoff] + _params + [500]))
+for _table in retention.IMAGE_CHILD_TABLES + ('images',):
+    HOT_QUERIES.append((f"删除过期图片的 {_table}", retention.delete_by_image_sql(_table, 2), (1, 2)))
+HOT_QUERIES.append(('过期图片文件是否仍被引用', retention.UNREFERENCED_PATH_SQL, ('/data/images/a.jpg',)))
+
+# 全表扫描："SCAN sensor_data" / "SCAN TABLE sensor_data"（旧版本 SQLite），带 USING INDEX 的不算
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    with db.connection(path) as conn:
+        yield conn
+
+
+@pytest.mark.parametrize('query', HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(conn, query):
+    name, sql, params = query[:3]
+    allowed_scans = query[3] if len(query) > 3 else set()
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    for detail in plan:
+        scan = FULL_SCAN.match(detail)
+        assert not scan or detail.split()[-1] in allowed_scans, f"{name} 全表扫描: {plan}"
+        assert 'USE TEMP B-TREE' not in detail, f"{name} 排序未走索引: {plan}"
+
+
+def test_migrate_idempotent(tmp_path):
+    """重复迁移不报错，版本号为最新"""
+    path = str(tmp_path / 'iot.db')
+    assert migrations.migrate(path, verbose=False) == migrations.SCHEMA_VERSION
+    assert migrations.migrate(path, verbose=False) == migrations.SCHEMA_VERSION
+    with db.connection(path) as conn:
+        rows = conn.execute("SELECT version FROM schema_migrations ORDER BY version").fetchall()
+    assert [r[0] for r in rows] == [m[0] for m in migrations.MIGRATIONS]
+
+
+def test_images_filename_backfilled(tmp_path):
+    """v3 迁移为已有图片记录回填 filename"""
+    path = str(tmp_path / 'iot.db')
+    with db.transaction(path) as conn:
+        migrations.current_version(conn)
+        for version, name, steps in migrations.MIGRATIONS[:2]:
+            for sql in steps:
+                conn.execute(sql)
+            conn.execute("INSERT INTO schema_migrations VALUES (?, ?, '')", (version, name))
+        conn.execute("INSERT INTO images (device_id, image_path, original_filename) VALUES (?, ?, ?)",
+                     ('dev-001', '/data/images/dev-001_a.jpg', 'a.jpg'))
+    migrations.migrate(path, verbose=False)
+    with db.connection(path) as conn:
+        assert conn.execute("SELECT filename FROM images").fetchone()[0] == 'dev-001_a.jpg'
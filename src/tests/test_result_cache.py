@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果缓存测试
+"""
+
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common.result_cache import ResultCache, file_sha256
+
+RESULT = {'objects': [], 'total_count': 0, 'species_count': {}, 'gender_count': {}, 'analyze_time': 120}
+
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / 'a.jpg'
+    path.write_bytes(b'x' * 3000)
+    assert file_sha256(str(path), chunk_size=1024) == hashlib.sha256(b'x' * 3000).hexdigest()
+
+
+def test_hit_miss_and_model_version(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResultCache(path, model_version='v1')
+    assert cache.get('abc') is None
+    cache.put('abc', RESULT)
+    assert cache.get('abc') == RESULT
+    assert cache.stats()['hit_rate'] == 0.5 and cache.stats()['saved_ms'] == 120
+
+    # 换模型后旧结果不再命中
+    assert ResultCache(path, model_version='v2').get('abc') is None
+
+
+def test_prune_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.db'), model_version='v1', max_entries=2, prune_every=1)
+    cache.put('a', RESULT)
+    cache.put('b', RESULT)
+    cache.get('a')
+    cache.put('c', RESULT)
+    assert cache.get('b') is None
+    assert cache.get('a') == RESULT and cache.get('c') == RESULT
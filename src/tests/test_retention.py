@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据保留清理测试：分批删除、设备策略、图片文件、标注图缓存与关联记录一起删除
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import analysis_queue, catch_stats, db, image_store, migrations, visual_results
+from src.common.annotated_images import FileCache
+from src.common.derivatives import DerivativeStore
+from src.common.retention import RetentionEngine
+
+NOW = datetime(2025, 6, 10, 12, 0)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    yield path
+    db.close_all()
+
+
+def add_image(path, root, device_id, receive_time):
+    key = image_store.shard_key(device_id, f"{device_id}_a.jpg", datetime.fromisoformat(receive_time))
+    image_path = os.path.join(root, *key.split('/'))
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    with open(image_path, 'wb') as f:
+        f.write(b'x' * 100)
+    with db.transaction(path) as conn:
+        image_id = conn.execute("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time) "
+                                "VALUES (?, ?, ?, 'a.jpg', ?)", (device_id, image_path, key, receive_time)).lastrowid
+        analysis_queue.enqueue(conn, image_id, image_path)
+        visual_results.store(conn, [{'image_id': image_id, 'status': 'success', 'model_version': 'v1',
+                                     'result': {'objects': [{'class': 'mosquito', 'bbox': [1, 2, 3, 4]}]}}])
+    return key, image_path
+
+
+def test_sensor_data_batches_and_device_policy(path):
+    with db.transaction(path) as conn:
+        conn.executemany("INSERT INTO sensor_data (device_id, timestamp) VALUES (?, ?)",
+                         [('dev-001', '2025-06-01 08:00:00')] * 7 + [('dev-002', '2025-06-01 08:00:00')] * 3 +
+                         [('dev-001', '2025-06-09 08:00:00')])
+
+    engine = RetentionEngine(path, policies={'sensor_data': 7}, device_policies={'dev-002': {'sensor_data': 30}},
+                             batch_size=2, batch_pause=0)
+    assert engine.run_once(NOW)['sensor_data'] == {'rows': 7, 'bytes': 0}
+    with db.connection(path) as conn:
+        assert conn.execute("SELECT device_id, COUNT(*) FROM sensor_data GROUP BY device_id").fetchall() == \
+            [('dev-001', 1), ('dev-002', 3)]
+    assert engine.stats()['reclaimed']['sensor_data']['rows'] == 7
+
+
+def test_images_removed_with_files_and_rows(path, tmp_path):
+    root = str(tmp_path / 'images')
+    derivatives = DerivativeStore(str(tmp_path / 'derivatives'))
+    old_key, old_path = add_image(path, root, 'dev-001', '2025-06-01T08:00:00')
+    new_key, new_path = add_image(path, root, 'dev-001', '2025-06-09T08:00:00')
+    thumb = os.path.join(derivatives.root, 'thumb', *old_key.split('/')) + '.jpg'
+    os.makedirs(os.path.dirname(thumb))
+    with open(thumb, 'wb') as f:
+        f.write(b'y' * 10)
+
+    annotated = FileCache(str(tmp_path / 'annotated'), max_bytes=1024)
+    with db.connection(path) as conn:
+        (old_id,), (new_id,) = conn.execute("SELECT id FROM images ORDER BY receive_time").fetchall()
+    annotated.put(f"{old_id}-1.jpg", b'z' * 5)
+    annotated.put(f"{new_id}-2.jpg", b'z' * 5)
+
+    engine = RetentionEngine(path, root, derivatives, batch_size=1, batch_pause=0, annotated=annotated)
+    assert engine.run_once(NOW)['images'] == {'rows': 1, 'bytes': 115}
+    assert not os.path.exists(old_path) and os.path.exists(new_path)
+    # 标注图缓存一并删除
+    assert os.listdir(annotated.directory) == [f"{new_id}-2.jpg"]
+    # 变空的日期目录一并删除
+    assert not os.path.exists(os.path.dirname(old_path)) and not os.path.exists(os.path.dirname(thumb))
+    with db.connection(path) as conn:
+        for table in ('images', 'visual_recognition_results', 'detections', 'detection_counts', 'analysis_tasks'):
+            column = 'id' if table == 'images' else 'image_id'
+            assert conn.execute(f"SELECT COUNT(DISTINCT {column}) FROM {table}").fetchone()[0] == 1, table
+        # 捕获统计汇总默认保留
+        assert conn.execute("SELECT SUM(count) FROM catch_rollup_hourly").fetchone()[0] == 2
+
+
+def test_rebuild_after_retention_keeps_old_rollup(path, tmp_path):
+    root = str(tmp_path / 'images')
+    add_image(path, root, 'dev-001', '2025-06-01T08:00:00')
+    add_image(path, root, 'dev-001', '2025-06-09T08:00:00')
+    RetentionEngine(path, root, batch_pause=0).run_once(NOW)
+
+    # 重建只覆盖仍保留图片的小时，已清理图片的汇总行不被删除
+    assert catch_stats.rebuild(path) == 1
+    with db.connection(path) as conn:
+        assert conn.execute("SELECT hour, SUM(count) FROM catch_rollup_hourly GROUP BY hour").fetchall() == \
+            [('2025-06-01 08:00', 1), ('2025-06-09 08:00', 1)]
+
+
+def test_shared_image_file_kept_while_referenced(path, tmp_path):
+    # 迁移前同名上传的多条记录指向同一文件，只有最后一条记录删除时才删除文件
+    root = str(tmp_path / 'images')
+    key, image_path = add_image(path, root, 'dev-001', '2025-06-01T08:00:00')
+    with db.transaction(path) as conn:
+        conn.execute("INSERT INTO images (device_id, image_path, filename, original_filename, receive_time) "
+                     "VALUES ('dev-001', ?, ?, 'a.jpg', '2025-06-09T08:00:00')", (image_path, key))
+
+    engine = RetentionEngine(path, root, batch_size=10, batch_pause=0)
+    assert engine.run_once(NOW)['images'] == {'rows': 1, 'bytes': 0}
+    assert os.path.exists(image_path)
+
+    later = datetime(2025, 6, 20, 12, 0)
+    assert engine.run_once(later)['images'] == {'rows': 1, 'bytes': 100}
+    assert not os.path.exists(image_path)
+
+
+def test_unknown_table_rejected(path):
+    with pytest.raises(ValueError):
+        RetentionEngine(path, device_policies={'dev-001': {'users': 1}})
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据批量写入测试
+"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import db
+from src.common.sensor_ingest import SensorIngest, build_sensor_data, build_row
+from src.tests.bench_db_pool import SENSOR_DDL
+
+
+def make_db(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    with db.transaction(path) as conn:
+        conn.execute(SENSOR_DDL)
+    return path
+
+
+def test_stop_flushes_pending_rows(tmp_path):
+    """停止时队列中的数据全部写入"""
+    path = make_db(tmp_path)
+    ingest = SensorIngest(path, batch_size=7, flush_interval=5, report_interval=0)
+    ingest.start()
+    for i in range(100):
+        data = {'temperature_inside': i}
+        assert ingest.submit(build_row(build_sensor_data('dev-001', data), data))
+    ingest.stop()
+    with db.connection(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0] == 100
+    assert ingest.stats()['inserted'] == 100
+
+
+def test_full_queue_drops_after_timeout(tmp_path):
+    """写入线程未运行且队列已满时，入队等待超时后丢弃并计数"""
+    path = make_db(tmp_path)
+    ingest = SensorIngest(path, max_queue=2, put_timeout=0.01, report_interval=0)
+    data = {}
+    row = build_row(build_sensor_data('dev-001', data), data)
+    assert ingest.submit(row)
+    assert ingest.submit(row)
+    assert not ingest.submit(row)
+    stats = ingest.stats()
+    assert stats['dropped'] == 1 and stats['blocked'] == 1
+
+
+def test_on_commit_after_rows_are_written(tmp_path):
+    """提交回调在数据落盘后调用；整批写入失败时逐条重试，只跳过有问题的行"""
+    path = make_db(tmp_path)
+    ingest = SensorIngest(path, batch_size=10, flush_interval=5, report_interval=0, retry_backoff=0)
+    committed = []
+
+    def on_commit():
+        with db.connection(path) as conn:
+            committed.append(conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0])
+
+    data = {}
+    row = build_row(build_sensor_data('dev-001', data), data)
+    ingest.start()
+    assert ingest.submit(row, on_commit=on_commit)
+    # 列数不对，这一条写不进去，同一批的其他数据仍然写入
+    assert ingest.submit(row[:-1], on_commit=lambda: committed.append('bad'))
+    ingest.stop()
+    assert committed == [1]
+    stats = ingest.stats()
+    assert stats['inserted'] == 1 and stats['failed'] == 1 and stats['retried'] == 1
+
+
+def test_transient_error_retried(tmp_path, monkeypatch):
+    """锁超时等临时错误按退避重试，整批数据不丢失"""
+    path = make_db(tmp_path)
+    ingest = SensorIngest(path, batch_size=10, flush_interval=5, report_interval=0, retry_backoff=0)
+    transaction = db.transaction
+    failures = []
+
+    def locked_once(db_path):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError('database is locked')
+        return transaction(db_path)
+
+    monkeypatch.setattr(db, 'transaction', locked_once)
+    data = {}
+    ingest.start()
+    for i in range(5):
+        assert ingest.submit(build_row(build_sensor_data('dev-001', data), data))
+    ingest.stop()
+    with db.connection(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0] == 5
+    assert ingest.stats()['retried'] == 1 and ingest.stats()['failed'] == 0
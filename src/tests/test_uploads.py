@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式上传和可续传上传测试
+"""
+
+import hashlib
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import uploads
+
+DATA = os.urandom(200 * 1024)
+
+
+def test_receive_streams_and_hashes(tmp_path):
+    target = str(tmp_path / 'a.jpg')
+    size, sha256 = uploads.receive(io.BytesIO(DATA), target, str(tmp_path), max_bytes=len(DATA), chunk_size=1000)
+    assert (size, sha256) == (len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert open(target, 'rb').read() == DATA
+
+
+def test_receive_rejects_oversized_without_leaving_files(tmp_path):
+    with pytest.raises(uploads.UploadError) as e:
+        uploads.receive(io.BytesIO(DATA), str(tmp_path / 'a.jpg'), str(tmp_path), max_bytes=len(DATA) - 1)
+    assert e.value.status == 413
+    assert os.listdir(tmp_path) == []
+
+
+def test_resumable_upload(tmp_path):
+    sessions = uploads.UploadSessions(str(tmp_path / 'incoming'), max_bytes=len(DATA))
+    upload_id = sessions.create(len(DATA), hashlib.sha256(DATA).hexdigest(), device_id='dev-001', filename='a.jpg')
+    assert sessions.append(upload_id, 0, io.BytesIO(DATA[:70000]))[0] == 70000
+
+    # 重发已收到的块（设备没收到响应）被拒绝，返回服务器当前偏移
+    with pytest.raises(uploads.UploadError) as e:
+        sessions.append(upload_id, 0, io.BytesIO(DATA[:70000]))
+    assert e.value.status == 409
+
+    # 进程重启后哈希状态丢失，从已收到的数据重新计算
+    sessions = uploads.UploadSessions(str(tmp_path / 'incoming'), max_bytes=len(DATA))
+    offset, meta = sessions.append(upload_id, 70000, io.BytesIO(DATA[70000:]))
+    assert offset == meta['size'] and meta['info'] == {'device_id': 'dev-001', 'filename': 'a.jpg'}
+
+    target = str(tmp_path / 'a.jpg')
+    assert sessions.finish(upload_id, target) == (len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert open(target, 'rb').read() == DATA
+    assert os.listdir(tmp_path / 'incoming') == []
+
+
+def test_resumable_upload_checksum_mismatch(tmp_path):
+    sessions = uploads.UploadSessions(str(tmp_path), max_bytes=len(DATA))
+    upload_id = sessions.create(3, hashlib.sha256(b'abc').hexdigest())
+    sessions.append(upload_id, 0, io.BytesIO(b'abd'))
+    with pytest.raises(uploads.UploadError) as e:
+        sessions.finish(upload_id, str(tmp_path / 'a.jpg'))
+    assert e.value.status == 422
+    with pytest.raises(uploads.UploadError):
+        sessions.append(upload_id, 0, io.BytesIO(b'abc'))
+
+
+class SlowStream:
+    """第一次读取时等待 release，模拟网络很慢的设备"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size):
+        self.reading.set()
+        assert self.release.wait(5)
+        return self.data.read(size)
+
+
+def test_append_does_not_block_other_uploads(tmp_path):
+    sessions = uploads.UploadSessions(str(tmp_path), max_bytes=len(DATA), max_age=0)
+    upload_id = sessions.create(3)
+    stream = SlowStream(b'abc')
+    result = []
+    writer = threading.Thread(target=lambda: result.append(sessions.append(upload_id, 0, stream)))
+    writer.start()
+    try:
+        assert stream.reading.wait(5)
+        # 接收数据期间可以创建其他上传，cleanup() 不删除正在写入的上传（max_age=0 时其他上传都已过期）
+        other = sessions.create(3)
+        assert sessions.status(upload_id)[0] == 0
+        # 同一上传的并发写入被拒绝
+        with pytest.raises(uploads.UploadError) as e:
+            sessions.append(upload_id, 0, io.BytesIO(b'abc'))
+        assert e.value.status == 409
+    finally:
+        stream.release.set()
+        writer.join()
+    assert result[0][0] == 3
+    assert sessions.finish(upload_id, str(tmp_path / 'a.jpg')) == (3, hashlib.sha256(b'abc').hexdigest())
+    assert sessions.status(other)[0] == 0
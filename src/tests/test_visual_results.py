@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果入库测试：按 (image_id, model_version) 去重，并更新分析任务状态
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.common import analysis_queue, db, migrations, visual_results
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'iot.db')
+    migrations.migrate(path, verbose=False)
+    return path
+
+
+def success(image_id, total=1, model_version='abc-torch'):
+    return {'image_id': image_id, 'status': 'success', 'model_version': model_version, 'cached': False,
+            'result': {'total_count': total, 'analyze_time': 30, 'species_count': {'白纹伊蚊': total},
+                       'gender_count': {'雌性': total}, 'objects': []}}
+
+
+def store(path, results):
+    with db.transaction(path) as conn:
+        return visual_results.store(conn, results)
+
+
+def rows(path):
+    with db.connection(path) as conn:
+        return conn.execute("SELECT image_id, status, model_version, total_count FROM visual_recognition_results "
+                            "ORDER BY image_id, id").fetchall()
+
+
+def test_batch_is_idempotent(db_path):
+    batch = [success(1), success(2)]
+    assert len(store(db_path, batch)) == 2
+    # 视觉服务没收到响应而重发整批
+    assert store(db_path, batch) == []
+    assert rows(db_path) == [(1, 'success', 'abc-torch', 1), (2, 'success', 'abc-torch', 1)]
+
+
+def test_failure_is_replaced_by_later_success(db_path):
+    store(db_path, [{'image_id': 1, 'status': 'failed', 'model_version': 'abc-torch', 'error': 'timeout'}])
+    store(db_path, [success(1, total=3)])
+    # 成功结果不会被之后重复的失败回调覆盖
+    store(db_path, [{'image_id': 1, 'status': 'failed', 'model_version': 'abc-torch', 'error': 'timeout'}])
+    assert rows(db_path) == [(1, 'success', 'abc-torch', 3)]
+
+
+def test_new_model_version_adds_row_and_completes_task(db_path):
+    with db.transaction(db_path) as conn:
+        analysis_queue.enqueue(conn, 1, '/data/images/1.jpg')
+    analysis_queue.claim(db_path, 1)
+    store(db_path, [success(1), success(1, model_version='def-onnx'), {'status': 'success'}])
+    assert len(rows(db_path)) == 2
+    assert analysis_queue.stats(db_path)['done'] == 1
+
+
+def test_detections_and_counts(db_path):
+    data = success(1)
+    data['result']['objects'] = [
+        {'class': 'albopictus_female', 'species': '白纹伊蚊', 'gender': '雌性', 'confidence': 0.9, 'bbox': [1, 2, 3, 4]},
+        {'class': 'albopictus_female', 'species': '白纹伊蚊', 'gender': '雌性', 'confidence': 0.8, 'bbox': [5, 6, 7, 8]},
+        {'class': 'culex_male', 'species': '库蚊', 'gender': '雄性', 'confidence': 0.7, 'bbox': [0, 0, 1, 1]},
+    ]
+    store(db_path, [data])
+    with db.connection(db_path) as conn:
+        assert conn.execute("SELECT species, gender, count FROM detection_counts ORDER BY count DESC").fetchall() == \
+            [('白纹伊蚊', '雌性', 2), ('库蚊', '雄性', 1)]
+        assert conn.execute("SELECT x, y, w, h FROM detections WHERE confidence = 0.7").fetchone() == (0, 0, 1, 1)
+
+
+def test_backfill_legacy_rows(db_path):
+    objects = '[{"species": "库蚊", "gender": "雌性", "confidence": 0.5, "bbox": [1, 1, 2, 2]}]'
+    with db.transaction(db_path) as conn:
+        conn.executemany("INSERT INTO visual_recognition_results (image_id, status, objects) VALUES (?, 'success', ?)",
+                         [(1, objects), (2, objects), (3, 'not json')])
+    assert visual_results.backfill(db_path, chunk_size=2) == 3
+    # 已处理的结果不会重复回填
+    assert visual_results.backfill(db_path) == 0
+    with db.connection(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*), SUM(count) FROM detection_counts").fetchone() == (2, 2)